@@ -5,6 +5,16 @@ from scipy._lib._util import check_random_state
 import numpy as np
 
 
+# incremented whenever a Bounds object is modified, or a Parameter is given new
+# bounds. Used to decide whether a `_Prior` is out of date.
+_BOUNDSCOUNT = 0
+
+
+def _modified():
+    global _BOUNDSCOUNT
+    _BOUNDSCOUNT += 1
+
+
 class Bounds(object):
     """
     A base class that describes the probability distribution for a parameter
@@ -14,6 +24,10 @@ class Bounds(object):
     def __init__(self):
         pass
 
+    def __setattr__(self, name, value):
+        _modified()
+        object.__setattr__(self, name, value)
+
     def logp(self, value):
         """
         Calculate the log-prior probability of a value with the probability
@@ -418,3 +432,155 @@ class Interval(Bounds):
             return scale * q + loc
         else:
             raise RuntimeError("Can only calculate invcdf with closed bounds")
+
+
+class _Prior(object):
+    """
+    Vectorised log-prior probability and prior transform for a set of
+    parameters.
+
+    Parameters
+    ----------
+    bounds : sequence of {Bounds, None}
+        The bounds of each parameter.
+
+    Notes
+    -----
+    Closed :class:`Interval` are evaluated together, as are :class:`PDF` that
+    use frozen distributions from the same `rv_continuous` family. Any other
+    bounds are evaluated one at a time.
+    """
+
+    def __init__(self, bounds):
+        self.nparams = len(bounds)
+
+        # closed intervals
+        intervals = [
+            (i, b)
+            for i, b in enumerate(bounds)
+            if isinstance(b, Interval) and b._closed_bounds
+        ]
+        self._interval_idx = np.array([i for i, b in intervals], dtype=int)
+        self._lb = np.array([b.lb for i, b in intervals], dtype=float)
+        self._ub = np.array([b.ub for i, b in intervals], dtype=float)
+        self._interval_logprob = math.fsum(b._logprob for i, b in intervals)
+
+        # frozen distributions from the same family.
+        # {key: (dist, [i, ...], [(shapes, loc, scale), ...])}
+        families = {}
+        self._other = []
+        for i, b in enumerate(bounds):
+            if b is None or (isinstance(b, Interval) and b._closed_bounds):
+                continue
+            key = None
+            if isinstance(b, PDF):
+                key, params = _family(b.rv)
+            if key is None:
+                self._other.append((i, b))
+                continue
+            family = families.setdefault(key, (b.rv.dist, [], []))
+            family[1].append(i)
+            family[2].append(params)
+
+        self._families = []
+        for dist, idx, params in families.values():
+            shapes = np.array([p[0] for p in params], dtype=float)
+            self._families.append(
+                (
+                    dist,
+                    np.array(idx, dtype=int),
+                    tuple(shapes.T.reshape(-1, len(idx))),
+                    np.array([p[1] for p in params], dtype=float),
+                    np.array([p[2] for p in params], dtype=float),
+                )
+            )
+
+    def logp(self, x):
+        """
+        Calculate the log-prior probability.
+
+        Parameters
+        ----------
+        x : array-like
+            Parameter values, has shape `(..., N)`, where N is the number of
+            parameters.
+
+        Returns
+        -------
+        logp : float or np.ndarray
+            The summed log-prior probability of each parameter vector, has
+            shape `x.shape[:-1]`.
+        """
+        x = np.asarray(x, dtype=float)
+        logp = np.zeros(x.shape[:-1])
+
+        if self._interval_idx.size:
+            v = x[..., self._interval_idx]
+            valid = np.logical_and(self._lb <= v, v <= self._ub).all(axis=-1)
+            logp += np.where(valid, self._interval_logprob, -np.inf)
+
+        for dist, idx, shapes, loc, scale in self._families:
+            logp += np.sum(
+                dist.logpdf(x[..., idx], *shapes, loc=loc, scale=scale),
+                axis=-1,
+            )
+
+        for i, b in self._other:
+            logp += b.logp(x[..., i])
+
+        if x.ndim == 1:
+            return float(logp)
+        return logp
+
+    def invcdf(self, q):
+        """
+        Transform lower tail probabilities to parameter values, the prior
+        transform.
+
+        Parameters
+        ----------
+        q : array-like
+            Lower tail probabilities, has shape `(..., N)`, where N is the
+            number of parameters.
+
+        Returns
+        -------
+        x : np.ndarray
+            Quantiles corresponding to `q`.
+        """
+        q = np.asarray(q, dtype=float)
+        x = np.empty_like(q)
+
+        if self._interval_idx.size:
+            x[..., self._interval_idx] = (self._ub - self._lb) * q[
+                ..., self._interval_idx
+            ] + self._lb
+
+        for dist, idx, shapes, loc, scale in self._families:
+            x[..., idx] = dist.ppf(q[..., idx], *shapes, loc=loc, scale=scale)
+
+        for i, b in self._other:
+            x[..., i] = b.invcdf(q[..., i])
+
+        return x
+
+
+def _family(rv):
+    # Identifies the family of a frozen distribution, and its standardised
+    # shape, loc and scale parameters. Distributions with the same key can be
+    # evaluated in a single vectorised call.
+    if not isinstance(rv, rv_frozen) or not isinstance(rv.dist, rv_continuous):
+        return None, None
+    try:
+        dist = rv.dist
+        shapes, loc, scale = dist._parse_args(*rv.args, **rv.kwds)
+        shapes = tuple(float(s) for s in shapes)
+        key = (
+            type(dist),
+            len(shapes),
+            tuple(sorted(dist._updated_ctor_param().items())),
+        )
+        hash(key)
+        return key, (shapes, float(loc), float(scale))
+    except (AttributeError, TypeError, ValueError):
+        return None, None
@@ -11,6 +11,7 @@ from scipy.optimize import minimize, differential_evolution, least_squares
 import scipy.optimize as sciopt
 
 from refnx.analysis import Objective, Interval, PDF, is_parameter
+from refnx.analysis.parameter import _vectorised
 from refnx._lib import (
     unique as f_unique,
     MapWrapper,
@@ -30,7 +31,9 @@ MCMCResult = namedtuple(
 
 
 class PTSampler(object):
-    def __init__(self, ntemps, nwalkers, ndim, logl, logp, **kwargs):
+    def __init__(
+        self, ntemps, nwalkers, ndim, logl, logp, vectorize=False, **kwargs
+    ):
         """
         Shim class for a ptemcee.PTSampler.
 
@@ -47,6 +50,10 @@ class PTSampler(object):
             log-likelihood function
         logp: callable
             log-prior function
+        vectorize: bool
+            If `True`, then `logl` and `logp` are called with a 2D array of
+            walker positions, returning an array of values for each of the
+            walkers.
         kwargs:
             Other keyword arguments supplied to construct the ptemcee.Sampler.
         """
@@ -57,6 +64,7 @@ class PTSampler(object):
         self.ndim = ndim
         self.logl = logl
         self.logp = logp
+        self.vectorize = vectorize
         self.kwargs = kwargs
 
         sig = {
@@ -67,6 +75,10 @@ class PTSampler(object):
             "logp": logp,
         }
         sig.update(kwargs)
+        if vectorize:
+            # the ensemble evaluates all its walkers with a single call to
+            # its mapper.
+            sig["mapper"] = _VectorizedMapper(logl, logp)
         self.sampler = _PTSampler(**sig)
 
         # chain stepper
@@ -96,7 +108,7 @@ class PTSampler(object):
         progress: bool
             Display a progress bar.
         mapper: map-like callable
-            For parallelisation
+            For parallelisation. Ignored if the sampler is vectorised.
         kwds: dict
             Unknown keywords
 
@@ -122,7 +134,7 @@ class PTSampler(object):
 
         self._ptchain.thin_by = thin_by
 
-        if mapper is not None:
+        if mapper is not None and not self.vectorize:
             self._ptchain.ensemble._mapper = mapper
 
         try:
@@ -132,7 +144,7 @@ class PTSampler(object):
                     yield self._state
                     pbar.update(thin_by)
         finally:
-            self._ptchain.ensemble._mapper = map
+            self._ptchain.ensemble._mapper = self.sampler._mapper
 
     def thermodynamic_integration_log_evidence(self, fburnin=0.1):
         if self._ptchain is not None:
@@ -170,6 +182,44 @@ class PTSampler(object):
             self._ptchain.ensemble._random.set_state(rstate0)
 
 
+class _VectorizedMapper(object):
+    """
+    map-like callable for a ptemcee ensemble that evaluates the log-likelihood
+    and log-prior of all the walker positions at once.
+
+    Parameters
+    ----------
+    logl: callable
+        Vectorised log-likelihood function, `logl(x) -> np.ndarray`, where
+        `x` is a 2D array of walker positions.
+    logp: callable
+        Vectorised log-prior function, `logp(x) -> np.ndarray`.
+    """
+
+    def __init__(self, logl, logp):
+        self.logl = logl
+        self.logp = logp
+
+    def __call__(self, evaluator, values):
+        # `evaluator` is the ensemble's (per walker) LikePriorEvaluator, it's
+        # replaced by vectorised calls here.
+        values = np.asarray(values)
+        logp = np.asarray(self.logp(values), dtype=float)
+        if np.isnan(logp).any():
+            raise ValueError("Prior function returned NaN.")
+
+        # like LikePriorEvaluator, the log-likelihood is only calculated
+        # within the prior support
+        logl = np.zeros_like(logp)
+        finite = logp != -np.inf
+        if finite.any():
+            logl[finite] = self.logl(values[finite])
+        if np.isnan(logl).any():
+            raise ValueError("Log likelihood function returned NaN.")
+
+        return zip(logl, logp)
+
+
 class CurveFitter(object):
     """
     Analyse a curvefitting system (with MCMC sampling)
@@ -190,7 +240,12 @@ class CurveFitter(object):
         `None`, in which case the `Tmax` keyword argument sets the maximum
         temperature. Parallel Tempering is useful if you expect your
         posterior distribution to be multi-modal.
-
+    vectorize : bool, optional
+        If `True` then the sampler evaluates all the walkers of an ensemble
+        with a single call to the objective's vectorised methods
+        (`logpost_batch`, `logl_batch` and `logp_batch`). This is useful if
+        the model can calculate many parameter sets at once, e.g.
+        :class:`refnx.reflect.ReflectModel`.
     mcmc_kws : dict
         Keywords used to create the :class:`emcee.EnsembleSampler` or
         :class:`ptemcee.sampler.Sampler` objects.
@@ -204,7 +259,9 @@ class CurveFitter(object):
     `pool` argument in the `sample` method.
     """
 
-    def __init__(self, objective, nwalkers=200, ntemps=-1, **mcmc_kws):
+    def __init__(
+        self, objective, nwalkers=200, ntemps=-1, vectorize=False, **mcmc_kws
+    ):
         """
         Parameters
         ----------
@@ -222,6 +279,11 @@ class CurveFitter(object):
             temperatures. Can be `None`, in which case the `Tmax` keyword
             argument sets the maximum temperature. Parallel Tempering is
             useful if you expect your posterior distribution to be multi-modal.
+        vectorize : bool, optional
+            If `True` then the sampler evaluates all the walkers of an
+            ensemble with a single call to the objective's vectorised methods
+            (`logpost_batch`, `logl_batch` and `logp_batch`). The `pool`
+            argument of the `sample` method is then ignored.
         mcmc_kws : dict
             Keywords used to create the :class:`emcee.EnsembleSampler` or
             :class:`ptemcee.sampler.PTSampler` objects.
@@ -250,10 +312,12 @@ class CurveFitter(object):
 
         self._nwalkers = nwalkers
         self._ntemps = ntemps
+        self._vectorize = vectorize
         self.make_sampler()
         self._state = None
 
     def __setstate__(self, state):
+        state.setdefault("_vectorize", False)
         self.__dict__.update(state)
         self.__var_id = [
             id(obj) for obj in self.objective.varying_parameters()
@@ -271,12 +335,14 @@ class CurveFitter(object):
             "objective": self.objective,
             "_nwalkers": self._nwalkers,
             "_ntemps": self._ntemps,
+            "_vectorize": self._vectorize,
             "mcmc_kws": self.mcmc_kws,
         }
         return (
             "CurveFitter({objective!r},"
             " nwalkers={_nwalkers},"
             " ntemps={_ntemps},"
+            " vectorize={_vectorize},"
             " {mcmc_kws!r})".format(**d)
         )
 
@@ -293,10 +359,15 @@ class CurveFitter(object):
             raise ValueError("No parameters are being fitted")
 
         if self._ntemps == -1:
+            logpost = self.objective.logpost
+            if self._vectorize:
+                logpost = self.objective.logpost_batch
+
             self.sampler = emcee.EnsembleSampler(
                 self._nwalkers,
                 self.nvary,
-                self.objective.logpost,
+                logpost,
+                vectorize=self._vectorize,
                 **self.mcmc_kws
             )
         # Parallel Tempering was requested.
@@ -308,6 +379,10 @@ class CurveFitter(object):
                 "logl": self.objective.logl,
                 "logp": self.objective.logp,
             }
+            if self._vectorize:
+                sig["logl"] = self.objective.logl_batch
+                sig["logp"] = self.objective.logp_batch
+                sig["vectorize"] = True
             sig.update(self.mcmc_kws)
             self.sampler = PTSampler(**sig)
 
@@ -584,7 +659,8 @@ class CurveFitter(object):
             use for parallelization. If `pool == -1`, then all CPU's are used.
             If pool is a map-like callable that follows the same calling
             sequence as the built-in map function, then this pool is used for
-            parallelisation.
+            parallelisation. Ignored if the `CurveFitter` was created with
+            `vectorize=True`.
 
         Notes
         -----
@@ -644,6 +720,11 @@ class CurveFitter(object):
             self._state.random_state = rstate0
             self.sampler.random_state = rstate0
 
+        # a vectorised sampler evaluates all the walkers in one call, so
+        # there's no point starting a pool.
+        if self._vectorize:
+            pool = 1
+
         # using context manager means we kill off zombie pool objects
         # but does mean that the pool has to be specified each time.
         with MapWrapper(pool) as g, possibly_open_file(f, "a") as h:
@@ -736,6 +817,9 @@ class CurveFitter(object):
         If the `objective` supplies a `residuals` method then `least_squares`
         can be used. Otherwise the `nll` method of the `objective` is
         minimised. Use this method just before a sampling run.
+        If the model(s) of the `objective` can calculate their derivatives
+        (e.g. :class:`refnx.reflect.ReflectModel`) then `least_squares` uses
+        the analytic Jacobian of the residuals.
         If `self.objective.parameters` is a `Parameters` instance, then each
         of the varying parameters has its value updated by the fit, and each
         `Parameter` has a `stderr` attribute which represents the uncertainty
@@ -779,6 +863,16 @@ class CurveFitter(object):
             # least_squares doesn't have a callback
             _min_kws.pop("callback", None)
 
+            # use analytic derivatives if all the models can supply them
+            objectives = getattr(
+                self.objective, "objectives", [self.objective]
+            )
+            if all(
+                hasattr(getattr(o, "model", None), "jacobian")
+                for o in objectives
+            ):
+                _min_kws.setdefault("jac", self.objective.residuals_jacobian)
+
             res = least_squares(
                 self.objective.residuals, init_pars, **_min_kws
             )
@@ -980,20 +1074,15 @@ def process_chain(objective, chain, nburn=0, nthin=1, flatchain=False):
             param for param in flat_params if param.constraint is not None
         ]
 
+        # evaluate each constraint for the entire chain at once, the
+        # constraints are compiled into functions of the varying parameters
         for constrain_param in constrained_params:
-            constrain_param.chain = np.empty(chain.shape[:-1], float)
+            f, _ = _vectorised(constrain_param, varying_parameters)
+            constrain_param.chain = np.broadcast_to(
+                f(chain), chain.shape[:-1]
+            ).astype(float)
 
-        # now iterate through the varying parameters, set the values, thereby
-        # setting the constraint value
         if len(constrained_params):
-            for index in np.ndindex(chain.shape[:-1]):
-                # iterate over parameter vectors
-                pvals = chain[index]
-                objective.setp(pvals)
-
-                for constrain_param in constrained_params:
-                    constrain_param.chain[index] = constrain_param.value
-
             for constrain_param in constrained_params:
                 quantiles = np.percentile(
                     constrain_param.chain, [15.87, 50, 84.13]
@@ -4,8 +4,7 @@ from scipy.optimize._numdiff import approx_derivative
 import scipy.stats as stats
 
 from refnx.util import ErrorProp as EP
-from refnx._lib import flatten, approx_hess2
-from refnx._lib import unique as f_unique
+from refnx._lib import approx_hess2
 from refnx.dataset import Data1D
 from refnx.analysis import (
     is_parameter,
@@ -16,6 +15,7 @@ from refnx.analysis import (
     Interval,
     PDF,
 )
+from refnx.analysis.parameter import _vectorised, _interned, _index
 
 
 class BaseObjective(object):
@@ -141,6 +141,69 @@ class BaseObjective(object):
         logpost += self.logl(vals)
         return logpost
 
+    def logp_batch(self, pvals):
+        """
+        Log-prior probability function for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values to be tested.
+
+        Returns
+        -------
+        logp : np.ndarray
+            log-prior probability for each row of `pvals`.
+
+        """
+        return np.array([self.logp(vals) for vals in pvals], dtype=float)
+
+    def logl_batch(self, pvals):
+        """
+        Log-likelihood probability function for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values to be tested.
+
+        Returns
+        -------
+        logl : np.ndarray
+            log-likelihood probability for each row of `pvals`.
+
+        """
+        return np.array([self.logl(vals) for vals in pvals], dtype=float)
+
+    def logpost_batch(self, pvals):
+        """
+        Log-posterior probability function for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values to be tested.
+
+        Returns
+        -------
+        logpost : np.ndarray
+            log-probability for each row of `pvals`.
+
+        Notes
+        -----
+        The log-likelihood is only calculated for those rows that have a
+        finite log-prior. This method is suitable for use with vectorised
+        samplers, e.g. `CurveFitter(objective, vectorize=True)`.
+
+        """
+        pvals = np.atleast_2d(pvals)
+        logpost = self.logp_batch(pvals)
+        finite = np.isfinite(logpost)
+        logpost[~finite] = -np.inf
+        if finite.any():
+            logpost[finite] += self.logl_batch(pvals[finite])
+        return logpost
+
     def nlpost(self, pvals=None):
         """
         Negative log-posterior function
@@ -233,6 +296,12 @@ class Objective(BaseObjective):
 
     """
 
+    # the Parameters returned by the last access of `parameters`
+    _parameters = None
+    # (key, y, y_err, {name: constant}) for the transformed data, see
+    # `_transformed_data`
+    _transformed = None
+
     def __init__(
         self,
         model,
@@ -261,6 +330,11 @@ class Objective(BaseObjective):
         if name is None:
             self.name = id(self)
 
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop("_transformed", None)
+        return d
+
     def __str__(self):
         s = ["{:_>80}".format("")]
         s.append("Objective - {0}".format(self.name))
@@ -321,28 +395,91 @@ class Objective(BaseObjective):
         # create and return a Parameters object because it has the
         # __array__ method, which allows one to quickly get numerical values.
         p = Parameters()
-        p.data = list(f_unique(p for p in flatten(self.parameters) if p.vary))
+        p.data = list(_index(self.parameters).varying())
         return p
 
-    def _data_transform(self, model=None):
+    def _transformed_data(self):
+        """
+        The transformed data.
+
+        Returns
+        -------
+        y, y_err, constants : np.ndarray, np.ndarray or float, dict
+            The transformed data and uncertainties, and a dict in which
+            callers can store constants that only depend on them.
+
+        Notes
+        -----
+        The data is constant during a fit, so the transformed data is cached.
+        The cache is keyed on the version of the data (see
+        `Data1D._version`), the transform and whether the objective is
+        weighted. The data is only cached if the transform has a `_cache_key`
+        method, returning something that changes when the transform does.
+        """
+        transform = self.transform
+        weighted = self.weighted
+
+        key = None
+        version = getattr(self.data, "_version", None)
+        if transform is None:
+            key = (version, None, None, weighted)
+        elif hasattr(transform, "_cache_key"):
+            key = (version, transform, transform._cache_key(), weighted)
+
+        cache = self._transformed
+        if (
+            cache is not None
+            and version is not None
+            and key is not None
+            and cache[0] == key
+        ):
+            return cache[1:]
+
         x = self.data.x
         y = self.data.y
 
         y_err = 1.0
-        if self.weighted:
+        if weighted:
             y_err = self.data.y_err
 
-        if self.transform is None:
-            return y, y_err, model
-        else:
-            if model is not None:
-                model, _ = self.transform(x, model)
+        if transform is not None:
+            y, y_err = transform(x, y, y_err)
+            if not weighted:
+                y_err = 1
+
+        # the arrays are shared between calls, don't let them be modified.
+        y = np.asarray(y).view()
+        y.flags.writeable = False
+        if weighted:
+            y_err = np.asarray(y_err).view()
+            y_err.flags.writeable = False
+
+        cache = (key, y, y_err, {})
+        if version is not None and key is not None:
+            self._transformed = cache
+        return cache[1:]
+
+    def _data_transform(self, model=None):
+        y, y_err, _ = self._transformed_data()
+
+        if self.transform is not None and model is not None:
+            model, _ = self.transform(self.data.x, model)
 
-            y, y_err = self.transform(x, y, y_err)
+        return y, y_err, model
+
+    def _var_y(self):
+        # `y_err**2` and `np.log(2 * pi * y_err**2)` for the transformed
+        # data, used by the log-likelihood when lnsigma is None.
+        _, y_err, constants = self._transformed_data()
+        if "var_y" not in constants:
+            var_y = y_err ** 2
+            log_var_y = None
             if self.weighted:
-                return y, y_err, model
-            else:
-                return y, 1, model
+                log_var_y = np.log(2 * np.pi * var_y)
+                var_y.flags.writeable = False
+                log_var_y.flags.writeable = False
+            constants["var_y"] = (var_y, log_var_y)
+        return constants["var_y"]
 
     def generative(self, pvals=None):
         """
@@ -393,6 +530,80 @@ class Objective(BaseObjective):
 
         return np.squeeze((y - model) / s_n)
 
+    def residuals_jacobian(self, pvals=None):
+        """
+        Calculates the Jacobian of the residuals with respect to the varying
+        parameters.
+
+        Parameters
+        ----------
+        pvals : array-like or refnx.analysis.Parameters
+            values for the varying or entire set of parameters
+
+        Returns
+        -------
+        jac : np.ndarray
+            Jacobian, has shape `(N, nvary)` where `N` is the number of
+            residuals.
+
+        Notes
+        -----
+        If the model has a `jacobian` method (e.g.
+        :class:`refnx.reflect.ReflectModel`) then the derivatives of the model
+        are calculated analytically. Otherwise (or if the model can't supply
+        the derivatives) the Jacobian is estimated by finite differences.
+        """
+        self.setp(pvals)
+        _pvals = np.array(self.varying_parameters())
+
+        jac = self._residuals_jacobian(self.varying_parameters())
+        if jac is None:
+            try:
+                jac = approx_derivative(self.residuals, _pvals)
+            finally:
+                self.setp(_pvals)
+        return jac
+
+    def _residuals_jacobian(self, parameters):
+        # analytic Jacobian of the residuals with respect to `parameters`,
+        # shape (N, len(parameters)). Returns None if the model can't supply
+        # derivatives.
+        jacobian = getattr(self.model, "jacobian", None)
+        if jacobian is None:
+            return None
+
+        x = self.data.x
+        dmodel = jacobian(x, parameters, x_err=self.data.x_err)
+        if dmodel is None:
+            return None
+        dmodel = np.reshape(dmodel, (len(parameters), -1))
+
+        model = np.ravel(self.model(x, x_err=self.data.x_err))
+        y, y_err, tmodel = self._data_transform(model)
+
+        if self.transform is not None:
+            # transforms act pointwise on the model, so their derivative
+            # is cheap to estimate with central differences.
+            step = np.finfo(np.float64).eps ** (1 / 3) * np.abs(model)
+            step[step == 0] = np.finfo(np.float64).eps ** (1 / 3)
+            tplus = self._data_transform(model + step)[2]
+            tminus = self._data_transform(model - step)[2]
+            dmodel = dmodel * (tplus - tminus) / (2 * step)
+
+        if self.lnsigma is None:
+            return np.transpose(-dmodel / y_err)
+
+        # s_n**2 = y_err**2 + exp(2 * lnsigma) * model**2
+        sigma2 = np.exp(2 * float(self.lnsigma))
+        s_n = np.sqrt(y_err * y_err + sigma2 * tmodel * tmodel)
+        residuals = (y - tmodel) / s_n
+        ds_n = sigma2 * tmodel / s_n * dmodel
+        for i, param in enumerate(parameters):
+            if param is self.lnsigma:
+                ds_n[i] += sigma2 * tmodel * tmodel / s_n
+
+        return np.transpose(-dmodel / s_n - residuals * ds_n / s_n)
+
     def chisqr(self, pvals=None):
         """
         Calculates the chi-squared value for a given fitting system.
@@ -421,9 +632,14 @@ class Objective(BaseObjective):
 
         """
         if is_parameter(self.lnsigma):
-            return self.lnsigma | self.model.parameters
+            p = self.lnsigma | self.model.parameters
         else:
-            return self.model.parameters
+            p = self.model.parameters
+
+        # reuse the previous Parameters if the contents haven't changed, its
+        # flattened parameters are cached.
+        self._parameters = _interned(p, self._parameters)
+        return self._parameters
 
     def setp(self, pvals):
         """
@@ -441,7 +657,8 @@ class Objective(BaseObjective):
         # set here rather than delegating to a Parameters
         # object, because it may not necessarily be a
         # Parameters object
-        _varying_parameters = self.varying_parameters()
+        index = _index(self.parameters)
+        _varying_parameters = index.varying()
         if len(pvals) == len(_varying_parameters):
             for idx, param in enumerate(_varying_parameters):
                 param.value = pvals[idx]
@@ -449,7 +666,7 @@ class Objective(BaseObjective):
 
         # values supplied are enough to specify all parameter values
         # even those that are repeated
-        flattened_parameters = list(flatten(self.parameters))
+        flattened_parameters = index.flat
         if len(pvals) == len(flattened_parameters):
             for idx, param in enumerate(flattened_parameters):
                 param.value = pvals[idx]
@@ -491,13 +708,8 @@ class Objective(BaseObjective):
             x *= 10.  # scale to [-10., 10.)
 
         """
-        var_pars = self.varying_parameters()
-        pvals = np.empty(len(var_pars), dtype=np.float64)
-
-        for i, var_par in enumerate(var_pars):
-            pvals[i] = var_par.bounds.invcdf(u[i])
-
-        return pvals
+        index = _index(self.parameters)
+        return index.prior().invcdf(np.asarray(u, dtype=np.float64))
 
     def logp(self, pvals=None):
         """
@@ -525,20 +737,45 @@ class Objective(BaseObjective):
         """
         self.setp(pvals)
 
-        logp = np.sum(
-            [
-                param.logp()
-                for param in f_unique(
-                    p for p in flatten(self.parameters) if p.vary
-                )
-            ]
-        )
+        index = _index(self.parameters)
+        logp = index.prior().logp(index.values())
 
         if not np.isfinite(logp):
             return -np.inf
 
         return logp
 
+    def logp_batch(self, pvals):
+        """
+        Log-prior probability function for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values to be tested.
+
+        Returns
+        -------
+        logp : np.ndarray
+            log-prior probability for each row of `pvals`.
+
+        Notes
+        -----
+        If each row contains values for the varying parameters then the
+        log-prior is calculated for all rows at once, after which the
+        parameters are set from the last row.
+        """
+        index = _index(self.parameters)
+        pvals = np.asarray(pvals, dtype=float)
+        if pvals.ndim != 2 or pvals.shape[1] != len(index.varying()):
+            return super(Objective, self).logp_batch(pvals)
+
+        logp = index.prior().logp(pvals)
+        logp[~np.isfinite(logp)] = -np.inf
+        if len(pvals):
+            self.setp(pvals[-1])
+        return logp
+
     def logl(self, pvals=None):
         """
         Calculate the log-likelhood of the system
@@ -579,22 +816,22 @@ class Objective(BaseObjective):
 
         model = self.model(self.data.x, x_err=self.data.x_err)
 
-        logl = 0.0
-
         y, y_err, model = self._data_transform(model)
 
         if self.lnsigma is not None:
             var_y = (
                 y_err * y_err + np.exp(2 * float(self.lnsigma)) * model * model
             )
-        else:
-            var_y = y_err ** 2
-
-        # TODO do something sensible if data isn't weighted
-        if self.weighted:
-            logl += np.log(2 * np.pi * var_y)
+            logl = (y - model) ** 2 / var_y
 
-        logl += (y - model) ** 2 / var_y
+            # TODO do something sensible if data isn't weighted
+            if self.weighted:
+                logl += np.log(2 * np.pi * var_y)
+        else:
+            var_y, log_var_y = self._var_y()
+            logl = (y - model) ** 2 / var_y
+            if self.weighted:
+                logl += log_var_y
 
         # nans play havoc
         if np.isnan(logl).any():
@@ -608,6 +845,116 @@ class Objective(BaseObjective):
 
         return -0.5 * np.sum(logl) + extra_potential
 
+    def logl_batch(self, pvals):
+        """
+        Calculate the log-likelihood of the system for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values for the varying or
+            entire set of parameters.
+
+        Returns
+        -------
+        logl : np.ndarray
+            log-likelihood probability for each row of `pvals`.
+
+        Notes
+        -----
+        If the model has a `model_batch` method (e.g.
+        :class:`refnx.reflect.ReflectModel`) then the model is calculated for
+        all the rows in a single call, otherwise it's calculated row by row.
+        If the rows only contain the varying parameters, there's no
+        `logp_extra`, and the model has a `compile` method, then the model is
+        calculated directly from `pvals` without setting each row. The
+        parameters are left with the values of the last row.
+
+        """
+        return self._logl_batch(pvals, self.setp, self.varying_parameters())
+
+    def _logl_batch(self, pvals, setp, varying=None):
+        # `setp` sets the parameters from each row of pvals. A GlobalObjective
+        # supplies its own setp because constraints may link parameters
+        # across objectives. `varying` are the parameters that setp sets when
+        # a row only contains varying parameters.
+        nrows = len(pvals)
+        extra_potential = np.zeros(nrows)
+        lnsigma = np.zeros(nrows)
+        row = iter(range(nrows))
+
+        x = self.data.x
+        x_err = self.data.x_err
+
+        compiled = None
+        if (
+            varying is not None
+            and np.shape(pvals)[-1] == len(varying)
+            and self.logp_extra is None
+            and hasattr(self.model, "compile")
+        ):
+            try:
+                compiled = self.model.compile(varying)
+            except ValueError:
+                pass
+
+        if compiled is not None:
+            # compiled models don't have extra potential terms
+            model = compiled(x, pvals, x_err=x_err)
+            if self.lnsigma is not None:
+                f, _ = _vectorised(self.lnsigma, varying)
+                lnsigma[:] = f(np.asarray(pvals, dtype=np.float64))
+            setp(pvals[-1])
+            return self._batch_logl(model, lnsigma, extra_potential)
+
+        def setp_and_record(vals):
+            # record the extra potential terms and lnsigma at the same time
+            # as the model gathers what it needs.
+            i = next(row)
+            setp(vals)
+            extra_potential[i] = self.model.logp()
+            if self.logp_extra is not None:
+                extra_potential[i] += self.logp_extra(self.model, self.data)
+            if self.lnsigma is not None:
+                lnsigma[i] = float(self.lnsigma)
+
+        if hasattr(self.model, "model_batch"):
+            model = self.model.model_batch(
+                x, pvals, x_err=x_err, setp=setp_and_record
+            )
+        else:
+            model = np.empty((nrows, np.size(x)))
+            for i, vals in enumerate(pvals):
+                setp_and_record(vals)
+                model[i] = self.model(x, x_err=x_err)
+
+        return self._batch_logl(model, lnsigma, extra_potential)
+
+    def _batch_logl(self, model, lnsigma, extra_potential):
+        # log-likelihood of each row of a batch of models
+        y, y_err, model = self._data_transform(model)
+
+        if self.lnsigma is not None:
+            var_y = (
+                y_err * y_err
+                + np.exp(2 * lnsigma)[:, np.newaxis] * model * model
+            )
+            logl = (y - model) ** 2 / var_y
+
+            if self.weighted:
+                logl += np.log(2 * np.pi * var_y)
+        else:
+            var_y, log_var_y = self._var_y()
+            logl = (y - model) ** 2 / var_y
+            if self.weighted:
+                logl += log_var_y
+
+        # nans play havoc
+        if np.isnan(logl).any():
+            raise RuntimeError("Objective.logl encountered a NaN")
+
+        return -0.5 * np.sum(logl, axis=-1) + extra_potential
+
     def nll(self, pvals=None):
         """
         Negative log-likelihood function
@@ -675,22 +1022,29 @@ class Objective(BaseObjective):
         def residuals_scaler(vals):
             return np.squeeze(self.residuals(_pvals * vals))
 
-        try:
-            # we should be able to calculate a Jacobian for a parameter whose
-            # value is zero. However, the scaling approach won't work.
-            # This will force Jacobian calculation by unscaled parameters
-            if np.any(_pvals == 0):
-                raise FloatingPointError()
-
-            with np.errstate(invalid="raise"):
-                jac = approx_derivative(residuals_scaler, np.ones_like(_pvals))
-            used_residuals_scaler = True
-        except FloatingPointError:
-            jac = approx_derivative(self.residuals, _pvals)
-        finally:
-            # using approx_derivative changes the state of the objective
-            # parameters have to make sure they're set at the end
-            self.setp(_pvals)
+        # use analytic derivatives if the model can supply them
+        jac = self._residuals_jacobian(self.varying_parameters())
+
+        if jac is None:
+            try:
+                # we should be able to calculate a Jacobian for a parameter
+                # whose value is zero. However, the scaling approach won't
+                # work. This will force Jacobian calculation by unscaled
+                # parameters
+                if np.any(_pvals == 0):
+                    raise FloatingPointError()
+
+                with np.errstate(invalid="raise"):
+                    jac = approx_derivative(
+                        residuals_scaler, np.ones_like(_pvals)
+                    )
+                used_residuals_scaler = True
+            except FloatingPointError:
+                jac = approx_derivative(self.residuals, _pvals)
+            finally:
+                # using approx_derivative changes the state of the objective
+                # parameters have to make sure they're set at the end
+                self.setp(_pvals)
 
         # need to create this because GlobalObjective does not have
         # access to all the datapoints being fitted.
@@ -946,20 +1300,29 @@ class GlobalObjective(Objective):
 
         return np.concatenate(residuals)
 
+    def _residuals_jacobian(self, parameters):
+        jacs = []
+        for objective in self.objectives:
+            jac = objective._residuals_jacobian(parameters)
+            if jac is None:
+                return None
+            jacs.append(jac)
+
+        return np.concatenate(jacs)
+
     @property
     def parameters(self):
         """
         :class:`refnx.analysis.Parameters` associated with all the objectives.
 
         """
-        # TODO this is probably going to be slow.
-        # cache and update strategy?
         p = Parameters(name="global fitting parameters")
 
         for objective in self.objectives:
             p.append(objective.parameters)
 
-        return p
+        self._parameters = _interned(p, self._parameters)
+        return self._parameters
 
     def logp(self, pvals=None):
         """
@@ -987,6 +1350,40 @@ class GlobalObjective(Objective):
 
         return logp
 
+    def logp_batch(self, pvals):
+        """
+        Log-prior probability function for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values to be tested.
+
+        Returns
+        -------
+        logp : np.ndarray
+            log-prior probability for each row of `pvals`.
+
+        """
+        varying = _index(self.parameters).varying()
+        pvals = np.asarray(pvals, dtype=float)
+        if pvals.ndim != 2 or pvals.shape[1] != len(varying):
+            return super(Objective, self).logp_batch(pvals)
+
+        # the log-prior of each objective is calculated from its own varying
+        # parameters, which are a subset of the columns of pvals
+        columns = {id(param): i for i, param in enumerate(varying)}
+        logp = np.zeros(len(pvals))
+        for objective in self.objectives:
+            index = _index(objective.parameters)
+            idx = [columns[id(param)] for param in index.varying()]
+            logp += index.prior().logp(pvals[:, idx])
+
+        logp[~np.isfinite(logp)] = -np.inf
+        if len(pvals):
+            self.setp(pvals[-1])
+        return logp
+
     def logl(self, pvals=None):
         """
         Calculate the log-likelhood of the system
@@ -1010,6 +1407,30 @@ class GlobalObjective(Objective):
 
         return logl
 
+    def logl_batch(self, pvals):
+        """
+        Calculate the log-likelihood of the system for many sets of parameters
+
+        Parameters
+        ----------
+        pvals : array-like
+            2D array, each row of which contains values for the varying or
+            entire set of parameters.
+
+        Returns
+        -------
+        logl : np.ndarray
+            log-likelihood probability for each row of `pvals`.
+
+        """
+        logl = np.zeros(len(pvals))
+        varying = self.varying_parameters()
+
+        for objective in self.objectives:
+            logl += objective._logl_batch(pvals, self.setp, varying)
+
+        return logl
+
     def plot(self, pvals=None, samples=0, parameter=None, fig=None):
         """
         Plot the data/model for all the objectives in the GlobalObjective.
@@ -1168,6 +1589,11 @@ class Transform(object):
     def __repr__(self):
         return "Transform({0})".format(repr(self.form))
 
+    def _cache_key(self):
+        # the transform of a given dataset only changes if this does, see
+        # `Objective._transformed_data`
+        return self.form
+
     def __call__(self, x, y, y_err=None):
         """
         Calculate the transformed data
@@ -1,12 +1,14 @@
 import operator
 from types import MethodType
+import weakref
 from collections import UserList
 import copy
 
 
 import numpy as np
-from refnx._lib import flatten, unique as f_unique
+from refnx._lib import flatten
 from refnx.analysis import Interval, PDF, Bounds
+from refnx.analysis import bounds as _bounds_module
 
 
 # Functions for making Functors
@@ -26,6 +28,16 @@ def asMagicNumber(x):
     return x if isinstance(x, BaseParameter) else Constant(x)
 
 
+# incremented whenever a Parameter is allowed to vary, or stops varying, see
+# `_FlatIndex.varying`.
+_VARYCOUNT = 0
+
+
+def _varied():
+    global _VARYCOUNT
+    _VARYCOUNT += 1
+
+
 # a function that takes a function that returns a function
 # MAKE_BINARY = lambda opfn: lambda self, other: (
 #     _BinaryOp(self, asMagicNumber(other), opfn))
@@ -59,6 +71,10 @@ binary = [
     np.power,
     operator.pow,
     operator.mod,
+    operator.lt,
+    operator.le,
+    operator.ge,
+    operator.gt,
 ]
 
 unary = [
@@ -89,11 +105,58 @@ class Parameters(UserList):
         Name of this :class:`Parameters` instance
     """
 
+    # `_FlatIndex` of the contents, see `_flat`
+    _cache = None
+
     def __init__(self, data=(), name=None):
         super(Parameters, self).__init__()
         self.name = name
         self.data.extend(data)
 
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop("_cache", None)
+        return d
+
+    def _flat(self):
+        """
+        The flattened contents of this object. The index is cached until the
+        contents of this object, or of any :class:`Parameters` it contains,
+        are changed.
+
+        Returns
+        -------
+        index : _FlatIndex
+        """
+        cache = self._cache
+        data = self.data
+        if (
+            cache is not None
+            and len(cache.items) == len(data)
+            and all(map(operator.is_, cache.items, data))
+            and all(child._flat() is index for child, index in cache.children)
+        ):
+            return cache
+
+        flat = []
+        children = []
+        cacheable = True
+        for el in data:
+            if isinstance(el, Parameters):
+                index = el._flat()
+                children.append((el, index))
+                flat.extend(index.flat)
+            elif isinstance(el, BaseParameter):
+                flat.append(el)
+            else:
+                # the contents of other sequences can't be tracked
+                cacheable = False
+                flat.extend(flatten([el]))
+
+        cache = _FlatIndex(list(data), children, flat)
+        self._cache = cache if cacheable else None
+        return cache
+
     def __getitem__(self, i):
         if type(i) is str:
             try:
@@ -143,7 +206,7 @@ class Parameters(UserList):
         """
         Does this instance contain a given :class:`Parameter`
         """
-        return id(item) in [id(p) for p in f_unique(flatten(self.data))]
+        return id(item) in [id(p) for p in self._flat().unique]
 
     def __ior__(self, other):
         """
@@ -184,19 +247,15 @@ class Parameters(UserList):
             Log probability for all the parameters
         """
         # logp for all the parameters
-        return np.sum(
-            [
-                param.logp()
-                for param in f_unique(flatten(self.data))
-                if param.vary
-            ]
-        )
+        index = self._flat()
+        return index.prior().logp(index.values())
 
     def __array__(self):
         """
         Convert Parameters to an array containing their values.
         """
-        return np.array([float(p) for p in flatten(self.data)])
+        flat = self._flat().flat
+        return np.fromiter(map(float, flat), np.float64, len(flat))
 
     @property
     def pvals(self):
@@ -208,9 +267,8 @@ class Parameters(UserList):
 
     @pvals.setter
     def pvals(self, pvals):
-        varying = [
-            param for param in f_unique(flatten(self.data)) if param.vary
-        ]
+        index = self._flat()
+        varying = index.varying()
         if np.size(pvals) == len(varying):
             [
                 setattr(param, "value", pvals[i])
@@ -218,7 +276,7 @@ class Parameters(UserList):
             ]
             return
 
-        flattened_parameters = list(flatten(self.data))
+        flattened_parameters = index.flat
 
         if np.size(pvals) == len(flattened_parameters):
             [
@@ -257,9 +315,9 @@ class Parameters(UserList):
 
         """
         if unique:
-            return list(f_unique(flatten(self.data)))
+            return list(self._flat().unique)
         else:
-            return list(flatten(self.data))
+            return list(self._flat().flat)
 
     def names(self):
         """
@@ -269,7 +327,7 @@ class Parameters(UserList):
             A list of all the names of all the :class:`Parameter` contained in
             this object.
         """
-        return [param.name for param in flatten(self.data)]
+        return [param.name for param in self._flat().flat]
 
     def nvary(self):
         """
@@ -280,7 +338,7 @@ class Parameters(UserList):
             allowed to vary.
 
         """
-        return len([1 for param in f_unique(flatten(self.data)) if param.vary])
+        return len(self._flat().varying())
 
     def constrained_parameters(self):
         """
@@ -292,7 +350,7 @@ class Parameters(UserList):
         """
         return [
             param
-            for param in f_unique(flatten(self.data))
+            for param in self._flat().unique
             if param.constraint is not None
         ]
 
@@ -305,9 +363,8 @@ class Parameters(UserList):
         p : list
             Unique list of varying parameters
         """
-        p = [param for param in f_unique(flatten(self.data)) if param.vary]
         q = Parameters()
-        q.data = p
+        q.data = list(self._flat().varying())
         return q
 
     def pgen(self, ngen=1000, nburn=0, nthin=1):
@@ -368,6 +425,72 @@ class Parameters(UserList):
             yield template_array
 
 
+class _FlatIndex(object):
+    """
+    The flattened contents of a :class:`Parameters` object.
+
+    Parameters
+    ----------
+    items : list
+        The contents of the :class:`Parameters` object when it was indexed.
+    children : list
+        `(Parameters, _FlatIndex)` for each :class:`Parameters` contained in
+        `items`, used to check that the index is still valid.
+    flat : list
+        All the parameters, including those contained at any depth.
+    """
+
+    __slots__ = (
+        "items",
+        "children",
+        "flat",
+        "unique",
+        "_varying",
+        "_count",
+        "_prior",
+    )
+
+    def __init__(self, items, children, flat):
+        self.items = items
+        self.children = children
+        self.flat = flat
+        self.unique = list({id(p): p for p in flat}.values())
+        self._varying = None
+        self._count = None
+        self._prior = None
+
+    def varying(self):
+        """
+        The unique parameters that are allowed to vary.
+        """
+        if self._count != _VARYCOUNT:
+            self._varying = [param for param in self.unique if param.vary]
+            self._count = _VARYCOUNT
+        return self._varying
+
+    def prior(self):
+        """
+        `_Prior` for the unique parameters that are allowed to vary.
+        """
+        varying = self.varying()
+        cache = self._prior
+        if (
+            cache is None
+            or cache[0] is not varying
+            or cache[1] != _bounds_module._BOUNDSCOUNT
+        ):
+            prior = _bounds_module._Prior([param.bounds for param in varying])
+            cache = self._prior = (varying, _bounds_module._BOUNDSCOUNT, prior)
+        return cache[2]
+
+    def values(self):
+        """
+        Values of the unique parameters that are allowed to vary.
+        """
+        varying = self.varying()
+        return np.fromiter(map(float, varying), np.float64, len(varying))
+
+
 class BaseParameter(object):
     __add__ = MAKE_BINARY(operator.add)
     __sub__ = MAKE_BINARY(operator.sub)
@@ -387,6 +510,10 @@ class BaseParameter(object):
     __gt__ = MAKE_BINARY(operator.gt)
     __neg__ = MAKE_UNARY(operator.neg)
 
+    # `_Watcher` objects that are notified when the value or constraint of
+    # this object changes.
+    _watchers = None
+
     def __init__(self):
         # add mathematical operations as methods to this object
 
@@ -410,6 +537,9 @@ class BaseParameter(object):
         d = self.__dict__.copy()
         for k in ops:
             d.pop(k, None)
+        # watchers refer to calculations in this process only
+        d.pop("_watchers", None)
+        d.pop("_constraint_cache", None)
         return d
 
     def __setstate__(self, state):
@@ -458,6 +588,25 @@ class BaseParameter(object):
     @value.setter
     def value(self, v):
         self._value = v
+        self._notify()
+
+    def _watch(self, watcher):
+        # register a watcher with this object, and everything it depends on
+        if self._watchers is None:
+            self._watchers = weakref.WeakSet()
+        elif watcher in self._watchers:
+            return
+        self._watchers.add(watcher)
+        for dep in self._deps:
+            dep._watch(watcher)
+
+    def _notify(self, rewatch=False):
+        # tell watchers that calculations depending on this object are out of
+        # date. `rewatch` is used when the dependencies have changed.
+        if self._watchers:
+            for watcher in self._watchers:
+                watcher.dirty = True
+                watcher.rewatch = watcher.rewatch or rewatch
 
     @property
     def constraint(self):
@@ -584,6 +733,9 @@ class Parameter(BaseParameter):
         Python expression used to constrain the value during the fit.
     """
 
+    # [`_Watcher`, value] caching the value of a constraint
+    _constraint_cache = None
+
     def __init__(
         self, value=0.0, name=None, bounds=None, vary=False, constraint=None
     ):
@@ -663,25 +815,34 @@ class Parameter(BaseParameter):
         """
         The numeric value of the :class:`Parameter`
         """
-        if self._constraint is not None:
-            retval = self._constraint._eval()
-        else:
-            retval = self._value
-
-        return retval
+        return self._eval()
 
     @value.setter
     def value(self, v):
         value = float(v)
 
         self._value = value
+        self._notify()
 
     def _eval(self):
         if self._constraint is not None:
-            return self._constraint._eval()
+            return self._constrained_value()
         else:
             return self._value
 
+    def _constrained_value(self):
+        # the value of the constraint is cached until one of the parameters
+        # it depends on changes.
+        cache = self._constraint_cache
+        if cache is None or cache[0].rewatch:
+            cache = [_Watcher(self._constraint), None]
+            self._constraint_cache = cache
+        watcher = cache[0]
+        if watcher.dirty:
+            cache[1] = self._constraint._eval()
+            watcher.dirty = False
+        return cache[1]
+
     @property
     def bounds(self):
         """
@@ -691,6 +852,7 @@ class Parameter(BaseParameter):
 
     @bounds.setter
     def bounds(self, bounds):
+        _bounds_module._modified()
         if isinstance(bounds, Bounds):
             self._bounds = bounds
         elif bounds is None:
@@ -749,6 +911,7 @@ class Parameter(BaseParameter):
             raise RuntimeError("cannot vary a Parameter which is constrained")
         else:
             self._vary = vary
+            _varied()
 
     @property
     def constraint(self):
@@ -757,10 +920,12 @@ class Parameter(BaseParameter):
     @constraint.setter
     def constraint(self, expr):
         self._deps = []
+        self._constraint_cache = None
         if expr is None:
             value = self.value
             self._constraint = None
             self.value = value
+            self._notify(rewatch=True)
             return
         _expr = asMagicNumber(expr)
         if id(self) in [id(dep) for dep in flatten(_expr.dependencies())]:
@@ -770,6 +935,8 @@ class Parameter(BaseParameter):
             self._deps.append(expr)
         self._deps.extend(flatten(_expr.dependencies()))
         self._vary = False
+        _varied()
+        self._notify(rewatch=True)
 
     def setp(self, value=None, vary=None, bounds=None, constraint=None):
         """
@@ -824,6 +991,149 @@ class _UnaryOp(BaseParameter):
         return self.opn(self.op1._eval())
 
 
+class _Watcher:
+    """
+    Records whether any of a set of parameters has changed, allowing
+    calculations that depend on them to be cached.
+
+    Parameters
+    ----------
+    parameters : {Parameter, Parameters, sequence}
+        The parameters to watch. The parameters they are constrained by are
+        also watched.
+
+    Notes
+    -----
+    `dirty` is set whenever the value or constraint of a watched parameter
+    changes, it's the responsibility of the owner to reset it once its
+    calculation has been redone. `rewatch` is set if a constraint has
+    changed, in which case the set of parameters being watched may be out of
+    date and a new `_Watcher` should be created.
+    """
+
+    __slots__ = ("dirty", "rewatch", "__weakref__")
+
+    def __init__(self, parameters=()):
+        self.dirty = True
+        self.rewatch = False
+        if isinstance(parameters, BaseParameter):
+            parameters = [parameters]
+        for param in flatten(parameters):
+            param._watch(self)
+
+
+def _interned(new, old):
+    """
+    Returns `old` if it has the same contents as `new`, otherwise `new`.
+
+    Parameters
+    ----------
+    new, old : {Parameters, BaseParameter, None}
+
+    Notes
+    -----
+    Many objects create a new :class:`Parameters` each time their
+    `parameters` attribute is accessed. Keeping the previous object allows
+    its flattened index to be reused, see `Parameters._flat`.
+    """
+    if new is old:
+        return old
+    if not (
+        isinstance(new, Parameters)
+        and isinstance(old, Parameters)
+        and new.name == old.name
+        and len(new.data) == len(old.data)
+    ):
+        return new
+    for a, b in zip(new.data, old.data):
+        if a is not b and _interned(a, b) is not b:
+            return new
+    return old
+
+
+def _index(parameters):
+    """
+    `_FlatIndex` of a :class:`Parameters` object, or of any other sequence
+    of parameters.
+    """
+    if isinstance(parameters, Parameters):
+        return parameters._flat()
+    return _FlatIndex([], [], list(flatten(parameters)))
+
+
+def _vectorised(param, parameters):
+    """
+    Compiles a parameter into a function of a vector of parameter values.
+
+    Parameters
+    ----------
+    param : BaseParameter
+        The parameter to compile. Constraints are compiled into vectorised
+        expressions.
+    parameters : sequence of Parameter
+        The parameters corresponding to the entries of the vector.
+
+    Returns
+    -------
+    f, fixed : callable, list
+        `f(pvals)` calculates the value of `param`, where `pvals` has shape
+        `(..., len(parameters))`. The value of any other unconstrained
+        Parameter that `param` depends on is taken to be constant. `fixed`
+        records the `(Parameter, constraint, value)` of those Parameters, and
+        of the constrained Parameters encountered, see `_unchanged`.
+    """
+    index = {id(p): i for i, p in enumerate(parameters)}
+    fixed = []
+
+    def compile_(node):
+        if isinstance(node, Parameter):
+            if node.constraint is not None:
+                fixed.append((node, node.constraint, None))
+                return compile_(node.constraint)
+            if id(node) in index:
+                i = index[id(node)]
+                return lambda pvals: pvals[..., i]
+            value = node.value
+            fixed.append((node, None, value))
+            return lambda pvals: value
+        elif isinstance(node, Constant):
+            value = node.value
+            return lambda pvals: value
+
+        # the constraint is evaluated as a reverse Polish expression, with
+        # the leaves of the tree replaced by arrays of values.
+        tree = constraint_tree(node)
+        leaves = [
+            (i, compile_(t))
+            for i, t in enumerate(tree)
+            if isinstance(t, BaseParameter)
+        ]
+
+        def f(pvals):
+            program = list(tree)
+            for i, leaf in leaves:
+                program[i] = leaf(pvals)
+            return build_constraint_from_tree(program)
+
+        return f
+
+    f = compile_(param)
+    return f, fixed
+
+
+def _unchanged(fixed):
+    """
+    Whether the Parameters recorded by `_vectorised` still have the same
+    constraints and values.
+    """
+    for param, constraint, value in fixed:
+        if param.constraint is not constraint:
+            return False
+        if constraint is None and param.value != value:
+            return False
+    return True
+
+
 def is_parameter(x):
     """Test for Parameter-ness."""
     return isinstance(x, Parameter)
@@ -875,8 +1185,8 @@ def build_constraint_from_tree(tree):
     for t in tree:
         if callable(t):
             if t in binary:
-                o1 = v.pop()
                 o2 = v.pop()
+                o1 = v.pop()
                 v.append(t(o1, o2))
             elif t in unary:
                 o1 = v.pop()
@@ -1,9 +1,15 @@
 import pickle
 
-from refnx.analysis import Interval, PDF
+from refnx.analysis import Interval, PDF, Parameter, Parameters
+from refnx.analysis.bounds import _Prior
 
 import numpy as np
-from numpy.testing import assert_equal, assert_, assert_almost_equal
+from numpy.testing import (
+    assert_equal,
+    assert_,
+    assert_almost_equal,
+    assert_allclose,
+)
 from scipy.stats import norm, truncnorm, uniform
 
 
@@ -119,6 +125,49 @@ class TestBounds(object):
         pkl = pickle.dumps(bounds)
         pickle.loads(pkl)
 
+    def test_prior(self):
+        # vectorised prior should be the same as each Bounds
+        bounds = [
+            Interval(0, 10),
+            PDF(norm(1.0, 2.0)),
+            Interval(-1, 1),
+            PDF(norm(0, scale=3)),
+            PDF(truncnorm(-1, 2, loc=1)),
+            PDF(uniform(0, 3)),
+            PDF(UserPDF()),
+            Interval(lb=0),
+        ]
+        prior = _Prior(bounds)
+        assert_equal(len(prior._families), 3)
+        assert_equal(len(prior._other), 2)
+
+        x = np.random.default_rng(0).uniform(-1.5, 3, size=(5, 3, 8))
+        expected = np.sum(
+            [b.logp(x[..., i]) for i, b in enumerate(bounds)], axis=0
+        )
+        assert_allclose(prior.logp(x), expected)
+        assert_allclose(prior.logp(x[0, 0]), expected[0, 0])
+
+        # prior transform
+        prior = _Prior(bounds[:-2])
+        q = np.random.default_rng(1).uniform(size=(4, 6))
+        expected = np.stack(
+            [b.invcdf(q[..., i]) for i, b in enumerate(bounds[:-2])], axis=-1
+        )
+        assert_allclose(prior.invcdf(q), expected)
+
+        # the prior is recalculated when bounds change
+        a = Parameter(1, bounds=(0, 2), vary=True)
+        b = Parameter(1, bounds=PDF(norm(1, 1)), vary=True)
+        p = Parameters([a, b])
+        assert_allclose(p.logp(), np.log(0.5) + norm.logpdf(1, 1, 1))
+        a.bounds.ub = 4
+        assert_allclose(p.logp(), np.log(0.25) + norm.logpdf(1, 1, 1))
+        b.bounds = Interval(0, 10)
+        assert_allclose(p.logp(), np.log(0.25) + np.log(0.1))
+        a.range(2, 3)
+        assert_equal(p.logp(), -np.inf)
+
     def test_user_pdf(self):
         pdf = UserPDF()
         bounds = PDF(pdf)
@@ -276,6 +276,36 @@ class TestCurveFitter(object):
 
         assert_allclose(chain2, chain)
 
+    def test_mcmc_vectorize(self):
+        # vectorised sampling should follow the same path as the standard
+        # sampler
+        x = np.array(self.objective.parameters)
+
+        for ntemps in [-1, 3]:
+            chains = []
+            for vectorize in [False, True]:
+                self.objective.setp(x)
+                mcfitter = CurveFitter(
+                    self.objective,
+                    nwalkers=50,
+                    ntemps=ntemps,
+                    vectorize=vectorize,
+                )
+                mcfitter.initialise("jitter", random_state=1)
+                mcfitter.sample(
+                    steps=5, nthin=2, verbose=False, random_state=2, pool=1
+                )
+                chains.append(np.copy(mcfitter.chain))
+                logprobs = mcfitter.logpost
+
+            assert_allclose(chains[1], chains[0])
+
+            idx = mcfitter.index_max_prob
+            pvals = mcfitter.chain[idx]
+            assert_allclose(logprobs[idx], self.objective.logpost(pvals))
+
+        assert_("vectorize=True" in repr(mcfitter))
+
     def test_mcmc_init(self):
         # smoke test for sampler initialisation
         # TODO check that the initialisation worked.
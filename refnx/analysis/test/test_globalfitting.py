@@ -128,6 +128,13 @@ class TestGlobalFitting(object):
         # can we set the parameters?
         global_objective.setp(np.array([1e-5, 10, 212, 1, 10, 1e-5, 1e-5]))
 
+        # the vectorised log-prior is the same as row by row
+        pvals = np.array(global_objective.varying_parameters())
+        pvals = pvals * np.array([[1], [1.1], [100]])
+        logp = global_objective.logp_batch(pvals)
+        assert_equal(logp[-1], -np.inf)
+        assert_allclose(logp, [global_objective.logp(p) for p in pvals])
+
         f = CurveFitter(global_objective)
         f.fit()
 
@@ -165,6 +165,19 @@ class TestObjective(object):
         self.objective.setp(np.array([1.234, 1.23]))
         assert_equal(np.array(self.p), [1.234, 1.23])
 
+    def test_parameters_cache(self):
+        # the parameters are reused until the model changes
+        p = self.objective.parameters
+        assert_(self.objective.parameters is p)
+
+        self.objective.model.parameters.append(Parameter(1.0))
+        assert_(self.objective.parameters is p)
+        assert_equal(len(self.objective.parameters.flattened()), 3)
+
+        self.objective.model = Model(Parameters([self.p[0]]), fitfunc=line)
+        assert_(self.objective.parameters is not p)
+        assert_equal(len(self.objective.varying_parameters()), 1)
+
     def test_pvals(self):
         assert_equal(self.objective.parameters.pvals, [self.b_ls, self.m_ls])
         self.objective.parameters.pvals = [1, 2]
@@ -195,6 +208,43 @@ class TestObjective(object):
             self.objective.logpost() + amend, -559.01078135444595
         )
 
+    def test_logpost_batch(self):
+        # vectorised calculation should be the same as row by row
+        self.p[0].range(0, 10)
+        self.p[1].range(-5, 5)
+        pvals = np.array([[5.0, -1.0], [4.0, -0.9], [-1.0, -1.0], [1, 2]])
+
+        lnsigma = Parameter(-1.0, "lnsigma", bounds=(-10, 1), vary=True)
+        objectives = [
+            self.objective,
+            Objective(self.model, self.data, transform=Transform("YX2")),
+            Objective(self.model, self.data, lnsigma=lnsigma),
+            Objective(self.model, self.data, logp_extra=logp_extra),
+        ]
+        for objective in objectives:
+            vals = pvals
+            if objective.lnsigma is not None:
+                vals = np.c_[np.linspace(-2, 0, len(pvals)), pvals]
+
+            logp = objective.logp_batch(vals)
+            logl = objective.logl_batch(vals)
+            logpost = objective.logpost_batch(vals)
+            assert_equal(logp.shape, (len(vals),))
+            for i, row in enumerate(vals):
+                assert_allclose(logp[i], objective.logp(row))
+                assert_allclose(logl[i], objective.logl(row))
+                assert_allclose(logpost[i], objective.logpost(row))
+
+            # out of bounds
+            assert_equal(logpost[2], -np.inf)
+
+        # BaseObjective batch methods work row by row
+        def logl(theta):
+            return -0.5 * np.sum(theta ** 2)
+
+        bo = BaseObjective([1.0, 2.0], logl)
+        assert_allclose(bo.logpost_batch(pvals), [logl(p) for p in pvals])
+
     def test_prior_transform(self):
         self.p[0].bounds = PDF(stats.uniform(-10, 20))
         self.p[1].bounds = PDF(stats.norm(loc=5, scale=10))
@@ -205,6 +255,17 @@ class TestObjective(object):
             stats.norm.ppf(0.9, loc=5, scale=10),
         )
 
+        # batch of variates
+        u = np.array([[0.1, 0.9], [0.5, 0.2], [0.3, 0.3]])
+        x = self.objective.prior_transform(u)
+        assert_allclose(
+            x,
+            np.c_[
+                stats.uniform.ppf(u[:, 0], -10, 20),
+                stats.norm.ppf(u[:, 1], loc=5, scale=10),
+            ],
+        )
+
     def test_chisqr(self):
         assert_almost_equal(self.objective.chisqr(), 1231.1096772954229)
 
@@ -243,6 +304,50 @@ class TestObjective(object):
 
         assert_equal(self.objective.residuals().size, residuals.size - 1)
 
+    def test_transformed_data_cache(self):
+        objective = Objective(
+            self.model, self.data, transform=Transform("YX2")
+        )
+        x = self.data.x
+        ty = self.data.y * x ** 2
+        te = self.data.y_err * x ** 2
+        tmod = self.model(x) * x ** 2
+
+        logl = objective.logl()
+        y, y_err, model = objective._data_transform(self.model(x))
+        assert_almost_equal(y, ty)
+        assert_almost_equal(y_err, te)
+        assert_almost_equal(model, tmod)
+        assert_almost_equal(
+            logl,
+            -0.5
+            * np.sum(((ty - tmod) / te) ** 2 + np.log(2 * np.pi * te ** 2)),
+        )
+
+        # the transformed data is reused between calls
+        y2, y_err2, _ = objective._data_transform(self.model(x))
+        assert y2 is y
+        assert y_err2 is y_err
+        assert not y.flags.writeable
+        assert_almost_equal(objective.logl(), logl)
+
+        # and recalculated if the transform or data changes
+        objective.transform = Transform("YX4")
+        y2, y_err2, _ = objective._data_transform()
+        assert_almost_equal(y2, ty * x ** 2)
+
+        objective.transform = Transform("YX2")
+        mask = np.full_like(self.data.y, True, bool)
+        mask[1] = False
+        objective.data.mask = mask
+        y2, y_err2, _ = objective._data_transform()
+        assert_almost_equal(y2, np.delete(ty, 1))
+        assert_almost_equal(y_err2, np.delete(te, 1))
+
+        objective.weighted = False
+        y2, y_err2, _ = objective._data_transform()
+        assert_equal(y_err2, 1)
+
     def test_logp_extra(self):
         original_logl = self.objective.logl()
         self.objective.logp_extra = logp_extra
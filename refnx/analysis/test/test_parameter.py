@@ -14,6 +14,9 @@ from refnx.analysis.parameter import (
     constraint_tree,
     build_constraint_from_tree,
     possibly_create_parameter,
+    _vectorised,
+    _unchanged,
+    _interned,
 )
 
 
@@ -217,6 +220,58 @@ class TestParameter(object):
         e.constraint = 2
         assert_allclose(e.value, 2)
 
+    def test_constraint_tree_order(self):
+        # non-commutative operators are rebuilt with operands in order
+        a = Parameter(1)
+        b = Parameter(5)
+        for expr in [b - a, b / a, b ** a, b % 3, a < b]:
+            tree = constraint_tree(expr)
+            assert_allclose(build_constraint_from_tree(tree).value, expr.value)
+
+    def test_constraint_cache(self):
+        a = Parameter(1)
+        b = Parameter(2, constraint=a * 2)
+        c = Parameter(2.0)
+        d = Parameter(3, constraint=b - c)
+        assert_allclose(d.value, 0)
+
+        # values are recalculated when dependencies change
+        a.value = 3
+        assert_allclose(b.value, 6)
+        assert_allclose(d.value, 4)
+        c.value = 1
+        assert_allclose(d.value, 5)
+
+        # and when the constraints of dependencies change
+        b.constraint = a + 1
+        assert_allclose(d.value, 3)
+        b.constraint = None
+        b.value = 10
+        assert_allclose(d.value, 9)
+
+        e = pickle.loads(pickle.dumps(d))
+        assert_allclose(e.value, 9)
+
+    def test_vectorised(self):
+        a = Parameter(1)
+        b = Parameter(2)
+        c = Parameter(3, constraint=np.sin(a) * 2 - b)
+        d = Parameter(3, constraint=c / b + abs(a) - 1)
+
+        pvals = np.random.default_rng(1).uniform(1, 2, size=(5, 4, 2))
+        f, fixed = _vectorised(d, [a, b])
+        expected = np.sin(pvals[..., 0]) * 2 - pvals[..., 1]
+        expected = expected / pvals[..., 1] + pvals[..., 0] - 1
+        assert_allclose(f(pvals), expected)
+        assert_allclose(f(np.array([a.value, b.value])), d.value)
+
+        # b is not in the vector, so is treated as constant
+        f, fixed = _vectorised(d, [a])
+        assert_allclose(f(np.array([[1.0], [1.0]])), [d.value, d.value])
+        assert _unchanged(fixed)
+        b.value = 3
+        assert not _unchanged(fixed)
+
     def test_possibly_create_parameter(self):
         p = Parameter(10, bounds=(1.0, 2.0))
         q = possibly_create_parameter(p, vary=True, bounds=(-1.0, 2.0))
@@ -291,6 +346,54 @@ class TestParameters(object):
         p = self.a | self.b | self.a
         assert_equal(len(p.varying_parameters()), 2)
 
+    def test_flat_cache(self):
+        c = Parameter(3, name="c")
+        n = Parameters([c, self.m])
+        assert_equal(n.flattened(), [c, self.a, self.b])
+        assert_(n._flat() is n._flat())
+        assert_equal(n.nvary(), 0)
+
+        # structural changes of the object, or the Parameters it contains
+        self.m.append(c)
+        assert_equal(n.flattened(), [c, self.a, self.b, c])
+        assert_equal(n.flattened(unique=True), [c, self.a, self.b])
+        n[0] = self.b
+        assert_equal(n.flattened(unique=True), [self.b, self.a, c])
+        self.m.data = [self.a]
+        assert_equal(np.array(n), [2, 1])
+        n |= c
+        assert_equal(n.names(), ["b", "a", "c"])
+        del n[0]
+        assert_equal(n.nparam, 2)
+
+        # varying parameters
+        c.vary = True
+        assert_equal(n.varying_parameters().flattened(), [c])
+        n.pvals = [5]
+        assert_equal(c.value, 5)
+        self.a.vary = True
+        assert_equal(n.nvary(), 2)
+        self.a.constraint = c * 2
+        assert_equal(n.nvary(), 1)
+
+        m = pickle.loads(pickle.dumps(n))
+        assert_(m._cache is None)
+        assert_equal(np.array(m), [10, 5])
+
+    def test_interned(self):
+        c = Parameter(3, name="c")
+        old = Parameters([c, self.m])
+        assert_(_interned(Parameters([c, self.m]), old) is old)
+        assert_(_interned(Parameters([c, self.m.copy()]), old) is old)
+
+        new = Parameters([c, self.m], name="new")
+        assert_(_interned(new, old) is new)
+        new = Parameters([c, self.m, c])
+        assert_(_interned(new, old) is new)
+        new = Parameters([c, Parameters([self.a])])
+        assert_(_interned(new, old) is new)
+        assert_(_interned(new, None) is new)
+
     def test_pickle_parameters(self):
         # need to check that Parameters can be pickled/unpickle
         pkl = pickle.dumps(self.m)
@@ -1,6 +1,8 @@
 """"
 A basic representation of a 1D dataset
 """
+import itertools
+import operator
 import os.path
 import re
 
@@ -10,6 +12,10 @@ from refnx.util.nsplice import get_scaling_in_overlap
 from refnx._lib import possibly_open_file
 
 
+# versions of the data held by Data1D objects, see `Data1D._version`
+_VERSIONS = itertools.count()
+
+
 class Data1D(object):
     r"""
     A basic representation of a 1D dataset.
@@ -64,8 +70,17 @@ class Data1D(object):
     metadata : dict
         Information that should be retained with the dataset.
 
+    Notes
+    -----
+    The masked data returned by `x`, `y`, `y_err` and `x_err` are read-only,
+    contiguous, float64 arrays. They are cached until the data or `mask` are
+    set.
+
     """
 
+    # (sources, {name: masked array}, version), see `_masked`
+    _masked_cache = None
+
     def __init__(self, data=None, mask=None, **kwds):
         self.filename = None
         self.name = None
@@ -103,7 +118,7 @@ class Data1D(object):
 
         self._mask = None
         if mask is not None:
-            self._mask = np.broadcast_to(mask, self._y.shape)
+            self._mask = np.broadcast_to(mask, self._y.shape).astype(bool)
 
     def __len__(self):
         """
@@ -112,6 +127,62 @@ class Data1D(object):
         """
         return self.y.size
 
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop("_masked_cache", None)
+        return d
+
+    def _masked(self, name):
+        """
+        The masked version of one of the data arrays.
+
+        Parameters
+        ----------
+        name : {"_x", "_y", "_y_err", "_x_err"}
+            The attribute holding the unmasked data.
+
+        Returns
+        -------
+        arr : np.ndarray or None
+            Read-only, contiguous, float64 array
+        """
+        arrays = self._masked_arrays()[1]
+        if name not in arrays:
+            mask = self.mask
+            arr = getattr(self, name)
+            if arr is not None:
+                arr = np.asarray(arr, dtype=np.float64)
+                if arr.size and not mask.all():
+                    arr = arr[mask]
+                # a view prevents the unmasked data from becoming read-only
+                arr = np.ascontiguousarray(arr).view()
+                arr.flags.writeable = False
+            arrays[name] = arr
+
+        return arrays[name]
+
+    def _masked_arrays(self):
+        # the cache is valid so long as the data arrays and mask haven't been
+        # replaced. Changes made in place must call `_data_changed`.
+        sources = (self._x, self._y, self._y_err, self._x_err, self.mask)
+        cache = self._masked_cache
+        if cache is None or not all(map(operator.is_, cache[0], sources)):
+            cache = self._masked_cache = (sources, {}, next(_VERSIONS))
+        return cache
+
+    @property
+    def _version(self):
+        """
+        A number that changes whenever the (masked) data changes. It is
+        unique across all datasets, so it can be used to cache calculations
+        based on the data.
+        """
+        return self._masked_arrays()[2]
+
+    def _data_changed(self):
+        # the data arrays have been modified in-place
+        self._masked_cache = None
+
     def __str__(self):
         return "<{0}>, {1} points".format(self.name, len(self))
 
@@ -131,30 +202,21 @@ class Data1D(object):
         """
         x
         """
-        if self._x.size > 0:
-            return self._x[self.mask]
-        else:
-            return self._x
+        return self._masked("_x")
 
     @property
     def y(self):
         """
         y
         """
-        if self._y.size > 0:
-            return self._y[self.mask]
-        else:
-            return self._y
+        return self._masked("_y")
 
     @property
     def x_err(self):
         """
         x_err
         """
-        if self._x_err is not None:
-            return self._x_err[self.mask]
-        else:
-            return self._x_err
+        return self._masked("_x_err")
 
     @x_err.setter
     def x_err(self, x_err):
@@ -168,18 +230,17 @@ class Data1D(object):
         """
         y_err
         """
-        if self._y_err is not None:
-            return self._y_err[self.mask]
-        else:
-            return self._y_err
+        return self._masked("_y_err")
 
     @property
     def mask(self):
         """
-        mask
+        mask. The mask is read-only, to change it set a new mask.
         """
         if self._mask is None:
             self._mask = np.full_like(self._y, True, dtype=bool)
+        if self._mask.flags.writeable:
+            self._mask.flags.writeable = False
 
         return self._mask
 
@@ -268,6 +329,7 @@ class Data1D(object):
         """
         self._y /= scalefactor
         self._y_err /= scalefactor
+        self._data_changed()
 
     def add_data(self, data_tuple, requires_splice=False, trim_trailing=True):
         """
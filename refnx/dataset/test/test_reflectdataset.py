@@ -259,6 +259,54 @@ class TestReflectDataset(object):
         self.data.mask = None
         assert_equal(len(self.data), self.data._y.size)
 
+    def test_masked_cache(self):
+        data = self.data
+        x, y, y_err, x_err = data.data
+        assert_(data.y is y)
+        for arr in (x, y, y_err, x_err):
+            assert_(not arr.flags.writeable)
+            assert_(arr.flags.c_contiguous)
+            assert_equal(arr.dtype, np.float64)
+        with pytest.raises(ValueError):
+            y[0] = 1
+        with pytest.raises(ValueError):
+            data.mask[0] = False
+
+        # the masked arrays are recalculated when the mask is set
+        mask = np.full_like(y, True, bool)
+        mask[1] = False
+        data.mask = mask
+        assert_(data.y is not y)
+        assert_equal(data.y, np.delete(y, 1))
+        assert_equal(data.x_err, np.delete(x_err, 1))
+
+        # or the data is changed
+        data.x_err = np.arange(y.size)
+        assert_equal(data.x_err, np.delete(np.arange(y.size), 1))
+        y0 = np.copy(y)
+        data.scale(2.0)
+        assert_equal(data.y, np.delete(y0, 1) / 2)
+
+        data.data = (x, y0)
+        assert_equal(data.y, y0)
+        assert_(data.y_err is None)
+
+    def test_version(self):
+        # the version changes whenever the masked data does
+        data = self.data
+        version = data._version
+        assert_equal(data._version, version)
+        assert_(Data1D(data.data)._version != version)
+
+        mask = np.full_like(data.y, True, bool)
+        mask[1] = False
+        data.mask = mask
+        assert_(data._version != version)
+
+        version = data._version
+        data.scale(2.0)
+        assert_(data._version != version)
+
     def test_repr(self):
         a = Data1D(os.path.join(self.pth, "c_PLP0033831.txt"))
         b = eval(repr(a))
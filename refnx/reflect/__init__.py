@@ -3,6 +3,8 @@ import os
 from refnx.reflect.reflect_model import (
     ReflectModel,
     reflectivity,
+    reflectivity_jacobian,
+    precision_deviation,
     MixedReflectModel,
     FresnelTransform,
     choose_dq_type,
@@ -290,6 +290,10 @@ operators = {
     np.power: "np.power",
     operator.pow: "operator.pow",
     operator.mod: "operator.mod",
+    operator.lt: "operator.lt",
+    operator.le: "operator.le",
+    operator.ge: "operator.ge",
+    operator.gt: "operator.gt",
     operator.neg: "operator.neg",
     operator.abs: "operator.abs",
     np.sin: "np.sin",
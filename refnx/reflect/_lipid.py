@@ -66,6 +66,8 @@ class LipidLeaflet(Component):
     10**6 Angstrom**-2.
     """
 
+    _slabs_cacheable = True
+
     # TODO: use SLD of head instead of b_heads, vm_heads?
     def __init__(
         self,
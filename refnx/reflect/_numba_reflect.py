@@ -0,0 +1,244 @@
+"""
+*Calculates the specular (Neutron or X-ray) reflectivity from a stratified
+series of layers, using numba to compile the calculation.
+
+The refnx code is distributed under the following license:
+
+Copyright (c) 2015 A. R. J. Nelson, ANSTO
+
+Permission to use and redistribute the source code or binary forms of this
+software and its documentation, with or without modification is hereby
+granted provided that the above notice of copyright, these terms of use,
+and the disclaimer of warranty below appear in the source code and
+documentation, and that none of the names of above institutions or
+authors appear in advertising or endorsement of works derived from this
+software without specific prior written permission from all parties.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THIS SOFTWARE.
+
+"""
+import threading
+
+import numpy as np
+import numba
+from numba import njit, prange
+
+from refnx.reflect._reflect import TINY
+
+
+# The numba threading layer isn't changed here because it's a process wide
+# setting, see the notes in `refnx.reflect.get_reflect_backend`. The
+# workqueue layer (the fork safe choice) isn't threadsafe, so parallel kernels
+# are launched one at a time.
+_LAUNCH_LOCK = threading.Lock()
+
+
+@njit(cache=True)
+def _reflectance(q, layers):
+    # Abeles matrix calculation for a single Q value and structure. Only
+    # scalars are used, no temporary arrays are created.
+    nlayers = layers.shape[0] - 2
+    qq2 = q * q / 4.0 + 0j
+    kn = q / 2.0 + 0j
+
+    mrtot00 = 1.0 + 0j
+    mrtot01 = 0j
+    mrtot10 = 0j
+    mrtot11 = 1.0 + 0j
+
+    for ii in range(nlayers + 1):
+        # addition of TINY is to ensure the correct branch cut
+        # in the complex sqrt calculation of kn.
+        sld = (
+            4e-6
+            * np.pi
+            * (
+                (layers[ii + 1, 1] - layers[0, 1])
+                + 1j * (np.abs(layers[ii + 1, 2]) + TINY)
+            )
+        )
+        kn_next = np.sqrt(qq2 - sld)
+
+        # reflectance of the interface
+        rj = (kn - kn_next) / (kn + kn_next)
+        rj *= np.exp(-2.0 * kn * kn_next * layers[ii + 1, 3] ** 2)
+
+        if ii == 0:
+            # characteristic matrix for first interface
+            mrtot01 = rj
+            mrtot10 = rj
+        else:
+            # characteristic matrix of the layer
+            beta = np.exp(kn * 1j * np.abs(layers[ii, 0]))
+            mi00 = beta
+            mi01 = rj * beta
+            mi11 = 1.0 / beta
+            mi10 = rj * mi11
+
+            p00 = mrtot00 * mi00 + mrtot01 * mi10
+            p01 = mrtot00 * mi01 + mrtot01 * mi11
+            p10 = mrtot10 * mi00 + mrtot11 * mi10
+            p11 = mrtot10 * mi01 + mrtot11 * mi11
+            mrtot00 = p00
+            mrtot01 = p01
+            mrtot10 = p10
+            mrtot11 = p11
+
+        kn = kn_next
+
+    num = np.abs(mrtot10)
+    den = np.abs(mrtot00)
+    return (num * num) / (den * den)
+
+
+@njit(parallel=True, cache=True)
+def _abeles(q, layers, out):
+    npnts = q.size
+    for idx in prange(layers.shape[0] * npnts):
+        k = idx // npnts
+        j = idx % npnts
+        out[k, j] = _reflectance(q[j], layers[k])
+
+
+@njit(parallel=True, cache=True)
+def _smeared_abeles(q, layers, halfwidth, abscissae, weights, start, out):
+    npnts = q.size
+    for idx in prange(layers.shape[0] * npnts):
+        k = idx // npnts
+        j = idx % npnts
+        total = 0.0
+        for m in range(start[j], start[j + 1]):
+            total += weights[m] * _reflectance(
+                q[j] + abscissae[m] * halfwidth[j], layers[k]
+            )
+        out[k, j] = total
+
+
+def _layers(layers):
+    layers = np.ascontiguousarray(layers, dtype=np.float64)
+    if layers.ndim == 2:
+        return layers[np.newaxis], False
+    return layers, True
+
+
+def _run(f, threads, *args):
+    # temporarily change the number of threads used by parallel kernels
+    nthreads = numba.config.NUMBA_NUM_THREADS
+    if threads > 0:
+        nthreads = min(int(threads), nthreads)
+
+    with _LAUNCH_LOCK:
+        original = numba.get_num_threads()
+        numba.set_num_threads(nthreads)
+        try:
+            f(*args)
+        finally:
+            numba.set_num_threads(original)
+
+
+def abeles(q, layers, scale=1.0, bkg=0.0, threads=-1):
+    """
+    Abeles matrix formalism for calculating reflectivity from a stratified
+    medium.
+
+    Parameters
+    ----------
+    q: array_like
+        the q values required for the calculation.
+        Q = 4 * Pi / lambda * sin(omega).
+        Units = Angstrom**-1
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4),
+        where N is the number of layers. See `refnx.reflect._reflect.abeles`
+        for details. If `layers` has shape (K, 2 + N, 4) then the
+        reflectivity of K structures is calculated in a single call.
+    scale: float or array_like
+        Multiply all reflectivities by this value. For a batch of structures
+        this can be an array of shape (K,).
+    bkg: float or array_like
+        Linear background to be added to all reflectivities. For a batch of
+        structures this can be an array of shape (K,).
+    threads: int, optional
+        Specifies the number of threads for parallel calculation. If
+        `threads == -1` then all available processors are used.
+
+    Returns
+    -------
+    Reflectivity: np.ndarray
+        Calculated reflectivity values for each q value. For a batch of
+        structures the array has shape `(K,) + q.shape`.
+    """
+    qvals = np.asfarray(q)
+    flatq = np.ascontiguousarray(qvals.ravel())
+    layers, batched = _layers(layers)
+
+    out = np.empty((layers.shape[0], flatq.size), np.float64)
+    _run(_abeles, threads, flatq, layers, out)
+
+    out *= np.reshape(scale, (-1, 1))
+    out += np.reshape(bkg, (-1, 1))
+
+    if batched:
+        return np.reshape(out, (layers.shape[0],) + qvals.shape)
+    return np.reshape(out, qvals.shape)
+
+
+def smeared_abeles(
+    q, layers, halfwidth, abscissae, weights, start, threads=-1
+):
+    """
+    Resolution smeared reflectivity, with the quadrature performed inside the
+    compiled kernel, so the unsmeared reflectivities are never stored.
+
+    Parameters
+    ----------
+    q: np.ndarray
+        1D array of the q values required for the calculation.
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4) or
+        (K, 2 + N, 4) for a batch of K structures, see `abeles`.
+    halfwidth: np.ndarray
+        Half the width of the integration range for each q value.
+    abscissae, weights: np.ndarray
+        Quadrature abscissae (on [-1, 1]) and weights. The quadrature rule
+        for `q[j]` is given by `abscissae[start[j]:start[j + 1]]` and
+        `weights[start[j]:start[j + 1]]`, allowing each point to use a
+        different quadrature order.
+    start: np.ndarray
+        Integer offsets into `abscissae` and `weights`, has size
+        `q.size + 1`.
+    threads: int, optional
+        Specifies the number of threads for parallel calculation. If
+        `threads == -1` then all available processors are used.
+
+    Returns
+    -------
+    reflectivity: np.ndarray
+        :math:`\\sum_m w_m R(q_j + x_m h_j)` for each q value. For a batch of
+        structures the array has shape `(K, q.size)`.
+    """
+    qvals = np.ascontiguousarray(q, dtype=np.float64)
+    layers, batched = _layers(layers)
+
+    out = np.empty((layers.shape[0], qvals.size), np.float64)
+    _run(
+        _smeared_abeles,
+        threads,
+        qvals,
+        layers,
+        np.ascontiguousarray(halfwidth, dtype=np.float64),
+        np.ascontiguousarray(abscissae, dtype=np.float64),
+        np.ascontiguousarray(weights, dtype=np.float64),
+        np.ascontiguousarray(start, dtype=np.int64),
+        out,
+    )
+
+    if batched:
+        return out
+    return out[0]
@@ -115,6 +115,17 @@ class _Abeles_pyopencl:
                 src = f.read()
             self.prg = cl.Program(self.ctx, src).build()
 
+        if np.ndim(w) == 3:
+            # a batch of structures is calculated one at a time
+            scale = np.broadcast_to(scale, len(w))
+            bkg = np.broadcast_to(bkg, len(w))
+            return np.stack(
+                [
+                    self(q, wk, scale=sk, bkg=bk)
+                    for wk, sk, bk in zip(w, scale, bkg)
+                ]
+            )
+
         qvals = np.asfarray(q)
         flatq = qvals.ravel()
 
@@ -152,7 +163,7 @@ class _Abeles_pyopencl:
 abeles_pyopencl = _Abeles_pyopencl()
 
 
-def abeles(q, layers, scale=1.0, bkg=0, threads=0):
+def abeles(q, layers, scale=1.0, bkg=0, threads=0, precision="double"):
     """
     Abeles matrix formalism for calculating reflectivity from a stratified
     medium.
@@ -175,78 +186,444 @@ def abeles(q, layers, scale=1.0, bkg=0, threads=0):
         layers[-1, 1] - SLD of backing (/1e-6 Angstrom**-2)
         layers[-1, 2] - iSLD of backing (/1e-6 Angstrom**-2)
         layers[-1, 3] - roughness between backing and last layer
-    scale: float
-        Multiply all reflectivities by this value.
-    bkg: float
-        Linear background to be added to all reflectivities
+
+        If `layers` has shape (K, 2 + N, 4) then the reflectivity of K
+        structures is calculated in a single call.
+    scale: float or array_like
+        Multiply all reflectivities by this value. For a batch of structures
+        this can be an array of shape (K,).
+    bkg: float or array_like
+        Linear background to be added to all reflectivities. For a batch of
+        structures this can be an array of shape (K,).
     threads: int, optional
         <THIS OPTION IS CURRENTLY IGNORED>
+    precision: {'double', 'mixed'}, optional
+        If 'mixed' the wavevectors, reflectances and characteristic matrices
+        of each layer are calculated in single precision (complex64), with
+        the matrix product being accumulated in double precision.
 
     Returns
     -------
     Reflectivity: np.ndarray
-        Calculated reflectivity values for each q value.
+        Calculated reflectivity values for each q value. For a batch of
+        structures the array has shape `(K,) + q.shape`.
     """
+    if precision not in ("double", "mixed"):
+        raise ValueError("precision must be one of {'double', 'mixed'}")
+    dtype = np.complex64 if precision == "mixed" else np.complex128
+
     qvals = np.asfarray(q)
     flatq = qvals.ravel()
 
-    nlayers = layers.shape[0] - 2
+    layers = np.asfarray(layers)
+    batched = layers.ndim == 3
+    if not batched:
+        layers = layers[np.newaxis]
+
+    nstructures = layers.shape[0]
+    nlayers = layers.shape[1] - 2
     npnts = flatq.size
 
-    kn = np.zeros((npnts, nlayers + 2), np.complex128)
-    mi00 = np.ones((npnts, nlayers + 1), np.complex128)
+    mi00 = np.ones((nstructures, npnts, nlayers + 1), dtype)
 
-    sld = np.zeros(nlayers + 2, np.complex128)
+    sld = np.zeros((nstructures, 1, nlayers + 2), np.complex128)
 
     # addition of TINY is to ensure the correct branch cut
     # in the complex sqrt calculation of kn.
-    sld[1:] += (
-        (layers[1:, 1] - layers[0, 1]) + 1j * (np.abs(layers[1:, 2]) + TINY)
+    sld[..., 1:] += (
+        (layers[:, np.newaxis, 1:, 1] - layers[:, np.newaxis, :1, 1])
+        + 1j * (np.abs(layers[:, np.newaxis, 1:, 2]) + TINY)
     ) * 1.0e-6
 
-    # kn is a 2D array. Rows are Q points, columns are kn in a layer.
+    # kn is a 3D array. The first axis is the structure, rows are Q points,
+    # columns are kn in a layer.
     # calculate wavevector in each layer, for each Q point.
-    kn[:] = np.sqrt(flatq[:, np.newaxis] ** 2.0 / 4.0 - 4.0 * np.pi * sld)
+    kn = np.sqrt(
+        (flatq[:, np.newaxis] ** 2.0 / 4.0 - 4.0 * np.pi * sld).astype(dtype)
+    )
+    rough_sqr = (-2.0 * layers[:, np.newaxis, 1:, 3] ** 2).astype(
+        kn.real.dtype
+    )
 
     # reflectances for each layer
-    # rj.shape = (npnts, nlayers + 1)
-    rj = kn[:, :-1] - kn[:, 1:]
-    rj /= kn[:, :-1] + kn[:, 1:]
-    rj *= np.exp(-2.0 * kn[:, :-1] * kn[:, 1:] * layers[1:, 3] ** 2)
+    # rj.shape = (nstructures, npnts, nlayers + 1)
+    rj = kn[..., :-1] - kn[..., 1:]
+    rj /= kn[..., :-1] + kn[..., 1:]
+    rj *= np.exp(kn[..., :-1] * kn[..., 1:] * rough_sqr)
 
     # characteristic matrices for each layer
-    # miNN.shape = (npnts, nlayers + 1)
+    # miNN.shape = (nstructures, npnts, nlayers + 1)
     if nlayers:
-        mi00[:, 1:] = np.exp(kn[:, 1:-1] * 1j * np.fabs(layers[1:-1, 0]))
+        thickness = np.fabs(layers[:, np.newaxis, 1:-1, 0])
+        mi00[..., 1:] = np.exp(
+            kn[..., 1:-1] * 1j * thickness.astype(kn.real.dtype)
+        )
     mi11 = 1.0 / mi00
     mi10 = rj * mi00
     mi01 = rj * mi11
 
-    # initialise matrix total
-    mrtot00 = mi00[:, 0]
-    mrtot01 = mi01[:, 0]
-    mrtot10 = mi10[:, 0]
-    mrtot11 = mi11[:, 0]
+    # initialise matrix total, which is always accumulated in double
+    # precision.
+    mrtot00 = mi00[..., 0].astype(np.complex128)
+    mrtot01 = mi01[..., 0].astype(np.complex128)
+    mrtot10 = mi10[..., 0].astype(np.complex128)
+    mrtot11 = mi11[..., 0].astype(np.complex128)
 
     # propagate characteristic matrices
     for idx in range(1, nlayers + 1):
         # matrix multiply mrtot by characteristic matrix
-        p0 = mrtot00 * mi00[:, idx] + mrtot10 * mi01[:, idx]
-        p1 = mrtot00 * mi10[:, idx] + mrtot10 * mi11[:, idx]
+        p0 = mrtot00 * mi00[..., idx] + mrtot10 * mi01[..., idx]
+        p1 = mrtot00 * mi10[..., idx] + mrtot10 * mi11[..., idx]
         mrtot00 = p0
         mrtot10 = p1
 
-        p0 = mrtot01 * mi00[:, idx] + mrtot11 * mi01[:, idx]
-        p1 = mrtot01 * mi10[:, idx] + mrtot11 * mi11[:, idx]
+        p0 = mrtot01 * mi00[..., idx] + mrtot11 * mi01[..., idx]
+        p1 = mrtot01 * mi10[..., idx] + mrtot11 * mi11[..., idx]
 
         mrtot01 = p0
         mrtot11 = p1
 
     r = mrtot01 / mrtot00
     reflectivity = r * np.conj(r)
-    reflectivity *= scale
-    reflectivity += bkg
-    return np.real(np.reshape(reflectivity, qvals.shape))
+    reflectivity *= np.reshape(scale, (-1, 1))
+    reflectivity += np.reshape(bkg, (-1, 1))
+    reflectivity = np.real(reflectivity)
+
+    if batched:
+        return np.reshape(reflectivity, (nstructures,) + qvals.shape)
+    return np.reshape(reflectivity, qvals.shape)
+
+
+def abeles_jacobian(q, layers):
+    """
+    Derivatives of the (unsmeared) reflectivity with respect to the layer
+    parameters, calculated with the Abeles matrix formalism.
+
+    Parameters
+    ----------
+    q: array_like
+        the q values required for the calculation.
+        Q = 4 * Pi / lambda * sin(omega).
+        Units = Angstrom**-1
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4),
+        where N is the number of layers. See `abeles` for details.
+
+    Returns
+    -------
+    jac: np.ndarray
+        `jac[j, k]` is the derivative of the reflectivity with respect to
+        `layers[j, k]` at each q value, has shape `layers.shape + q.shape`.
+
+    Notes
+    -----
+    The derivatives are propagated through the transfer matrix product. The
+    product, :math:`M = M_0 M_1 ... M_N`, is calculated along with the
+    partial products on either side of each characteristic matrix,
+    :math:`M_j`, so that a change in :math:`M_j` gives
+    :math:`dM = M_0 ... M_{j-1} dM_j M_{j+1} ... M_N`. The cost is
+    comparable to that of a few reflectivity calculations, regardless of how
+    many layers there are. The thicknesses of the fronting and backing media,
+    and the roughness in the first row, have no effect on the reflectivity so
+    their derivatives are zero. The derivatives with respect to the scale
+    factor (the reflectivity itself) and background (1) are trivial, and are
+    not included.
+    """
+    qvals = np.asfarray(q)
+    flatq = qvals.ravel()
+
+    layers = np.asfarray(layers)
+    nlayers = layers.shape[0] - 2
+    npnts = flatq.size
+
+    sld = np.zeros(nlayers + 2, np.complex128)
+    sld[1:] += (
+        (layers[1:, 1] - layers[0, 1]) + 1j * (np.abs(layers[1:, 2]) + TINY)
+    ) * 1.0e-6
+
+    kn = np.sqrt(flatq[:, np.newaxis] ** 2.0 / 4.0 - 4.0 * np.pi * sld)
+
+    # interfacial reflectances, and their derivatives with respect to the
+    # wavevectors on either side of each interface, and the roughness.
+    ka = kn[:, :-1]
+    kb = kn[:, 1:]
+    sigma = layers[1:, 3]
+    f = (ka - kb) / (ka + kb)
+    g = np.exp(-2.0 * ka * kb * sigma ** 2)
+    rj = f * g
+    drj_dka = (2.0 * kb / (ka + kb) ** 2 - 2.0 * kb * sigma ** 2 * f) * g
+    drj_dkb = (-2.0 * ka / (ka + kb) ** 2 - 2.0 * ka * sigma ** 2 * f) * g
+    drj_dsigma = -4.0 * ka * kb * sigma * rj
+
+    # phase factors for each layer
+    thick = np.fabs(layers[1:-1, 0])
+    beta = np.ones((npnts, nlayers + 1), np.complex128)
+    beta[:, 1:] = np.exp(1j * kn[:, 1:-1] * thick)
+
+    # characteristic matrices, mi.shape = (npnts, nlayers + 1, 2, 2)
+    mi = np.empty((npnts, nlayers + 1, 2, 2), np.complex128)
+    mi[..., 0, 0] = beta
+    mi[..., 0, 1] = rj * beta
+    mi[..., 1, 0] = rj / beta
+    mi[..., 1, 1] = 1.0 / beta
+
+    # right hand partial products, only the first column is needed.
+    # right[:, j] = M_{j+1} ... M_N [1, 0]^T
+    right = np.zeros((npnts, nlayers + 1, 2), np.complex128)
+    right[:, -1, 0] = 1.0
+    for idx in range(nlayers - 1, -1, -1):
+        right[:, idx] = np.einsum(
+            "pij,pj->pi", mi[:, idx + 1], right[:, idx + 1]
+        )
+    mtot = np.einsum("pij,pj->pi", mi[:, 0], right[:, 0])
+
+    # r = M10 / M00, dr = c^T dM [1, 0]^T
+    r = mtot[:, 1] / mtot[:, 0]
+    left = np.empty((npnts, nlayers + 1, 2), np.complex128)
+    left[:, 0, 0] = -r / mtot[:, 0]
+    left[:, 0, 1] = 1.0 / mtot[:, 0]
+    for idx in range(1, nlayers + 1):
+        left[:, idx] = np.einsum(
+            "pi,pij->pj", left[:, idx - 1], mi[:, idx - 1]
+        )
+
+    # derivative of r with respect to the phase factor and the reflectance of
+    # each characteristic matrix.
+    lt0 = left[..., 0]
+    lt1 = left[..., 1]
+    rt0 = right[..., 0]
+    rt1 = right[..., 1]
+    dr_dbeta = lt0 * (rt0 + rj * rt1) - lt1 * (rj * rt0 + rt1) / beta ** 2
+    dr_drj = lt0 * beta * rt1 + lt1 * rt0 / beta
+
+    # derivative of r with respect to the wavevector in each of the layers
+    # (the fronting wavevector is fixed).
+    dr_dkn = np.zeros((npnts, nlayers + 2), np.complex128)
+    dr_dkn[:, 1:] += dr_drj * drj_dkb
+    dr_dkn[:, 1:-1] += dr_drj[:, 1:] * drj_dka[:, 1:]
+    dr_dkn[:, 1:-1] += dr_dbeta[:, 1:] * 1j * thick * beta[:, 1:]
+
+    dkn_dsld = np.zeros((npnts, nlayers + 2), np.complex128)
+    dkn_dsld[:, 1:] = -2.0 * np.pi * 1.0e-6 / kn[:, 1:]
+
+    dr = np.zeros((npnts, nlayers + 2, 4), np.complex128)
+    dr[:, 1:-1, 0] = (
+        dr_dbeta[:, 1:] * 1j * kn[:, 1:-1] * beta[:, 1:]
+    ) * np.sign(layers[1:-1, 0])
+    dr[..., 1] = dr_dkn * dkn_dsld
+    # the fronting SLD is subtracted from all the others
+    dr[:, 0, 1] = -np.sum(dr[:, 1:, 1], axis=-1)
+    isign = np.where(layers[1:, 2] < 0, -1.0, 1.0)
+    dr[:, 1:, 2] = dr[:, 1:, 1] * 1j * isign
+    dr[:, 1:, 3] = dr_drj * drj_dsigma
+
+    # R = |r|**2
+    jac = 2.0 * np.real(np.conj(r)[:, np.newaxis, np.newaxis] * dr)
+    jac = np.moveaxis(jac, 0, -1)
+    return np.reshape(jac, layers.shape + qvals.shape)
+
+
+def _abeles_product(flatq, layers, start, stop, mtot=None):
+    """
+    Propagates a partial product of Abeles characteristic matrices.
+
+    Parameters
+    ----------
+    flatq: np.ndarray
+        1D array of q values.
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4). See
+        `abeles` for details.
+    start, stop: int
+        The characteristic matrices `start, ..., stop - 1` are multiplied
+        onto `mtot`. There are N + 1 matrices, matrix `j` describes the
+        interface between `layers[j]` and `layers[j + 1]`, and the phase
+        change across `layers[j]`.
+    mtot: tuple of np.ndarray, optional
+        The product of the characteristic matrices `0, ..., start - 1`, as
+        `(m00, m01, m10, m11)`. Defaults to the identity matrix.
+
+    Returns
+    -------
+    mtot: tuple of np.ndarray
+        The product of the characteristic matrices `0, ..., stop - 1`.
+    """
+    if mtot is None:
+        one = np.ones_like(flatq, np.complex128)
+        mtot = (one, 0 * one, 0 * one, one)
+    if stop <= start:
+        return mtot
+
+    # the matrices only depend on layers[start:stop + 1]
+    rows = layers[start : stop + 1]
+    sld = (
+        (rows[:, 1] - layers[0, 1]) + 1j * (np.abs(rows[:, 2]) + TINY)
+    ) * 1.0e-6
+    thick = np.fabs(rows[:-1, 0])
+    if start == 0:
+        # the fronting medium
+        sld[0] = 0
+        thick[0] = 0
+
+    kn = np.sqrt(flatq[:, np.newaxis] ** 2.0 / 4.0 - 4.0 * np.pi * sld)
+    rj = kn[:, :-1] - kn[:, 1:]
+    rj /= kn[:, :-1] + kn[:, 1:]
+    rj *= np.exp(-2.0 * kn[:, :-1] * kn[:, 1:] * rows[1:, 3] ** 2)
+    beta = np.exp(kn[:, :-1] * 1j * thick)
+
+    m00, m01, m10, m11 = mtot
+    for idx in range(stop - start):
+        b = beta[:, idx]
+        ib = 1.0 / b
+        rb = rj[:, idx] * b
+        rib = rj[:, idx] * ib
+        m00, m10 = m00 * b + m10 * rib, m00 * rb + m10 * ib
+        m01, m11 = m01 * b + m11 * rib, m01 * rb + m11 * ib
+
+    return m00, m01, m10, m11
+
+
+def _matmul(a, b):
+    # product of two partial products from _abeles_product
+    a00, a01, a10, a11 = a
+    b00, b01, b10, b11 = b
+    return (
+        a00 * b00 + a10 * b01,
+        a01 * b00 + a11 * b01,
+        a00 * b10 + a10 * b11,
+        a01 * b10 + a11 * b11,
+    )
+
+
+def _periodic_blocks(layers, repeats):
+    """
+    Finds the blocks of layers that are repeated.
+
+    Parameters
+    ----------
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4). See
+        `abeles` for details.
+    repeats: sequence of tuple
+        `(start, stop, period)`, proposing that `layers[start:stop]` repeats
+        every `period` layers.
+
+    Returns
+    -------
+    blocks: list of tuple
+        `(start, period, nperiods)`, the characteristic matrices
+        `start, ..., start + period * nperiods - 1` consist of `nperiods`
+        repeats of the first `period` matrices. The blocks are sorted and
+        don't overlap.
+    """
+    blocks = []
+    cursor = 0
+    for start, stop, period in sorted(repeats):
+        start = max(start, cursor)
+        stop = min(stop, len(layers))
+        # characteristic matrix j depends on layers[j] and layers[j + 1], so
+        # matrices start, ..., stop - 2 are periodic.
+        nperiods = (stop - 1 - start) // period
+        if nperiods < 2 or not np.array_equal(
+            layers[start : stop - period], layers[start + period : stop]
+        ):
+            continue
+        blocks.append((start, period, nperiods))
+        cursor = start + period * nperiods
+    return blocks
+
+
+def _abeles_repeats(q, layers, blocks):
+    """
+    Abeles matrix formalism for a structure containing repeated blocks of
+    layers, e.g. a multilayer.
+
+    Parameters
+    ----------
+    q: array_like
+        the q values required for the calculation.
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4). See
+        `abeles` for details.
+    blocks: list of tuple
+        The repeated blocks of characteristic matrices, from
+        `_periodic_blocks`.
+
+    Returns
+    -------
+    Reflectivity: np.ndarray
+        Calculated reflectivity values for each q value.
+
+    Notes
+    -----
+    The product of the characteristic matrices in one period of a block is
+    raised to the number of periods by repeated squaring, so the cost of a
+    block grows with the logarithm of the number of periods.
+    """
+    qvals = np.asfarray(q)
+    flatq = qvals.ravel()
+    nmatrices = len(layers) - 1
+
+    mtot = None
+    cursor = 0
+    for start, period, nperiods in blocks:
+        mtot = _abeles_product(flatq, layers, cursor, start, mtot=mtot)
+        unit = _abeles_product(flatq, layers, start, start + period)
+        cursor = start + period * nperiods
+
+        # raise to the power of nperiods by repeated squaring
+        while nperiods:
+            if nperiods & 1:
+                mtot = _matmul(mtot, unit)
+            nperiods >>= 1
+            if nperiods:
+                unit = _matmul(unit, unit)
+    mtot = _abeles_product(flatq, layers, cursor, nmatrices, mtot=mtot)
+
+    m00, m01, m10, m11 = mtot
+    r = m01 / m00
+    return np.reshape(np.real(r * np.conj(r)), qvals.shape)
+
+
+def _pad_slabs(slabs):
+    """
+    Stacks a sequence of slab representations, which may have differing
+    numbers of layers, into a single array that can be used for batched
+    reflectivity calculations.
+
+    Parameters
+    ----------
+    slabs : sequence of np.ndarray
+        Each entry has shape (2 + N_k, 4), where N_k is the number of layers
+        in structure k.
+
+    Returns
+    -------
+    padded : np.ndarray
+        Array of shape (K, 2 + max(N_k), 4).
+
+    Notes
+    -----
+    Structures with fewer layers are padded with zero thickness layers that
+    have the same SLD as the backing medium, inserted just before the
+    backing. The roughness of the backing interface is moved to the first of
+    these padding layers, all remaining padding interfaces have zero
+    roughness. The padding layers have no Fresnel reflectance and no phase
+    change, so the reflectivity is unaltered.
+    """
+    slabs = [np.asfarray(s)[..., :4] for s in slabs]
+    nrows = max(s.shape[0] for s in slabs)
+
+    if all(s.shape[0] == nrows for s in slabs):
+        return np.stack(slabs)
+
+    padded = np.zeros((len(slabs), nrows, 4), np.float64)
+    for i, s in enumerate(slabs):
+        n = s.shape[0]
+        padded[i, : n - 1] = s[:-1]
+        padded[i, n - 1 :, 1:3] = s[-1, 1:3]
+        padded[i, n - 1, 3] = s[-1, 3]
+    return padded
 
 
 # The following slab contraction code was translated from C code in
@@ -350,6 +727,109 @@ def _contract_by_area(slabs, dA=0.5):
     return newslabs[:newi][::-1]
 
 
+def _contract_adaptive(slabs, dA=0.5):
+    r"""
+    Shrinks a slab representation to a reduced number of layers, with the
+    layer boundaries placed according to the local variation of the SLD
+    profile.
+
+    Parameters
+    ----------
+    slabs : array
+        Has shape (N, 5), see `_contract_by_area`.
+    dA : float
+        The maximum deviation of each contracted layer from the slabs it
+        replaces, see Notes. Larger values coarsen the profile to a greater
+        extent, and vice versa.
+
+    Returns
+    -------
+    contract_slab : array
+        Contracted slab representation.
+
+    Notes
+    -----
+    Consecutive slabs (that have no roughness between them) are merged into
+    a single layer, with the area averaged SLD, as long as
+    :math:`\sqrt{D \int (\rho(z) - \bar{\rho})^2 dz} \le dA` for the
+    real and imaginary parts of the SLD. :math:`D` is the thickness of the
+    merged layer and :math:`\bar{\rho}` its average SLD. The left hand side
+    is an upper bound for the area between the original and contracted
+    profiles, :math:`\int |\rho(z) - \bar{\rho}| dz`, which determines the
+    change in reflectivity (in the Born approximation). Flat regions are
+    merged regardless of their thickness, whereas layers in regions where the
+    SLD varies rapidly are thinner, e.g. a linear gradient, :math:`g`, gives
+    layers of thickness :math:`(12 dA^2 / g^2)^{1/4}`.
+    In comparison, `_contract_by_area` limits the range of the SLD in a layer
+    multiplied by its thickness.
+    """
+    newslabs = np.copy(slabs)[::-1]
+    d = newslabs[:, 0]
+    rho = newslabs[:, 1]
+    irho = newslabs[:, 2]
+    sigma = newslabs[:, 3]
+    vfsolv = newslabs[:, 4]
+
+    da2 = float(dA) ** 2
+    n = np.size(d, 0)
+    i = newi = 1  # Skip the substrate
+
+    while i < n:
+        # Get ready for the next layer
+        # Accumulation of the first row happens in the inner loop
+        dz = rhoarea = irhoarea = vfsolvarea = 0.0
+        rho2area = irho2area = 0.0
+
+        # Accumulate slices into layer
+        while True:
+            # Accumulate next slice
+            dz += d[i]
+            rhoarea += d[i] * rho[i]
+            irhoarea += d[i] * irho[i]
+            rho2area += d[i] * rho[i] * rho[i]
+            irho2area += d[i] * irho[i] * irho[i]
+            vfsolvarea += d[i] * vfsolv[i]
+
+            i += 1
+            # If no more slices or sigma != 0, break immediately
+            if i == n or sigma[i - 1] != 0.0:
+                break
+
+            # The fronting medium is always a layer of its own
+            if i == n - 1:
+                break
+
+            # If next slice won't fit, break
+            ndz = dz + d[i]
+            area = rhoarea + d[i] * rho[i]
+            area2 = rho2area + d[i] * rho[i] * rho[i]
+            if ndz * area2 - area * area > da2:
+                break
+
+            area = irhoarea + d[i] * irho[i]
+            area2 = irho2area + d[i] * irho[i] * irho[i]
+            if ndz * area2 - area * area > da2:
+                break
+
+        # Save the layer
+        d[newi] = dz
+        if i == n:
+            # Last layer uses surface values
+            rho[newi] = rho[n - 1]
+            irho[newi] = irho[n - 1]
+            vfsolv[newi] = vfsolv[n - 1]
+        else:
+            # Middle layers uses average values
+            rho[newi] = rhoarea / dz
+            irho[newi] = irhoarea / dz
+            sigma[newi] = sigma[i - 1]
+            vfsolv[newi] = vfsolvarea / dz
+        # First layer uses substrate values
+        newi += 1
+
+    return newslabs[:newi][::-1]
+
+
 """
 Polarised Neutron Reflectometry calculation
 """
@@ -482,7 +962,7 @@ def _magsqr(z):
     return np.abs(z) ** 2
 
 
-def pnr(q, layers):
+def pnr(q, layers, threads=0):
     """
     Calculates Polarised Neutron Reflectivity of a series of slabs.
 
@@ -513,11 +993,17 @@ def pnr(q, layers):
         layers[-1, 3] - magSLD of backing (/1e-6 Angstrom**-2)
         layers[-1, 4] - angle of magnetic moment w.r.t applied field (degrees)
 
+        If `layers` has shape (K, 2 + N, 5) then the reflectivity of K
+        structures is calculated.
+    threads: int, optional
+        Not used, present for compatibility with the compiled calculator.
+
     Returns
     -------
-    reflectivity: tuple of np.ndarray
-        Calculated Polarised Neutron Reflectivity values for each q value.
-        (PP, MM, PM, MP)
+    reflectivity: np.ndarray
+        Calculated Polarised Neutron Reflectivity values for each q value,
+        (PP, MM, PM, MP). Has shape `(4,) + q.shape`, or `(4, K) + q.shape`
+        for a batch of structures.
 
     References
     ----------
@@ -525,6 +1011,10 @@ def pnr(q, layers):
          probe of magnetic films and multilayers', Phys. Rev. B, (1992), 46,
          3391.
     """
+    layers = np.asfarray(layers)
+    if layers.ndim == 3:
+        return np.stack([pnr(q, w) for w in layers], axis=1)
+
     xx = np.asfarray(q).astype(np.complex128).ravel()
 
     thetas = np.radians(layers[:, 4])
@@ -577,7 +1067,7 @@ def pnr(q, layers):
     # du
     mp = _magsqr((M[:, 1, 2] * M[:, 0, 0] - M[:, 1, 0] * M[:, 0, 2]) / den)
 
-    return (pp, mm, pm, mp)
+    return np.reshape(np.stack((pp, mm, pm, mp)), (4,) + np.shape(q))
 
 
 if __name__ == "__main__":
@@ -27,11 +27,30 @@ _GAMMA = np.pi / np.sqrt(np.pi * np.pi - 8.0)
 class Interface(object):
     """
     Defines an Interfacial profile
+
+    Notes
+    -----
+    The `extent` attribute is the distance (in units of `scale`) either side
+    of `loc` beyond which the profile is 0 (or 1) to within numerical
+    precision. It's used to only evaluate the profile close to the interface
+    when creating a microslab representation of a
+    :class:`refnx.reflect.Structure`. If it's `None` (the default) the profile
+    is evaluated everywhere.
     """
 
+    extent = None
+
     def __init__(self):
         pass
 
+    def __setattr__(self, name, value):
+        # changes the microslab representation of Structures that use this
+        # Interface, so their cached slabs are invalidated.
+        from refnx.reflect import structure
+
+        structure._modified()
+        object.__setattr__(self, name, value)
+
     def __call__(self, z, scale=1, loc=0):
         raise NotImplementedError(
             "You can't use the Interface superclass to" "calculate profiles"
@@ -50,6 +69,8 @@ class Erf(Interface):
     Journal of Applied Crystallography, 2017, 50, 1428-1440
     """
 
+    extent = 9.0
+
     def __init__(self):
         super(Erf, self).__init__()
 
@@ -69,6 +90,8 @@ class Linear(Interface):
     Stearns, D. G. J. Appl. Phys., 1989, 65, 491–506.
     """
 
+    extent = _SQRT3
+
     def __init__(self):
         super(Linear, self).__init__()
 
@@ -92,6 +115,8 @@ class Exponential(Interface):
     Stearns, D. G. J. Appl. Phys., 1989, 65, 491–506.
     """
 
+    extent = 27.0
+
     def __init__(self):
         super(Exponential, self).__init__()
 
@@ -116,6 +141,8 @@ class Tanh(Interface):
     Phys. Rev. B,1993, 47 (8), 4385
     """
 
+    extent = 25.0
+
     def __init__(self):
         super(Tanh, self).__init__()
 
@@ -136,6 +163,8 @@ class Sinusoidal(Interface):
     Stearns, D. G. J. Appl. Phys., 1989, 65, 491–506.
     """
 
+    extent = _GAMMA
+
     def __init__(self):
         super(Sinusoidal, self).__init__()
 
@@ -162,6 +191,8 @@ class Step(Interface):
     Journal of Applied Crystallography, 2017, 50, 1428-1440
     """
 
+    extent = 1.0
+
     def __init__(self):
         super(Step, self).__init__()
 
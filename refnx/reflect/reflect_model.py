@@ -23,15 +23,22 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THIS SOFTWARE.
 
 """
+from collections import OrderedDict
 from contextlib import contextmanager
+import importlib.util
+import json
+import os
+import platform
+import threading
 import time
-from functools import lru_cache
+from functools import lru_cache, partial
 import numbers
 import warnings
 
 import numpy as np
 import scipy
-from scipy.interpolate import splrep, splev
+from scipy import sparse
+import scipy.sparse.linalg
 
 
 from refnx.analysis import (
@@ -40,6 +47,16 @@ from refnx.analysis import (
     possibly_create_parameter,
     Transform,
 )
+from refnx.analysis.parameter import _vectorised, _unchanged
+from refnx._lib import flatten, unique as f_unique
+from refnx.util._resolution_kernel import CompactKernel
+from refnx.reflect._reflect import (
+    _abeles_product,
+    _abeles_repeats,
+    _pad_slabs,
+    _periodic_blocks,
+    abeles_jacobian,
+)
 
 
 # some definitions for resolution smearing
@@ -88,6 +105,10 @@ def available_backends():
     except ImportError:
         pass
 
+    # importing the numba backend is slow, so only check that numba exists
+    if importlib.util.find_spec("numba") is not None:
+        backends.append("numba")
+
     try:
         import pyopencl as cl
 
@@ -115,10 +136,13 @@ def get_reflect_backend(backend="c"):
 
     Parameters
     ----------
-    backend: {'python', 'cython', 'c', 'pyopencl'}, str
+    backend: {'python', 'cython', 'c', 'pyopencl', 'numba', 'auto'}, str
         The module that calculates the reflectivity. Speed should go in the
-        order: c > pyopencl / cython > python. If a particular method is not
-        available the function falls back: cython/pyopencl --> c --> python.
+        order: c / numba > pyopencl / cython > python. If a particular method
+        is not available the function falls back:
+        cython/pyopencl/numba --> c --> python. 'auto' dispatches each
+        calculation to the backend (and number of threads) measured to be
+        fastest on this machine for its size, see :class:`AutotunedAbeles`.
 
     Returns
     -------
@@ -128,6 +152,20 @@ def get_reflect_backend(backend="c"):
     Notes
     -----
     'c' is preferred for most circumstances.
+    'numba' requires that numba be installed, and is an alternative to 'c'
+    when the compiled extension isn't available. The first calculation is
+    slow because the calculator is compiled (and cached on disk). With the
+    'numba' backend pointwise resolution smearing by Gaussian quadrature is
+    done inside the compiled calculator. The numba threading layer is left
+    as it is. The tbb and (GNU) omp threading layers can deadlock in
+    processes forked by multiprocessing (e.g. when sampling with
+    `refnx.analysis.CurveFitter.sample(pool=...)`). If that happens, select
+    the fork safe workqueue layer before the first calculation, either with
+    the `NUMBA_THREADING_LAYER=workqueue` environment variable or with
+    `numba.config.THREADING_LAYER = "workqueue"`.
+    The first time that 'auto' is requested on a machine all the available
+    backends are timed, which can take a minute. The decision table is saved
+    to `~/.refnx/autotune.json` and reused afterwards.
     'pyopencl' uses a GPU to calculate reflectivity and requires that pyopencl
     be installed. It may not as accurate as the other options. 'pyopencl' is
     only included for completeness. The 'pyopencl' backend is also harder to
@@ -135,7 +173,9 @@ def get_reflect_backend(backend="c"):
     """
     backend = backend.lower()
 
-    if backend == "pyopencl":
+    if backend == "auto":
+        return _autotuned_abeles()
+    elif backend == "pyopencl":
         try:
             import pyopencl as cl
         except (ImportError, ModuleNotFoundError):
@@ -162,6 +202,17 @@ def get_reflect_backend(backend="c"):
         except ImportError:
             warnings.warn("Can't use the cython abeles backend")
             return get_reflect_backend("c")
+    elif backend == "numba":
+        try:
+            from refnx.reflect import _numba_reflect as _nb
+
+            return _nb.abeles
+        except ImportError:
+            warnings.warn(
+                "Can't use the numba abeles backend, you need to install"
+                " numba"
+            )
+            return get_reflect_backend("c")
     elif backend == "c":
         try:
             from refnx.reflect import _creflect as _c
@@ -179,9 +230,335 @@ def get_reflect_backend(backend="c"):
     return _py.abeles
 
 
+def get_pnr_backend(backend="c"):
+    r"""
+    Obtain a 'pnr' function used for calculating polarised neutron
+    reflectivity.
+
+    Parameters
+    ----------
+    backend: {'python', 'cython', 'c', 'pyopencl', 'numba', 'auto'}, str
+        The module that calculates the polarised neutron reflectivity. Only
+        the 'c' and 'python' modules have a polarised calculator, 'cython',
+        'pyopencl', 'numba' and 'auto' use the 'c' calculator. If the 'c'
+        calculator is not available the function falls back to 'python'.
+
+    Returns
+    -------
+    pnr: callable
+        The callable that calculates the polarised neutron reflectivity,
+        `pnr(q, layers, threads=-1)`. It returns all four spin channels,
+        (PP, MM, PM, MP), in an array of shape `(4,) + q.shape`. `layers`
+        can be a batch of structures, see `refnx.reflect._reflect.pnr`.
+    """
+    backend = backend.lower()
+
+    if backend in ["c", "cython", "pyopencl", "numba", "auto"]:
+        try:
+            from refnx.reflect import _creflect as _c
+
+            return _c.pnr
+        except ImportError:
+            warnings.warn("Can't use the C pnr backend")
+    elif backend == "python":
+        warnings.warn("Using the SLOW polarised reflectivity calculation.")
+
+    from refnx.reflect import _reflect as _py
+
+    return _py.pnr
+
+
 # this function is used to calculate reflectivity
 abeles = get_reflect_backend("c")
 
+# this function is used to calculate polarised neutron reflectivity
+pnr = get_pnr_backend("c")
+
+
+# (npoints, nlayers) bucket edges used by the autotuner. The representative
+# shape of each bucket is the geometric mean of its edges.
+_TUNE_NPOINTS = (100, 300, 1000, 3000, 10000)
+_TUNE_NLAYERS = (4, 16, 64)
+
+
+def _default_autotune_file():
+    return os.path.join(os.path.expanduser("~"), ".refnx", "autotune.json")
+
+
+class AutotunedAbeles(object):
+    r"""
+    Calculates reflectivity with the backend and number of threads that is
+    fastest on this machine for the size of each calculation.
+
+    Parameters
+    ----------
+    table : dict, optional
+        Maps a `(npoints_bucket, nlayers_bucket)` tuple to a
+        `(backend, threads)` tuple. Created by :meth:`tune` if not supplied.
+    filename : str, optional
+        JSON file that the decision table is saved to and loaded from. The
+        file holds a table for each machine that uses it. Defaults to
+        `~/.refnx/autotune.json`.
+
+    Notes
+    -----
+    Instances are called in the same way as `abeles`. The number of q points
+    (multiplied by the number of structures for a batch) and the number of
+    layers of each call are placed into a bucket. The call is then
+    dispatched to the fastest backend/thread count measured for that bucket
+    by :meth:`tune`. The `threads` keyword supplied to the call is ignored in
+    favour of the tuned value. Calls falling into buckets that haven't been
+    tuned use the 'c' backend.
+
+    Autotuning is opt-in, use `get_reflect_backend('auto')` or
+    `use_reflect_backend('auto')` to load the table for this machine (tuning
+    and saving it first, if necessary).
+
+    Examples
+    --------
+
+    >>> from refnx.reflect.reflect_model import AutotunedAbeles
+    >>> tuned = AutotunedAbeles()
+    >>> tuned.tune(repeats=3)
+    >>> tuned.save()
+    """
+
+    def __init__(self, table=None, filename=None):
+        self.table = dict(table or {})
+        self.filename = filename or _default_autotune_file()
+        self._backends = {}
+
+    def __repr__(self):
+        return (
+            f"AutotunedAbeles(table={self.table!r},"
+            f" filename={self.filename!r})"
+        )
+
+    def __getstate__(self):
+        return {"table": self.table, "filename": self.filename}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __call__(self, q, layers, scale=1.0, bkg=0.0, threads=-1):
+        nlayers = np.shape(layers)[-2] - 2
+        nbatch = len(layers) if np.ndim(layers) == 3 else 1
+        npoints = np.size(q) * nbatch
+        backend, threads = self.table.get(
+            self.bucket(npoints, nlayers), ("c", threads)
+        )
+        f = self._backend(backend)
+        return f(q, layers, scale=scale, bkg=bkg, threads=threads)
+
+    @staticmethod
+    def machine():
+        """
+        str - identifies the machine that a decision table applies to.
+        """
+        return (
+            f"{platform.node()}-{platform.machine()}-"
+            f"{platform.python_version()}-{os.cpu_count()}"
+        )
+
+    @staticmethod
+    def bucket(npoints, nlayers):
+        """
+        The `(npoints_bucket, nlayers_bucket)` that a calculation falls into.
+        """
+        return (
+            int(np.searchsorted(_TUNE_NPOINTS, npoints, side="right")),
+            int(np.searchsorted(_TUNE_NLAYERS, nlayers, side="right")),
+        )
+
+    def _backend(self, backend):
+        f = self._backends.get(backend)
+        if f is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                f = get_reflect_backend(backend)
+            self._backends[backend] = f
+        return f
+
+    def tune(self, backends=None, threads=None, repeats=5, seed=0):
+        """
+        Times the backends and thread counts for a representative
+        calculation in each bucket, creating the decision table.
+
+        Parameters
+        ----------
+        backends : sequence of str, optional
+            The backends to consider. Defaults to `available_backends()`.
+        threads : sequence of int, optional
+            The thread counts to consider for the multithreaded backends ('c'
+            and 'cython'). Defaults to 1, half and all of the processors.
+        repeats : int, optional
+            Each calculation is timed this many times, the fastest time is
+            used.
+        seed : {int, np.random.Generator, None}, optional
+            Seeds the creation of the representative structures.
+
+        Returns
+        -------
+        table : dict
+            The decision table, which is also stored as `self.table`.
+        """
+        if backends is None:
+            backends = available_backends()
+        if threads is None:
+            ncpu = os.cpu_count() or 1
+            threads = sorted({1, max(ncpu // 2, 1), ncpu})
+
+        candidates = []
+        for backend in backends:
+            if backend in ("c", "cython"):
+                candidates.extend((backend, t) for t in threads)
+            else:
+                candidates.append((backend, 1))
+
+        rng = np.random.default_rng(seed)
+        npoints_edges = (30,) + _TUNE_NPOINTS + (30000,)
+        nlayers_edges = (1,) + _TUNE_NLAYERS + (256,)
+
+        table = {}
+        for i in range(len(_TUNE_NPOINTS) + 1):
+            npoints = int(np.sqrt(npoints_edges[i] * npoints_edges[i + 1]))
+            q = np.linspace(0.005, 0.5, npoints)
+            for j in range(len(_TUNE_NLAYERS) + 1):
+                nlayers = int(np.sqrt(nlayers_edges[j] * nlayers_edges[j + 1]))
+                layers = np.zeros((nlayers + 2, 4))
+                layers[1:-1, 0] = rng.uniform(10, 100, nlayers)
+                layers[1:, 1] = rng.uniform(-1, 7, nlayers + 1)
+                layers[1:, 3] = rng.uniform(1, 5, nlayers + 1)
+
+                timings = []
+                for backend, t in candidates:
+                    f = self._backend(backend)
+                    # warm up, e.g. compilation of opencl kernels
+                    f(q, layers, threads=t)
+                    best = np.inf
+                    for k in range(repeats):
+                        start = time.perf_counter()
+                        f(q, layers, threads=t)
+                        best = min(best, time.perf_counter() - start)
+                    timings.append(best)
+
+                table[(i, j)] = candidates[int(np.argmin(timings))]
+
+        self.table = table
+        return table
+
+    def save(self, filename=None):
+        """
+        Saves the decision table for this machine to a JSON file, keeping
+        the tables of other machines.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Defaults to `self.filename`.
+        """
+        filename = filename or self.filename
+        tables = _read_autotune_file(filename)
+        tables[self.machine()] = [
+            [i, j, backend, t] for (i, j), (backend, t) in self.table.items()
+        ]
+
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(filename, "w") as f:
+            json.dump(tables, f, indent=1)
+
+    @classmethod
+    def load(cls, filename=None):
+        """
+        Loads the decision table for this machine from a JSON file.
+
+        Parameters
+        ----------
+        filename : str, optional
+            Defaults to `~/.refnx/autotune.json`.
+
+        Returns
+        -------
+        tuned : AutotunedAbeles or None
+            None if there is no table for this machine.
+        """
+        filename = filename or _default_autotune_file()
+        entries = _read_autotune_file(filename).get(cls.machine())
+        if entries is None:
+            return None
+
+        available = available_backends()
+        table = {
+            (i, j): (backend, t)
+            for i, j, backend, t in entries
+            if backend in available
+        }
+        return cls(table=table, filename=filename)
+
+
+def _read_autotune_file(filename):
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _autotuned_abeles(filename=None):
+    """
+    Load the autotuned reflectivity calculator for this machine, tuning it
+    (and saving the decision table) if it hasn't already been done.
+    """
+    tuned = AutotunedAbeles.load(filename)
+    if tuned is None:
+        tuned = AutotunedAbeles(filename=filename)
+        tuned.tune()
+        try:
+            tuned.save()
+        except OSError:
+            warnings.warn(
+                f"Couldn't save the autotuned backends to {tuned.filename}"
+            )
+    return tuned
+
+
+def _abeles_precision(precision="double"):
+    """
+    The reflectivity calculator used for a given numerical precision.
+
+    Parameters
+    ----------
+    precision: {'double', 'mixed'}
+        'double' returns the `abeles` backend currently in use. 'mixed'
+        calculates the layer quantities in single precision, accumulating
+        the matrix product in double precision. Only the 'c' and 'python'
+        backends have a mixed precision calculator, the 'python' calculator is
+        used if another backend is in use.
+
+    Returns
+    -------
+    abeles: callable
+        The callable that calculates the reflectivity
+    """
+    if precision == "double":
+        return abeles
+    if precision != "mixed":
+        raise ValueError("precision must be one of {'double', 'mixed'}")
+
+    try:
+        from refnx.reflect import _creflect as _c
+
+        if abeles is _c.abeles:
+            return partial(_c.abeles, precision=precision)
+    except ImportError:
+        pass
+
+    from refnx.reflect import _reflect as _py
+
+    return partial(_py.abeles, precision=precision)
+
 
 @contextmanager
 def use_reflect_backend(backend="c"):
@@ -190,10 +567,13 @@ def use_reflect_backend(backend="c"):
 
     Parameters
     ----------
-    backend: {'python', 'cython', 'c', 'pyopencl'}, str
+    backend: {'python', 'cython', 'c', 'pyopencl', 'numba', 'auto'}, str
         The function that calculates the reflectivity. Speed should go in the
-        order: c > pyopencl / cython > python. If a particular method is not
-        available the function falls back: cython/pyopencl --> c --> python.
+        order: c / numba > pyopencl / cython > python. If a particular method
+        is not available the function falls back:
+        cython/pyopencl/numba --> c --> python.
+        'auto' uses the fastest backend for the size of each calculation,
+        see :class:`AutotunedAbeles`.
 
     Yields
     ------
@@ -207,12 +587,18 @@ def use_reflect_backend(backend="c"):
     be installed. It may not as accurate as the other options. 'pyopencl' is
     only included for completeness. The 'pyopencl' backend is also harder to
     use with multiprocessing-based parallelism.
+    The function used to calculate polarised neutron reflectivity,
+    `refnx.reflect.reflect_model.pnr`, is also changed, see
+    `get_pnr_backend`.
     """
-    global abeles
+    global abeles, pnr
     f = abeles
+    g = pnr
     abeles = get_reflect_backend(backend)
+    pnr = get_pnr_backend(backend)
     yield abeles
     abeles = f
+    pnr = g
 
 
 class ReflectModel(object):
@@ -245,20 +631,32 @@ class ReflectModel(object):
         module. The option is ignored if using the pure python calculator,
         ``_reflect``. If `threads == -1` then all available processors are
         used.
-    quad_order: int, optional
+    quad_order: int or {'auto', 'ultimate'}, optional
         the order of the Gaussian quadrature polynomial for doing the
         resolution smearing. default = 17. Don't choose less than 13. If
         quad_order == 'ultimate' then adaptive quadrature is used. Adaptive
-        quadrature will always work, but takes a _long_ time (2 or 3 orders
-        of magnitude longer). Fixed quadrature will always take a lot less
+        quadrature will always work, but takes longer (typically an order of
+        magnitude longer). Fixed quadrature will always take a lot less
         time. BUT it won't necessarily work across all samples. For
         example, 13 points may be fine for a thin layer, but will be
-        atrocious at describing a multilayer with bragg peaks.
+        atrocious at describing a multilayer with bragg peaks. If
+        quad_order == 'auto' then the order is chosen for each point from
+        the resolution and the total thickness of the structure, with more
+        points close to critical edges. 'auto' is much more accurate than a
+        fixed order for thick films and multilayers, but 'ultimate' is
+        required for the highest accuracy.
     dq_type: {'pointwise', 'constant'}, optional
         Chooses whether pointwise or constant dQ/Q resolution smearing (see
         `dq` keyword) is used. To use pointwise smearing the `x_err` keyword
         provided to `Objective.model` method must be an array, otherwise the
         smearing falls back to 'constant'.
+    precision: {'double', 'mixed'}, optional
+        The numerical precision of the reflectivity calculation. 'mixed'
+        calculates the layer quantities in single precision, accumulating the
+        matrix product in double precision. It is intended for sampling,
+        where the absolute accuracy is less important, use
+        :func:`precision_deviation` to check that it is acceptable for a
+        given model.
     """
 
     def __init__(
@@ -271,11 +669,13 @@ class ReflectModel(object):
         threads=-1,
         quad_order=17,
         dq_type="pointwise",
+        precision="double",
     ):
         self.name = name
         self._parameters = None
         self.threads = threads
         self.quad_order = quad_order
+        self.precision = precision
 
         # to make it more like a refnx.analysis.Model
         self.fitfunc = None
@@ -292,6 +692,14 @@ class ReflectModel(object):
         self._structure = None
         self.structure = structure
 
+        # reuses transfer matrix calculations between calls to `model`
+        self._evaluator = IncrementalAbeles()
+        # caches the quadrature orders for `quad_order == 'auto'`
+        self._auto_order = _AutoQuadOrder()
+
+    # the last compiled model, see `compile`
+    _compiled = None
+
     def __call__(self, x, p=None, x_err=None):
         r"""
         Calculate the generative model
@@ -312,12 +720,28 @@ class ReflectModel(object):
         """
         return self.model(x, p=p, x_err=x_err)
 
+    def __getstate__(self):
+        # compiled models aren't picklable
+        d = self.__dict__.copy()
+        d.pop("_compiled", None)
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_evaluator" not in state:
+            self._evaluator = IncrementalAbeles()
+        if "_auto_order" not in state:
+            self._auto_order = _AutoQuadOrder()
+        if "precision" not in state:
+            self.precision = "double"
+
     def __repr__(self):
         return (
             f"ReflectModel({self._structure!r}, name={self.name!r},"
             f" scale={self.scale!r}, bkg={self.bkg!r},"
             f" dq={self.dq!r}, threads={self.threads},"
-            f" quad_order={self.quad_order!r}, dq_type={self.dq_type!r})"
+            f" quad_order={self.quad_order!r}, dq_type={self.dq_type!r},"
+            f" precision={self.precision!r})"
         )
 
     @property
@@ -340,6 +764,15 @@ class ReflectModel(object):
     def dq(self, value):
         self._dq.value = value
 
+    @property
+    def auto_quad_order(self):
+        """
+        np.ndarray or None - the Gaussian quadrature order used for each point
+        by the most recent pointwise resolution smeared calculation with
+        `quad_order == 'auto'`.
+        """
+        return self._auto_order.orders
+
     @property
     def scale(self):
         r"""
@@ -384,21 +817,251 @@ class ReflectModel(object):
         reflectivity : np.ndarray
             Calculated reflectivity
 
+        Notes
+        -----
+        If `p` is a 2D array then the model is calculated for each of its rows
+        with a single batched reflectivity calculation, see
+        :meth:`ReflectModel.model_batch`.
+
+        Successive calculations that only differ in layers close to the
+        backing medium are calculated incrementally, and repeated
+        :class:`refnx.reflect.Stack` components are calculated by raising
+        their transfer matrices to a power, see :class:`IncrementalAbeles`.
         """
+        if p is not None and np.ndim(p) == 2:
+            return self.model_batch(x, p, x_err=x_err)
+
         if p is not None:
             self.parameters.pvals = np.array(p)
         if x_err is None or self.dq_type == "constant":
             # fallback to what this object was constructed with
             x_err = float(self.dq)
 
-        return reflectivity(
+        slabs = self.structure.slabs()[..., :4]
+        kwds = {}
+        repeats = getattr(self.structure, "_repeats", None)
+        if repeats:
+            kwds["repeats"] = repeats
+        if self.precision != "double":
+            kwds["precision"] = self.precision
+        kernel = partial(self._evaluator, **kwds)
+
+        quad_order = self.quad_order
+        if (
+            isinstance(quad_order, str)
+            and quad_order == "auto"
+            and isinstance(x_err, np.ndarray)
+            and x_err.size == np.size(x)
+        ):
+            quad_order = self._auto_order(
+                np.asfarray(x).flatten(), np.asfarray(x_err).flatten(), slabs
+            )
+
+        return _reflectivity(
             x,
-            self.structure.slabs()[..., :4],
+            slabs,
             scale=self.scale.value,
             bkg=self.bkg.value,
             dq=x_err,
             threads=self.threads,
-            quad_order=self.quad_order,
+            quad_order=quad_order,
+            kernel=kernel,
+        )
+
+    def model_batch(self, x, p, x_err=None, setp=None):
+        r"""
+        Calculate the reflectivity of this model for many parameter sets at
+        once.
+
+        Parameters
+        ----------
+        x : float or np.ndarray
+            q values for the calculation.
+        p : array-like
+            2D array of parameter sets, shape (K, N).
+        x_err : np.ndarray
+            dq resolution smearing values for the dataset being considered.
+        setp : callable, optional
+            Called with each row of `p` to set the parameter values, e.g.
+            `Objective.setp`. By default each row is used to set
+            `self.parameters.pvals`.
+
+        Returns
+        -------
+        reflectivity : np.ndarray
+            Calculated reflectivity, has shape `(K,) + x.shape`.
+
+        Notes
+        -----
+        The slabs for each parameter set are gathered, with all the
+        reflectivities then being calculated in a single batched call. The
+        parameters are left with the values of the last parameter set.
+
+        If `setp` isn't supplied, `p` contains values for the varying
+        parameters, and the model can be compiled (see
+        :meth:`ReflectModel.compile`), then the slabs are gathered directly
+        from `p`.
+        """
+        if setp is None:
+            varying = list(
+                f_unique(
+                    param for param in flatten(self.parameters) if param.vary
+                )
+            )
+            if np.shape(p)[-1] == len(varying):
+                try:
+                    compiled = self.compile(varying)
+                except ValueError:
+                    pass
+                else:
+                    y = compiled(x, p, x_err=x_err)
+                    self.parameters.pvals = np.array(p[-1])
+                    return y
+
+            def setp(pvals):
+                self.parameters.pvals = np.array(pvals)
+
+        # gather the slabs for each of the parameter sets, then calculate all
+        # of them in one go.
+        slabs = []
+        scales = []
+        bkgs = []
+        dqs = []
+        for pvals in p:
+            setp(pvals)
+            slabs.append(self.structure.slabs()[..., :4])
+            scales.append(self.scale.value)
+            bkgs.append(self.bkg.value)
+            dqs.append(float(self.dq))
+
+        return self._batch_reflectivity(
+            x, slabs, np.array(scales), np.array(bkgs), np.array(dqs), x_err
+        )
+
+    def _batch_reflectivity(self, x, slabs, scales, bkgs, dqs, x_err=None):
+        # reflectivity of a batch of slabs, see `model_batch`.
+        if x_err is not None and self.dq_type != "constant":
+            return reflectivity(
+                x,
+                slabs,
+                scale=scales,
+                bkg=bkgs,
+                dq=x_err,
+                threads=self.threads,
+                quad_order=self.quad_order,
+                precision=self.precision,
+            )
+
+        # the constant dq/q resolution could vary between parameter sets,
+        # calculate each distinct resolution as a separate batch.
+        y = np.empty((len(slabs),) + np.shape(x), np.float64)
+        for dq in np.unique(dqs):
+            idx = np.flatnonzero(dqs == dq)
+            y[idx] = reflectivity(
+                x,
+                [slabs[i] for i in idx],
+                scale=scales[idx],
+                bkg=bkgs[idx],
+                dq=float(dq),
+                threads=self.threads,
+                quad_order=self.quad_order,
+                precision=self.precision,
+            )
+        return y
+
+    def compile(self, parameters=None):
+        r"""
+        Compiles the model into a function of a vector of parameter values,
+        which doesn't use the Parameter objects.
+
+        Parameters
+        ----------
+        parameters : sequence of refnx.analysis.Parameter, optional
+            The Parameters corresponding to the entries of the vector. By
+            default the varying parameters of the model are used.
+
+        Returns
+        -------
+        compiled : callable
+            `compiled(x, p, x_err=None)` calculates the reflectivity for a
+            vector of parameter values, `p`. If `p` has shape
+            `(K, len(parameters))` the reflectivity is calculated for each
+            row, with shape `(K,) + x.shape`.
+
+        Raises
+        ------
+        ValueError
+            If the structure can't be compiled, see
+            :meth:`refnx.reflect.Structure.compile`.
+
+        Notes
+        -----
+        The last compiled model is cached, and is reused until the values of
+        the other Parameters, their constraints, or the structure changes.
+        Only structures without additional log-probability terms can be
+        compiled, i.e. `ReflectModel.logp` is zero.
+        """
+        if parameters is None:
+            parameters = f_unique(
+                p for p in flatten(self.parameters) if p.vary
+            )
+        parameters = list(parameters)
+
+        compiled = self._compiled
+        if (
+            compiled is None
+            or compiled.structure is not self.structure
+            or len(compiled.parameters) != len(parameters)
+            or any(a is not b for a, b in zip(compiled.parameters, parameters))
+            or compiled.stale
+        ):
+            compiled = _CompiledReflectModel(self, parameters)
+            self._compiled = compiled
+        return compiled
+
+    def jacobian(self, x, parameters, x_err=None):
+        r"""
+        Derivatives of the reflectivity with respect to Parameters.
+
+        Parameters
+        ----------
+        x : float or np.ndarray
+            q values for the calculation.
+        parameters : sequence of refnx.analysis.Parameter
+            Parameters to differentiate with respect to. Parameters that don't
+            affect this model have zero derivative.
+        x_err : np.ndarray
+            dq resolution smearing values for the dataset being considered.
+
+        Returns
+        -------
+        jac : np.ndarray or None
+            Derivatives of the reflectivity, has shape
+            `(len(parameters),) + x.shape`. `None` is returned if analytic
+            derivatives aren't available, e.g. if the number of slabs in a
+            structure depends on one of the Parameters, or adaptive
+            quadrature is used for resolution smearing.
+
+        Notes
+        -----
+        The analytic derivatives of the reflectivity with respect to each of
+        the slabs are chained to the Parameters via the slab representation
+        of the structure.
+        """
+
+        def state():
+            return (
+                [self.structure.slabs()[..., :4]],
+                np.array([self.scale.value]),
+                self.bkg.value,
+                float(self.dq),
+            )
+
+        if x_err is None or self.dq_type == "constant":
+            x_err = None
+
+        return _model_jacobian(
+            x, parameters, state, x_err, self.quad_order, self.threads
         )
 
     def logp(self):
@@ -444,8 +1107,54 @@ class ReflectModel(object):
         return self._parameters
 
 
+class _CompiledReflectModel(object):
+    """
+    Calculates the reflectivity of a :class:`ReflectModel` from a vector of
+    parameter values, see :meth:`ReflectModel.compile`.
+    """
+
+    def __init__(self, model, parameters):
+        self.model = model
+        self.structure = model.structure
+        self.parameters = list(parameters)
+        self.slabs = model.structure.compile(self.parameters)
+
+        self._fixed = []
+        self._instrument = []
+        for param in [model.scale, model.bkg, model.dq]:
+            f, fixed = _vectorised(param, self.parameters)
+            self._instrument.append(f)
+            self._fixed.extend(fixed)
+
+    @property
+    def stale(self):
+        return self.slabs.stale or not _unchanged(self._fixed)
+
+    def __call__(self, x, p, x_err=None):
+        p = np.asarray(p, dtype=np.float64)
+        pvals = np.atleast_2d(p)
+        shape = (len(pvals),)
+        scales, bkgs, dqs = [
+            np.broadcast_to(f(pvals), shape) for f in self._instrument
+        ]
+
+        y = self.model._batch_reflectivity(
+            x, self.slabs(pvals)[..., :4], scales, bkgs, dqs, x_err=x_err
+        )
+        if p.ndim == 1:
+            return y[0]
+        return y
+
+
 def reflectivity(
-    q, slabs, scale=1.0, bkg=0.0, dq=5.0, quad_order=17, threads=-1
+    q,
+    slabs,
+    scale=1.0,
+    bkg=0.0,
+    dq=5.0,
+    quad_order=17,
+    threads=-1,
+    precision="double",
 ):
     r"""
     Abeles matrix formalism for calculating reflectivity from a stratified
@@ -457,7 +1166,7 @@ def reflectivity(
         The qvalues required for the calculation.
         :math:`Q=\frac{4Pi}{\lambda}\sin(\Omega)`.
         Units = Angstrom**-1
-    slabs : np.ndarray
+    slabs : np.ndarray or sequence of np.ndarray
         coefficients required for the calculation, has shape (2 + N, 4),
         where N is the number of layers
 
@@ -489,12 +1198,18 @@ def reflectivity(
         - slabs[-1, 3]
            roughness between backing and layer N
 
-    scale : float
+        If `slabs` has shape (K, 2 + N, 4), or is a sequence of K slab
+        arrays (which may have differing numbers of layers), then the
+        reflectivity of all K structures is calculated in a single batch.
+        The returned array then has shape `(K,) + q.shape`.
+    scale : float or array_like
         scale factor. All model values are multiplied by this value before
-        the background is added
-    bkg : float
-        Q-independent constant background added to all model values.
-    dq : float or np.ndarray, optional
+        the background is added. For a batch of structures this can be an
+        array of shape (K,).
+    bkg : float or array_like
+        Q-independent constant background added to all model values. For a
+        batch of structures this can be an array of shape (K,).
+    dq : float, np.ndarray or CompactKernel, optional
         - `dq == 0`
            no resolution smearing is employed.
         - `dq` is a float
@@ -510,21 +1225,36 @@ def reflectivity(
            (PDF). `dqvals` will have the shape (qvals.shape, 2, M).  There are
            `M` points in the kernel. `dq[:, 0, :]` holds the q values for the
            kernel, `dq[:, 1, :]` gives the corresponding probability.
-    quad_order: int, optional
+        - `dq` is a :class:`refnx.util._resolution_kernel.CompactKernel`
+           a compacted form of the individual resolution kernels, see
+           :func:`refnx.util._resolution_kernel.resolution_kernel`.
+    quad_order: int or {'auto', 'ultimate'}, optional
         the order of the Gaussian quadrature polynomial for doing the
         resolution smearing. default = 17. Don't choose less than 13. If
         quad_order == 'ultimate' then adaptive quadrature is used. Adaptive
-        quadrature will always work, but takes a _long_ time (2 or 3 orders
-        of magnitude longer). Fixed quadrature will always take a lot less
+        quadrature will always work, but takes longer (typically an order of
+        magnitude longer). Fixed quadrature will always take a lot less
         time. BUT it won't necessarily work across all samples. For
         example, 13 points may be fine for a thin layer, but will be
-        atrocious at describing a multilayer with bragg peaks.
+        atrocious at describing a multilayer with bragg peaks. If
+        quad_order == 'auto' then the order is chosen for each point from
+        the resolution and the total thickness of the structure, with more
+        points close to critical edges. 'auto' is much more accurate than a
+        fixed order for thick films and multilayers, but 'ultimate' is
+        required for the highest accuracy.
     threads: int, optional
         Specifies the number of threads for parallel calculation. This
         option is only applicable if you are using the ``_creflect``
         module. The option is ignored if using the pure python calculator,
         ``_reflect``. If `threads == -1` then all available processors are
         used.
+    precision: {'double', 'mixed'}, optional
+        If 'mixed' the wavevectors, reflectances and characteristic matrices
+        of each layer are calculated in single precision, with the matrix
+        product being accumulated in double precision. Only the 'c' and
+        'python' backends have a mixed precision calculator, the 'python'
+        calculator is used if another backend is in use. See
+        :func:`precision_deviation` for the size of the error this introduces.
 
     Example
     -------
@@ -538,13 +1268,70 @@ def reflectivity(
     >>> print(reflectivity(q, slabs))
 
     """
+    return _reflectivity(
+        q,
+        slabs,
+        scale=scale,
+        bkg=bkg,
+        dq=dq,
+        quad_order=quad_order,
+        threads=threads,
+        precision=precision,
+    )
+
+
+def _reflectivity(
+    q,
+    slabs,
+    scale=1.0,
+    bkg=0.0,
+    dq=5.0,
+    quad_order=17,
+    threads=-1,
+    kernel=None,
+    precision="double",
+):
+    """
+    Resolution smeared reflectivity, see `reflectivity`. The unsmeared
+    reflectivity is calculated by `kernel`, which has the same signature as
+    `abeles` (the default, at the requested `precision`). If a `kernel` is
+    supplied `slabs` is passed to it as is, and `precision` is ignored.
+    """
+    if kernel is None:
+        kernel = _abeles_precision(precision)
+
+        if not isinstance(slabs, np.ndarray):
+            # a sequence of structures, possibly with different numbers of
+            # layers
+            slabs = _pad_slabs(slabs)
+
+    if (
+        isinstance(slabs, np.ndarray)
+        and slabs.ndim == 3
+        and (np.ndim(scale) or np.ndim(bkg))
+    ):
+        # a scale factor and background for each structure in the batch
+        shape = (-1,) + (1,) * np.ndim(q)
+        rvals = _reflectivity(
+            q,
+            slabs,
+            dq=dq,
+            quad_order=quad_order,
+            threads=threads,
+            kernel=kernel,
+        )
+        return np.reshape(scale, shape) * rvals + np.reshape(bkg, shape)
+
     # constant dq/q smearing
     if isinstance(dq, numbers.Real) and float(dq) == 0:
-        return abeles(q, slabs, scale=scale, bkg=bkg, threads=threads)
+        return kernel(q, slabs, scale=scale, bkg=bkg, threads=threads)
     elif isinstance(dq, numbers.Real):
         dq = float(dq)
         return (
-            scale * _smeared_abeles_constant(q, slabs, dq, threads=threads)
+            scale
+            * _smeared_abeles_constant(
+                q, slabs, dq, threads=threads, kernel=kernel
+            )
         ) + bkg
 
     # point by point resolution smearing (each q point has different dq/q)
@@ -552,16 +1339,25 @@ def reflectivity(
         dqvals_flat = dq.flatten()
         qvals_flat = q.flatten()
 
+        if isinstance(quad_order, str) and quad_order == "auto":
+            quad_order = _auto_quad_order(
+                qvals_flat, dqvals_flat, *_length_scales(slabs)
+            )
+
         # adaptive quadrature
-        if quad_order == "ultimate":
+        if isinstance(quad_order, str) and quad_order == "ultimate":
             smeared_rvals = (
                 scale
                 * _smeared_abeles_adaptive(
-                    qvals_flat, slabs, dqvals_flat, threads=threads
+                    qvals_flat,
+                    slabs,
+                    dqvals_flat,
+                    threads=threads,
+                    kernel=kernel,
                 )
                 + bkg
             )
-            return smeared_rvals.reshape(q.shape)
+            return smeared_rvals.reshape(smeared_rvals.shape[:-1] + q.shape)
         # fixed order quadrature
         else:
             smeared_rvals = (
@@ -572,87 +1368,571 @@ def reflectivity(
                     dqvals_flat,
                     quad_order=quad_order,
                     threads=threads,
+                    kernel=kernel,
                 )
                 + bkg
             )
-            return np.reshape(smeared_rvals, q.shape)
+            return np.reshape(
+                smeared_rvals, smeared_rvals.shape[:-1] + q.shape
+            )
 
     # resolution kernel smearing
     elif (
         isinstance(dq, np.ndarray)
         and dq.ndim == q.ndim + 2
         and dq.shape[0 : q.ndim] == q.shape
-    ):
-
-        qvals_for_res = dq[:, 0, :]
-        # work out the reflectivity at the kernel evaluation points
-        smeared_rvals = abeles(qvals_for_res, slabs, threads=threads)
-
-        # multiply by probability
-        smeared_rvals *= dq[:, 1, :]
-
-        # now do simpson integration
-        rvals = scipy.integrate.simps(smeared_rvals, x=dq[:, 0, :])
-
-        return scale * rvals + bkg
+    ) or (isinstance(dq, CompactKernel) and len(dq) == q.size):
+        rvals = _smeared_kernel(dq, slabs, threads=threads, kernel=kernel)
+        return scale * np.reshape(rvals, rvals.shape[:-1] + q.shape) + bkg
 
     return None
 
 
-@lru_cache(maxsize=128)
-def gauss_legendre(n):
+def _incoherent_abeles(q, w, scale=1.0, bkg=0.0, threads=-1, weights=None):
     """
-    Calculate gaussian quadrature abscissae and weights
+    Area weighted (incoherent) sum of the unsmeared reflectivities of a batch
+    of structures, used as a `kernel` by `_reflectivity`.
+
     Parameters
     ----------
-    n : int
-        Gaussian quadrature order.
+    q : np.ndarray
+        Q values to evaluate the reflectivity at
+    w : sequence of np.ndarray
+        The slabs of M * S structures.
+    scale : float
+        Multiply the sum by this value.
+    bkg : float
+        Added to the sum.
+    threads : int
+        number of threads for the reflectivity calculation
+    weights : np.ndarray
+        The scale factor for each of the S structures, has shape (S,) or
+        (M, S) for M sets of structures.
+
     Returns
     -------
-    (x, w) : tuple
-        The abscissae and weights for Gauss Legendre integration.
-    """
-    return scipy.special.p_roots(n)
-
-
-def _smearkernel(x, w, q, dq, threads):
+    reflectivity : np.ndarray
+        The sum, has shape `weights.shape[:-1] + q.shape`.
     """
-    Adaptive Gaussian quadrature integration
+    weights = np.asfarray(weights)
+    if len({np.shape(slabs) for slabs in w}) == 1:
+        rvals = abeles(q, np.stack(w), threads=threads)
+    else:
+        # avoid padding the structures to the same number of layers
+        rvals = np.stack([abeles(q, slabs, threads=threads) for slabs in w])
+    rvals = np.reshape(rvals, (-1, weights.shape[-1], np.size(q)))
+    rvals = np.sum(rvals * np.reshape(weights, rvals.shape[:2] + (1,)), 1)
+    rvals = np.reshape(rvals, weights.shape[:-1] + np.shape(q))
+    return scale * rvals + bkg
+
+
+def precision_deviation(model, x, x_err=None, p=None, precision="mixed"):
+    r"""
+    Maximum relative deviation of a reduced precision reflectivity
+    calculation from the double precision calculation.
 
     Parameters
     ----------
-    x : float
-        Independent variable for integration.
-    w : array-like
-        The uniform slab model parameters in 'layer' form.
-    q : float
-        Nominal mean Q of normal distribution
-    dq : float
-        FWHM of a normal distribution.
-    threads : int
-        number of threads for parallel calculation
+    model : ReflectModel
+        The model to check.
+    x : np.ndarray
+        q values for the calculation, this should span the q range that the
+        model is going to be used for.
+    x_err : np.ndarray, optional
+        dq resolution smearing values for the dataset being considered.
+    p : array-like, optional
+        Parameter values to check. If `p` is a 2D array then each of its rows
+        is checked, e.g. a selection of samples from a chain. By default the
+        current parameter values are used.
+    precision : {'mixed'}, optional
+        The precision to compare to the double precision calculation.
+
     Returns
     -------
-    reflectivity : float
-        Model reflectivity multiplied by the probability density function
-        evaluated at a given distance, x, away from the mean Q value.
+    deviation : float
+        The maximum of :math:`|R_{precision} / R_{double} - 1|` over `x`
+        (and `p`).
+
+    Notes
+    -----
+    The deviation is largest where the reflectivity is smallest, e.g. at the
+    minima of the Kiessig fringes and at high q, so `x` should cover the
+    entire q range of the data. Mixed precision is typically accurate to
+    :math:`10^{-3}` - :math:`10^{-2}`, which is often smaller than the
+    uncertainty of the data being analysed, but it should be checked that
+    this deviation doesn't change the log-likelihood significantly.
+
+    Examples
+    --------
+
+    >>> from refnx.reflect import SLD, ReflectModel, precision_deviation
+    >>> air = SLD(0)
+    >>> film = SLD(3.47)(250, 3)
+    >>> si = SLD(2.07)(0, 3)
+    >>> model = ReflectModel(air | film | si)
+    >>> q = np.linspace(0.005, 0.3, 1001)
+    >>> deviation = precision_deviation(model, q)
     """
-    prefactor = 1 / np.sqrt(2 * np.pi)
-    gauss = prefactor * np.exp(-0.5 * x * x)
-    localq = q + x * dq / _FWHM
-    return abeles(localq, w, threads=threads) * gauss
+    original = model.precision
+    try:
+        model.precision = "double"
+        double = model.model(x, p=p, x_err=x_err)
+        model.precision = precision
+        reduced = model.model(x, p=p, x_err=x_err)
+    finally:
+        model.precision = original
 
+    return float(np.max(np.abs(reduced / double - 1)))
 
-def _smeared_abeles_adaptive(qvals, w, dqvals, threads=-1):
-    """
-    Resolution smearing that uses adaptive Gaussian quadrature integration
-    for the convolution.
+
+def reflectivity_jacobian(q, slabs, scale=1.0, dq=5.0, quad_order=17):
+    r"""
+    Derivatives of the (resolution smeared) reflectivity with respect to each
+    of the slab parameters.
 
     Parameters
     ----------
-    qvals : array-like
-        The Q values for evaluation
-    w : array-like
+    q : np.ndarray
+        The qvalues required for the calculation.
+        :math:`Q=\frac{4Pi}{\lambda}\sin(\Omega)`.
+        Units = Angstrom**-1
+    slabs : np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 4),
+        where N is the number of layers. See `reflectivity` for details.
+    scale : float
+        scale factor. All model values are multiplied by this value.
+    dq : float or np.ndarray, optional
+        Resolution smearing, see `reflectivity` for details.
+    quad_order: int or {'auto', 'ultimate'}, optional
+        the order of the Gaussian quadrature polynomial for doing the
+        resolution smearing.
+
+    Returns
+    -------
+    jac : np.ndarray or None
+        `jac[j, k]` is the derivative of the reflectivity with respect to
+        `slabs[j, k]` at each q value, has shape `(2 + N, 4) + q.shape`.
+        `None` is returned if the derivatives can't be calculated for the
+        requested resolution smearing (`quad_order == 'ultimate'`).
+
+    Notes
+    -----
+    Resolution smearing is linear in the reflectivity, so the derivatives are
+    smeared in exactly the same way as the reflectivity. The derivatives are
+    calculated with the numpy backend, regardless of the reflectivity backend
+    that is in use.
+    """
+    q = np.asfarray(q)
+    slabs = np.asfarray(slabs)[..., :4]
+    shape = slabs.shape + q.shape
+
+    def kernel(x, w, threads=-1):
+        # the smearing functions treat the leading axis as a batch
+        jac = abeles_jacobian(x, w)
+        return np.reshape(jac, (-1,) + np.shape(x))
+
+    if isinstance(dq, numbers.Real) and float(dq) == 0:
+        jac = kernel(q, slabs)
+    elif isinstance(dq, numbers.Real):
+        jac = _smeared_abeles_constant(q, slabs, float(dq), kernel=kernel)
+    elif isinstance(dq, np.ndarray) and dq.size == q.size:
+        if isinstance(quad_order, str) and quad_order == "ultimate":
+            return None
+        if isinstance(quad_order, str) and quad_order == "auto":
+            quad_order = _auto_quad_order(
+                q.flatten(), dq.flatten(), *_length_scales(slabs)
+            )
+        jac = _smeared_abeles_pointwise(
+            q.flatten(),
+            slabs,
+            dq.flatten(),
+            quad_order=quad_order,
+            kernel=kernel,
+        )
+    elif (
+        isinstance(dq, np.ndarray)
+        and dq.ndim == q.ndim + 2
+        and dq.shape[0 : q.ndim] == q.shape
+    ) or (isinstance(dq, CompactKernel) and len(dq) == q.size):
+        jac = _smeared_kernel(dq, slabs, kernel=kernel)
+    else:
+        return None
+
+    return scale * np.reshape(jac, shape)
+
+
+def _model_jacobian(x, parameters, state, dq, quad_order, threads):
+    """
+    Derivatives of a reflectivity model with respect to Parameters.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        q values for the calculation.
+    parameters : sequence of refnx.analysis.Parameter
+        Parameters to differentiate with respect to.
+    state : callable
+        `state() -> (slabs, scales, bkg, dq)` returns the slabs for each
+        structure in the model, the scale factor for each structure, the
+        background and the dq/q resolution of the model.
+    dq : np.ndarray or None
+        Pointwise resolution smearing. If `None` then the dq/q resolution of
+        the model is used.
+    quad_order : int
+        the order of the Gaussian quadrature polynomial for doing the
+        resolution smearing.
+    threads : int
+        number of threads for the reflectivity calculation
+
+    Returns
+    -------
+    jac : np.ndarray or None
+        Has shape `(len(parameters),) + x.shape`. `None` is returned if the
+        analytic derivatives aren't available.
+
+    Notes
+    -----
+    The slabs are a cheap function of the Parameters (compared to the
+    reflectivity), so the derivatives of the slabs, scale factors and
+    background with respect to each Parameter are obtained by central
+    differences. These are then chained with the analytic derivatives of the
+    reflectivity with respect to the slabs.
+    """
+    x = np.asfarray(x)
+    slabs, scales, bkg, model_dq = state()
+    nparams = len(parameters)
+
+    dslabs = [np.zeros((nparams,) + s.shape) for s in slabs]
+    dscales = np.zeros((nparams, len(scales)))
+    dbkg = np.zeros(nparams)
+
+    for i, param in enumerate(parameters):
+        val = param.value
+        step = np.finfo(np.float64).eps ** (1 / 3) * max(abs(val), 1.0)
+        try:
+            param.value = val + step
+            plus = state()
+            param.value = val - step
+            minus = state()
+        finally:
+            param.value = val
+
+        # number of slabs changed, or the resolution depends on the Parameter
+        if any(p.shape != m.shape for p, m in zip(plus[0], minus[0])):
+            return None
+        if dq is None and plus[3] != minus[3]:
+            return None
+
+        for ds, p, m in zip(dslabs, plus[0], minus[0]):
+            ds[i] = (p - m) / (2 * step)
+        dscales[i] = (plus[1] - minus[1]) / (2 * step)
+        dbkg[i] = (plus[2] - minus[2]) / (2 * step)
+
+    if dq is None:
+        dq = model_dq
+
+    jac = np.zeros((nparams,) + x.shape)
+    for i, (slab, scale) in enumerate(zip(slabs, scales)):
+        # only calculate the derivatives that are needed
+        if np.any(dslabs[i]):
+            jac_slabs = reflectivity_jacobian(
+                x, slab, scale=scale, dq=dq, quad_order=quad_order
+            )
+            if jac_slabs is None:
+                return None
+            jac += np.tensordot(dslabs[i], jac_slabs, axes=2)
+        if np.any(dscales[:, i]):
+            rvals = reflectivity(
+                x,
+                slab,
+                bkg=0.0,
+                dq=dq,
+                quad_order=quad_order,
+                threads=threads,
+            )
+            jac += np.multiply.outer(dscales[:, i], rvals)
+
+    jac += np.reshape(dbkg, (-1,) + (1,) * x.ndim)
+    return jac
+
+
+class IncrementalAbeles(object):
+    r"""
+    Calculates reflectivity with the Abeles matrix formalism, reusing the
+    characteristic matrix products of earlier calculations.
+
+    Parameters
+    ----------
+    max_fraction : float, optional
+        An incremental calculation is only made if no more than this
+        fraction of the characteristic matrices needs to be recalculated.
+        Otherwise the reflectivity is calculated from scratch by the
+        `abeles` backend currently in use.
+    maxgrids : int, optional
+        The number of distinct q grids that calculations are cached for.
+
+    Notes
+    -----
+    Instances are called in the same way as `abeles`, and are used by
+    :class:`ReflectModel` to calculate the unsmeared reflectivity at the
+    (fixed) q values required for resolution smearing.
+
+    During a fit it's common for only a few layers to change between
+    successive calculations, e.g. when finite difference derivatives are
+    estimated. For each q grid an *anchor* calculation is stored, consisting
+    of the slabs along with partial products of the characteristic matrices
+    (every :math:`\sqrt{N}` layers). If the first difference between new
+    slabs and the anchor is close enough to the backing medium, the matrix
+    product is resumed from the last stored partial product before that
+    difference.
+
+    A new anchor is only calculated (at ~twice the cost of the C backend)
+    when successive calls differ by a few layers near the backing medium, so
+    there is little overhead when all the layers change on every call (e.g.
+    during MCMC sampling or differential evolution). Calculations for a batch
+    of structures always use the `abeles` backend.
+
+    A `repeats` keyword can also be supplied, a list of `(start, stop,
+    period)` tuples proposing that `layers[start:stop]` repeats every
+    `period` layers (e.g. from a :class:`refnx.reflect.Stack`). For a
+    multilayer with many repeats the product of the characteristic matrices
+    in each period is raised to the number of repeats, by repeated squaring.
+    The cost then scales with the logarithm of the number of repeats, rather
+    than linearly. Proposed repeats are checked against `layers` before use.
+
+    A `precision` keyword selects the calculator used for calculations from
+    scratch, see `ReflectModel`. The reflectivity of an anchor is calculated
+    at that precision, but the incremental and repeated stack calculations
+    are always made in double precision. Because a mixed precision
+    calculation is several times faster than a double precision one, an
+    incremental calculation is only made if it's a correspondingly smaller
+    fraction of the work.
+    """
+
+    def __init__(self, max_fraction=0.25, maxgrids=4):
+        self.max_fraction = max_fraction
+        self.maxgrids = maxgrids
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"IncrementalAbeles(max_fraction={self.max_fraction!r},"
+            f" maxgrids={self.maxgrids!r})"
+        )
+
+    def __getstate__(self):
+        # the cached calculations are large, don't pickle them.
+        return {"max_fraction": self.max_fraction, "maxgrids": self.maxgrids}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __call__(
+        self,
+        q,
+        layers,
+        scale=1.0,
+        bkg=0.0,
+        threads=-1,
+        repeats=None,
+        precision="double",
+    ):
+        layers = np.asfarray(layers)
+        kernel = _abeles_precision(precision)
+        # the fraction of the characteristic matrices that are calculated in
+        # double precision by numpy, for the same cost as calculating all of
+        # them with `kernel`.
+        cost = 1.0 if precision == "double" else 0.25
+
+        if repeats and layers.ndim == 2:
+            blocks = _periodic_blocks(layers, repeats)
+            # the numpy calculation of a characteristic matrix takes ~twice
+            # as long as the C backend.
+            nmatrices = len(layers) - 1
+            ncalc = nmatrices + sum(
+                period * (1 - nperiods) + 2 * np.log2(nperiods)
+                for start, period, nperiods in blocks
+            )
+            if 2 * ncalc < cost * nmatrices:
+                return scale * _abeles_repeats(q, layers, blocks) + bkg
+
+        # another thread is using the cache
+        if layers.ndim != 2 or not self._lock.acquire(blocking=False):
+            return kernel(q, layers, scale=scale, bkg=bkg, threads=threads)
+
+        try:
+            rvals = self._reflectivity(q, layers, threads, precision)
+        finally:
+            self._lock.release()
+        return scale * rvals + bkg
+
+    def _worthwhile(self, start, nmatrices, cost=1.0):
+        return nmatrices - start <= cost * self.max_fraction * nmatrices
+
+    def _reflectivity(self, q, layers, threads, precision):
+        qvals = np.asfarray(q)
+        flatq = qvals.ravel()
+        kernel = _abeles_precision(precision)
+        cost = 1.0 if precision == "double" else 0.25
+
+        # anchors are specific to the precision that calculated their
+        # reflectivity
+        key = (qvals.shape, flatq.tobytes(), precision)
+        grid = self._grids.pop(key, {"anchor": None, "last": None})
+        self._grids[key] = grid
+        while len(self._grids) > self.maxgrids:
+            self._grids.popitem(last=False)
+
+        last = grid["last"]
+        grid["last"] = np.copy(layers)
+
+        nmatrices = len(layers) - 1
+        stride = max(int(np.sqrt(nmatrices)), 1)
+
+        start = _first_changed_matrix(grid["anchor"], layers)
+        if start < nmatrices and not self._worthwhile(
+            start // stride * stride, nmatrices, cost
+        ):
+            # only a few layers near the backing changed since the last
+            # call, those calls are probably varying around the slabs of
+            # the last call. Make them the new anchor.
+            if self._worthwhile(
+                _first_changed_matrix(last, layers) // stride * stride,
+                nmatrices,
+                cost,
+            ):
+                self._new_anchor(grid, flatq, last, stride, kernel)
+                start = _first_changed_matrix(last, layers)
+            else:
+                return kernel(qvals, layers, threads=threads)
+
+        if start == nmatrices:
+            # the same as the anchor
+            return np.reshape(grid["rvals"], qvals.shape)
+
+        idx = start // stride
+        m00, m01, m10, m11 = _abeles_product(
+            flatq,
+            layers,
+            idx * stride,
+            nmatrices,
+            mtot=grid["products"][idx],
+        )
+        r = m01 / m00
+        return np.reshape(np.real(r * np.conj(r)), qvals.shape)
+
+    def _new_anchor(self, grid, flatq, layers, stride, kernel):
+        nmatrices = len(layers) - 1
+        products = [None]
+        for start in range(0, nmatrices, stride):
+            products.append(
+                _abeles_product(
+                    flatq,
+                    layers,
+                    start,
+                    min(start + stride, nmatrices),
+                    mtot=products[-1],
+                )
+            )
+
+        grid["anchor"] = layers
+        grid["products"] = products
+        if kernel is abeles:
+            m00, m01, m10, m11 = products[-1]
+            r = m01 / m00
+            grid["rvals"] = np.real(r * np.conj(r))
+        else:
+            # repeated calculations give the same result as `kernel`
+            grid["rvals"] = kernel(flatq, layers)
+
+
+def _first_changed_matrix(old, new):
+    """
+    Index of the first characteristic matrix that differs between two sets
+    of slabs. Matrix `j` depends on `slabs[j]` and `slabs[j + 1]`.
+    """
+    if old is None or old.shape != new.shape:
+        return 0
+    changed = np.flatnonzero(np.any(old != new, axis=1))
+    if not changed.size:
+        return len(new) - 1
+    return max(changed[0] - 1, 0)
+
+
+@lru_cache(maxsize=128)
+def gauss_legendre(n):
+    """
+    Calculate gaussian quadrature abscissae and weights
+    Parameters
+    ----------
+    n : int
+        Gaussian quadrature order.
+    Returns
+    -------
+    (x, w) : tuple
+        The abscissae and weights for Gauss Legendre integration.
+    """
+    return scipy.special.p_roots(n)
+
+
+def _gauss_kronrod():
+    # Abscissae and weights for 15 point Gauss-Kronrod quadrature on [-1, 1],
+    # and the embedded 7 point Gauss-Legendre rule (from QUADPACK).
+    xgk = np.array(
+        [
+            0.991455371120812639206854697526329,
+            0.949107912342758524526189684047851,
+            0.864864423359769072789712788640926,
+            0.741531185599394439863864773280788,
+            0.586087235467691130294144845693013,
+            0.405845151377397166906606412076961,
+            0.207784955007898467600689403773245,
+            0.000000000000000000000000000000000,
+        ]
+    )
+    wgk = np.array(
+        [
+            0.022935322010529224963732008058970,
+            0.063092092629978553290700663189204,
+            0.104790010322250183839876322541518,
+            0.140653259715525918745189590510238,
+            0.169004726639267902826583426598550,
+            0.190350578064785409913256402421014,
+            0.204432940075298892414161999234649,
+            0.209482141084727828012999174891714,
+        ]
+    )
+    wg = np.zeros(8)
+    wg[1::2] = [
+        0.129484966168869693270611432679082,
+        0.279705391489276667901467771423780,
+        0.381830050505118944950369775488975,
+        0.417959183673469387755102040816327,
+    ]
+    x = np.concatenate((-xgk[:-1], xgk[::-1]))
+    return (
+        x,
+        np.concatenate((wgk[:-1], wgk[::-1])),
+        np.concatenate((wg[:-1], wg[::-1])),
+    )
+
+
+_GK15_X, _GK15_WK, _GK15_WG = _gauss_kronrod()
+
+
+def _smeared_abeles_adaptive(
+    qvals, w, dqvals, threads=-1, kernel=None, rtol=1e-10, maxiter=20
+):
+    """
+    Resolution smearing that uses adaptive Gauss-Kronrod integration for the
+    convolution.
+
+    Parameters
+    ----------
+    qvals : array-like
+        The Q values for evaluation
+    w : array-like
         The uniform slab model parameters in 'layer' form.
     dqvals : array-like
         dQ values corresponding to each value in `qvals`. Each dqval is the
@@ -661,33 +1941,95 @@ def _smeared_abeles_adaptive(qvals, w, dqvals, threads=-1):
         Do you want to calculate in parallel? This option is only applicable if
         you are using the ``_creflect`` module. The option is ignored if using
         the pure python calculator, ``_reflect``.
+    kernel : callable, optional
+        Calculates the unsmeared values, `kernel(q, w, threads=threads)`.
+        Defaults to the `abeles` reflectivity calculator.
+    rtol : float, optional
+        Relative tolerance of the smeared value at each point.
+    maxiter : int, optional
+        Maximum number of interval bisections.
 
     Returns
     -------
     reflectivity : np.ndarray
         The smeared reflectivity
+
     Notes
     -----
-    The integration is adaptive meaning it keeps going until it reaches an
-    absolute tolerance.
+    The integration for each point starts with a 15 point Gauss-Kronrod rule
+    over the entire resolution kernel, with the embedded 7 point Gauss rule
+    providing an error estimate. Intervals whose error is larger than their
+    share of the tolerance are bisected, and the process is repeated. The
+    integration is vectorised, all the outstanding abscissae are calculated
+    in a single call to `kernel` for each round of bisection.
     """
-    smeared_rvals = np.zeros(qvals.size)
-    warnings.simplefilter("ignore", Warning)
-    for idx, val in enumerate(qvals):
-        smeared_rvals[idx], err = scipy.integrate.quadrature(
-            _smearkernel,
-            -_INTLIMIT,
-            _INTLIMIT,
-            tol=2 * np.finfo(np.float64).eps,
-            rtol=2 * np.finfo(np.float64).eps,
-            args=(w, qvals[idx], dqvals[idx], threads),
+    if kernel is None:
+        kernel = abeles
+
+    qvals = np.asfarray(qvals).ravel()
+    sigma = np.asfarray(dqvals).ravel() / _FWHM
+    npnts = qvals.size
+    prefactor = 1 / np.sqrt(2 * np.pi)
+
+    # intervals (in units of sigma) for each point that are still to be
+    # integrated
+    pidx = np.arange(npnts)
+    a = np.full(npnts, -_INTLIMIT)
+    b = np.full(npnts, _INTLIMIT)
+
+    total = None
+    for i in range(maxiter + 1):
+        centre = 0.5 * (a + b)
+        half = 0.5 * (b - a)
+
+        x = centre[:, np.newaxis] + half[:, np.newaxis] * _GK15_X
+        localq = qvals[pidx, np.newaxis] + x * sigma[pidx, np.newaxis]
+        f = kernel(localq, w, threads=threads)
+        f *= prefactor * np.exp(-0.5 * x * x)
+
+        # the kernel may calculate several sets of values, e.g. a batch of
+        # structures.
+        batch_shape = f.shape[:-2]
+        f = np.reshape(f, (-1,) + x.shape)
+        kronrod = half * np.dot(f, _GK15_WK)
+        err = np.abs(kronrod - half * np.dot(f, _GK15_WG))
+
+        if total is None:
+            total = np.zeros((len(f), npnts))
+
+        # current estimate of each integral
+        estimate = total + np.stack(
+            [np.bincount(pidx, k, minlength=npnts) for k in kronrod]
+        )
+
+        # an interval is finished if its error is less than its share of the
+        # tolerance.
+        tol = rtol * np.abs(estimate[:, pidx]) * half / _INTLIMIT
+        done = np.all(err <= tol, axis=0)
+        if i == maxiter:
+            done[:] = True
+
+        total += np.stack(
+            [
+                np.bincount(pidx[done], k[done], minlength=npnts)
+                for k in kronrod
+            ]
         )
+        if np.all(done):
+            break
 
-    warnings.resetwarnings()
-    return smeared_rvals
+        # bisect the remaining intervals
+        refine = ~done
+        pidx = np.repeat(pidx[refine], 2)
+        a = np.stack([a[refine], centre[refine]], axis=-1).ravel()
+        b = np.stack([centre[refine], b[refine]], axis=-1).ravel()
 
+    return np.reshape(total, batch_shape + (npnts,))
 
-def _smeared_abeles_pointwise(qvals, w, dqvals, quad_order=17, threads=-1):
+
+def _smeared_abeles_pointwise(
+    qvals, w, dqvals, quad_order=17, threads=-1, kernel=None
+):
     """
     Resolution smearing that uses fixed order Gaussian quadrature integration
     for the convolution.
@@ -701,35 +2043,77 @@ def _smeared_abeles_pointwise(qvals, w, dqvals, quad_order=17, threads=-1):
     dqvals : array-like
         dQ values corresponding to each value in `qvals`. Each dqval is the
         FWHM of a Gaussian approximation to the resolution kernel.
-    quad-order : int, optional
+    quad-order : int or array-like, optional
         Specify the order of the Gaussian quadrature integration for the
-        convolution.
+        convolution. An array specifies the order for each of the points.
     threads: int, optional
         Specifies the number of threads for parallel calculation. This
         option is only applicable if you are using the ``_creflect``
         module. The option is ignored if using the pure python calculator,
         ``_reflect``. If `threads == -1` then all available processors are
         used.
+    kernel : callable, optional
+        Calculates the unsmeared values, `kernel(q, w, threads=threads)`.
+        Defaults to the `abeles` reflectivity calculator.
 
     Returns
     -------
     reflectivity : np.ndarray
         The smeared reflectivity
     """
+    if kernel is None:
+        kernel = abeles
+
+    fused = _fused_smearing(kernel)
+    if fused is not None:
+        return _fused_smeared_abeles_pointwise(
+            fused, qvals, w, dqvals, quad_order=quad_order, threads=threads
+        )
 
     # The fixed order quadrature does not use scipy.integrate.fixed_quad.
     # That library function does one point at a time, whereas in this function
     # the integration is vectorised
 
-    # get the gauss-legendre weights and abscissae
-    abscissa, weights = gauss_legendre(quad_order)
-
     # get the normal distribution at that point
     prefactor = 1.0 / np.sqrt(2 * np.pi)
 
     def gauss(x):
         return np.exp(-0.5 * x * x)
 
+    if np.ndim(quad_order):
+        # gather the abscissae for all the points (which have differing
+        # orders) so the kernel is only called once.
+        orders = np.asarray(quad_order).ravel()
+        halfwidth = _INTLIMIT * dqvals / _FWHM
+        pidx = []
+        localq = []
+        wts = []
+        for order in np.unique(orders):
+            idx = np.flatnonzero(orders == order)
+            abscissa, weights = gauss_legendre(int(order))
+            gaussvals = prefactor * gauss(abscissa * _INTLIMIT)
+
+            pidx.append(np.repeat(idx, order))
+            localq.append(
+                (
+                    qvals[idx, np.newaxis]
+                    + abscissa * halfwidth[idx, np.newaxis]
+                ).ravel()
+            )
+            wts.append(np.tile(gaussvals * weights, idx.size))
+
+        pidx = np.concatenate(pidx)
+        wts = np.concatenate(wts)
+        smeared_rvals = kernel(np.concatenate(localq), w, threads=threads)
+        batch_shape = smeared_rvals.shape[:-1]
+        smeared_rvals = np.reshape(smeared_rvals, (-1, pidx.size)) * wts
+        smeared_rvals = np.stack(
+            [np.bincount(pidx, r, minlength=qvals.size) for r in smeared_rvals]
+        )
+        return np.reshape(smeared_rvals, batch_shape + qvals.shape) * _INTLIMIT
+
+    # get the gauss-legendre weights and abscissae
+    abscissa, weights = gauss_legendre(quad_order)
     gaussvals = prefactor * gauss(abscissa * _INTLIMIT)
 
     # integration between -3.5 and 3.5 sigma
@@ -740,15 +2124,279 @@ def _smeared_abeles_pointwise(qvals, w, dqvals, quad_order=17, threads=-1):
     vb = vb[:, np.newaxis]
 
     qvals_for_res = (np.atleast_2d(abscissa) * (vb - va) + vb + va) / 2.0
-    smeared_rvals = abeles(qvals_for_res, w, threads=threads)
+    smeared_rvals = kernel(qvals_for_res, w, threads=threads)
 
-    smeared_rvals = np.reshape(smeared_rvals, (qvals.size, abscissa.size))
+    smeared_rvals = np.reshape(
+        smeared_rvals, smeared_rvals.shape[:-2] + (qvals.size, abscissa.size)
+    )
 
     smeared_rvals *= np.atleast_2d(gaussvals * weights)
-    return np.sum(smeared_rvals, 1) * _INTLIMIT
+    return np.sum(smeared_rvals, -1) * _INTLIMIT
+
+
+def _fused_smearing(kernel):
+    """
+    The calculator that performs Gaussian quadrature smearing inside the
+    reflectivity calculation for a given `kernel`, or None if it doesn't have
+    one. Only the 'numba' backend has a fused calculator.
+    """
+    if isinstance(kernel, partial) and not kernel.args:
+        if set(kernel.keywords) - {"repeats"}:
+            return None
+        kernel = kernel.func
+    if isinstance(kernel, IncrementalAbeles):
+        kernel = abeles
+
+    if getattr(kernel, "__module__", None) != "refnx.reflect._numba_reflect":
+        return None
+    from refnx.reflect import _numba_reflect as _nb
+
+    if kernel is not _nb.abeles:
+        return None
+    return _nb.smeared_abeles
+
+
+def _fused_smeared_abeles_pointwise(
+    fused, qvals, w, dqvals, quad_order=17, threads=-1
+):
+    """
+    Fixed order Gaussian quadrature smearing (see
+    `_smeared_abeles_pointwise`) by a calculator that does the quadrature
+    inside the reflectivity kernel, e.g.
+    `refnx.reflect._numba_reflect.smeared_abeles`.
+    """
+    orders = np.broadcast_to(quad_order, qvals.shape).astype(np.int64)
+    start = np.zeros(qvals.size + 1, np.int64)
+    np.cumsum(orders, out=start[1:])
+
+    # gather the quadrature rule for each point
+    abscissae = np.empty(start[-1])
+    weights = np.empty(start[-1])
+    prefactor = _INTLIMIT / np.sqrt(2 * np.pi)
+    for order in np.unique(orders):
+        idx = np.flatnonzero(orders == order)
+        abscissa, wts = gauss_legendre(int(order))
+        wts = wts * prefactor * np.exp(-0.5 * (abscissa * _INTLIMIT) ** 2)
+
+        pos = (start[idx, np.newaxis] + np.arange(order)).ravel()
+        abscissae[pos] = np.tile(abscissa, idx.size)
+        weights[pos] = np.tile(wts, idx.size)
+
+    halfwidth = _INTLIMIT * dqvals / _FWHM
+    return fused(
+        qvals, w, halfwidth, abscissae, weights, start, threads=threads
+    )
+
+
+def _smeared_kernel(dq, w, threads=-1, kernel=None):
+    """
+    Resolution smearing with an individual resolution kernel for each point.
+
+    Parameters
+    ----------
+    dq : np.ndarray or refnx.util._resolution_kernel.CompactKernel
+        Resolution kernels. An array has shape `q.shape + (2, M)`,
+        `dq[..., 0, :]` holds the q values for each kernel, `dq[..., 1, :]`
+        gives the corresponding probability.
+    w : np.ndarray
+        Parameters for the reflectivity model
+    threads: int, optional
+        Do you want to calculate in parallel? This option is only applicable if
+        you are using the ``_creflect`` module. The option is ignored if using
+        the pure python calculator, ``_reflect``.
+    kernel : callable, optional
+        Calculates the unsmeared values, `kernel(q, w, threads=threads)`.
+        Defaults to the `abeles` reflectivity calculator.
+
+    Returns
+    -------
+    reflectivity: np.ndarray
+        The resolution smeared reflectivity, has shape `(..., N)`, where `N`
+        is the number of kernels (with leading batch dimensions if `kernel`
+        returns a batch).
+
+    Notes
+    -----
+    Each kernel is integrated with Simpson's rule, arrays of kernels are
+    compacted (and cached) by `_KernelQuadrature`.
+    """
+    if kernel is None:
+        kernel = abeles
+
+    if not isinstance(dq, CompactKernel):
+        dq = _KERNEL_QUADRATURE(dq)
+    return dq.smear(kernel(dq.q, w, threads=threads))
 
 
-def _smeared_abeles_constant(q, w, resolution, threads=-1):
+class _KernelQuadrature(object):
+    """
+    Caches the quadrature for resolution kernel smearing.
+
+    Arrays of resolution kernels are converted to a
+    :class:`refnx.util._resolution_kernel.CompactKernel`, which drops points
+    with negligible weight (less than `tol` of the largest weight in a
+    kernel). The most recently used `maxsize` sets of resolution kernels are
+    cached.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Number of resolution kernels to cache.
+    tol : float, optional
+        Relative weight below which points are dropped.
+    """
+
+    def __init__(self, maxsize=4, tol=1e-12):
+        self.maxsize = maxsize
+        self.tol = tol
+        self._cache = []
+        self._lock = threading.Lock()
+
+    def __call__(self, dq):
+        """
+        Parameters
+        ----------
+        dq : np.ndarray
+            Resolution kernels, has shape `(..., 2, M)`.
+
+        Returns
+        -------
+        compact_kernel : refnx.util._resolution_kernel.CompactKernel
+        """
+        with self._lock:
+            for i, (key, value) in enumerate(self._cache):
+                if key.shape == dq.shape and np.array_equal(key, dq):
+                    self._cache.insert(0, self._cache.pop(i))
+                    return value
+
+        value = CompactKernel.from_kernel(dq, tol=self.tol)
+
+        with self._lock:
+            self._cache.insert(0, (np.array(dq, copy=True), value))
+            del self._cache[self.maxsize :]
+        return value
+
+
+_KERNEL_QUADRATURE = _KernelQuadrature()
+
+
+# Gaussian quadrature orders available to `quad_order == 'auto'`
+_AUTO_QUAD_ORDERS = np.array([11, 13, 17, 21, 29, 41, 57, 81, 113, 161, 229])
+
+
+def _length_scales(slabs):
+    """
+    The overall thickness, and the critical edges, of one or more
+    structures.
+
+    Parameters
+    ----------
+    slabs : np.ndarray or sequence of np.ndarray
+        Slab representation of a structure, or of several structures.
+
+    Returns
+    -------
+    thickness, qcs : float, list of float
+        The largest total thickness of the structures, and the critical
+        edges (Angstrom**-1) of the backing medium and the highest SLD layer
+        in each structure.
+    """
+    if isinstance(slabs, np.ndarray) and slabs.ndim == 2:
+        slabs = [slabs]
+
+    thickness = 0.0
+    qcs = set()
+    for s in slabs:
+        thickness = max(thickness, np.sum(np.fabs(s[1:-1, 0])))
+        for sld in (s[-1, 1], np.max(s[1:, 1])):
+            if sld > s[0, 1]:
+                qcs.add(4 * np.sqrt(np.pi * (sld - s[0, 1]) * 1e-6))
+    return thickness, sorted(qcs)
+
+
+def _auto_quad_order(qvals, dqvals, thickness, qcs, tolerance=0.0):
+    """
+    Chooses the Gaussian quadrature order for pointwise resolution smearing
+    of each point.
+
+    Parameters
+    ----------
+    qvals : np.ndarray
+        The Q values for evaluation
+    dqvals : np.ndarray
+        dQ values corresponding to each value in `qvals`. Each dqval is the
+        FWHM of a Gaussian approximation to the resolution kernel.
+    thickness : float
+        Total thickness of the structure.
+    qcs : sequence of float
+        Critical edges of the structure.
+    tolerance : float, optional
+        The orders remain suitable if the thickness increases, or the
+        critical edges move, by this fraction.
+
+    Returns
+    -------
+    orders : np.ndarray
+        The quadrature order for each point.
+
+    Notes
+    -----
+    Kiessig fringes (and Bragg peaks) have a period of ~2 pi / thickness.
+    The quadrature order grows with the number of fringes spanned by the
+    resolution kernel, from a minimum of 11 for a smooth reflectivity. The
+    reflectivity has a kink at a critical edge, which requires a high order.
+    Compared to a fixed order of 17 this uses fewer points for thin films,
+    and is far more accurate for thick films and multilayers.
+    """
+    halfwidth = _INTLIMIT * dqvals / _FWHM
+    order = 11 + 0.6 * halfwidth * thickness * (1 + tolerance)
+    for qc in qcs:
+        near = np.abs(qvals - qc) < halfwidth + tolerance * qc
+        order = np.where(near, np.maximum(order, 113), order)
+
+    idx = np.searchsorted(_AUTO_QUAD_ORDERS, order)
+    return _AUTO_QUAD_ORDERS[np.minimum(idx, len(_AUTO_QUAD_ORDERS) - 1)]
+
+
+class _AutoQuadOrder(object):
+    """
+    Chooses, and caches, the quadrature orders for pointwise resolution
+    smearing with `quad_order == 'auto'`.
+
+    The orders are reused for as long as the q values, their resolution, and
+    the number of slabs in the structure are unchanged, provided that the
+    structure doesn't get too much thicker and that the critical edges don't
+    move too far.
+    """
+
+    def __init__(self, tolerance=0.2):
+        self.tolerance = tolerance
+        self.orders = None
+        self._key = None
+
+    def __call__(self, qvals, dqvals, slabs):
+        thickness, qcs = _length_scales(slabs)
+        key = (np.shape(slabs), qvals.tobytes(), dqvals.tobytes())
+
+        if (
+            key != self._key
+            or thickness > self._thickness * (1 + self.tolerance)
+            or len(qcs) != len(self._qcs)
+            or np.any(
+                np.abs(np.subtract(qcs, self._qcs))
+                > self.tolerance * np.array(self._qcs)
+            )
+        ):
+            self._key = key
+            self._thickness = thickness
+            self._qcs = qcs
+            self.orders = _auto_quad_order(
+                qvals, dqvals, thickness, qcs, tolerance=self.tolerance
+            )
+        return self.orders
+
+
+def _smeared_abeles_constant(q, w, resolution, threads=-1, kernel=None):
     """
     Fast resolution smearing for constant dQ/Q.
 
@@ -765,14 +2413,68 @@ def _smeared_abeles_constant(q, w, resolution, threads=-1):
         Do you want to calculate in parallel? This option is only applicable if
         you are using the ``_creflect`` module. The option is ignored if using
         the pure python calculator, ``_reflect``.
+    kernel : callable, optional
+        Calculates the unsmeared values, `kernel(q, w, threads=threads)`.
+        Defaults to the `abeles` reflectivity calculator.
     Returns
     -------
     reflectivity: np.ndarray
         The resolution smeared reflectivity
+
+    Notes
+    -----
+    The reflectivity is calculated on a log-spaced grid, convolved with a
+    Gaussian, and interpolated onto `q` with a cubic spline. For a given `q`
+    and `resolution` these steps are a fixed linear operator, which is
+    cached (see `_constant_smearing_operator`).
     """
+    if kernel is None:
+        kernel = abeles
 
     if resolution < 0.5:
-        return abeles(q, w, threads=threads)
+        return kernel(q, w, threads=threads)
+
+    q = np.asfarray(q)
+    xlin, operator = _constant_smearing_operator(
+        q.tobytes(), float(resolution)
+    )
+
+    rvals = kernel(xlin, w, threads=threads)
+
+    batch_shape = rvals.shape[:-1]
+    smeared_rvals = operator @ np.reshape(rvals, (-1, xlin.size)).T
+    return np.reshape(smeared_rvals.T, batch_shape + q.shape)
+
+
+@lru_cache(maxsize=32)
+def _constant_smearing_operator(qbytes, resolution):
+    """
+    The linear operator that performs constant dQ/Q resolution smearing.
+
+    Parameters
+    ----------
+    qbytes: bytes
+        The raw bytes of the (float64) Q values to evaluate the reflectivity
+        at. Bytes are used so that the operator can be cached.
+    resolution: float
+        Percentage dq/q resolution. dq specified as FWHM of a resolution
+        kernel.
+
+    Returns
+    -------
+    xlin, operator : np.ndarray, scipy.sparse.csr_matrix
+        The reflectivity is calculated at `xlin`, the smeared reflectivity is
+        then `operator @ r`. `operator` has shape `(q.size, xlin.size)`.
+
+    Notes
+    -----
+    The operator convolves the reflectivity with a Gaussian (as
+    `np.convolve(r, gauss_y, mode='same')` would), and then interpolates the
+    result onto `q` with a not-a-knot cubic spline (as `splev(q, splrep(xlin,
+    smeared_rvals))` would). The spline interpolation is non-local, so entries
+    in the operator that are negligible are discarded.
+    """
+    q = np.frombuffer(qbytes, dtype=np.float64)
 
     resolution /= 100
     gaussnum = 51
@@ -797,23 +2499,91 @@ def _smeared_abeles_constant(q, w, resolution, threads=-1):
     )
     xtemp = _cached_linspace(start, finish, int(interpnum))
     xlin = np.power(10.0, xtemp)
+    npnts = xlin.size
 
     # resolution smear over [-4 sigma, 4 sigma]
     gauss_x = _cached_linspace(-1.7 * resolution, 1.7 * resolution, gaussnum)
     gauss_y = gauss(gauss_x, resolution / _FWHM)
+    gauss_y *= gauss_x[1] - gauss_x[0]
+
+    # banded convolution matrix, conv[i, j] = gauss_y[i - j + centre]
+    centre = (gaussnum - 1) // 2
+    offsets = np.arange(-centre, gaussnum - centre)
+    conv = sparse.diags(
+        [np.full(npnts - abs(d), gauss_y[centre - d]) for d in offsets],
+        offsets,
+        shape=(npnts, npnts),
+        format="csc",
+    )
+
+    # not-a-knot cubic spline through the smeared values, this is what
+    # splrep does when there's no smoothing. The spline coefficients are
+    # `colloc^-1 @ smeared_rvals`, and the spline is `design @ coefficients`.
+    k = 3
+    knots = np.r_[(xlin[0],) * (k + 1), xlin[2:-2], (xlin[-1],) * (k + 1)]
+    colloc = _bspline_design_matrix(xlin, knots, k)
+    design = _bspline_design_matrix(q, knots, k)
+
+    # operator^T = conv^T @ colloc^-T @ design^T, calculated for a block of
+    # q values at a time to limit memory use
+    lu = sparse.linalg.splu(colloc.T.tocsc())
+    blocks = []
+    for i in range(0, q.size, 256):
+        op = lu.solve(design[i : i + 256].T.toarray())
+        op = (conv.T @ op).T
 
-    rvals = abeles(xlin, w, threads=threads)
-    smeared_rvals = np.convolve(rvals, gauss_y, mode="same")
-    smeared_rvals *= gauss_x[1] - gauss_x[0]
+        # discard negligible entries
+        op[np.abs(op) < 1e-20 * np.max(np.abs(op), axis=1, keepdims=True)] = 0
+        blocks.append(sparse.csr_matrix(op))
 
-    # interpolator = InterpolatedUnivariateSpline(xlin, smeared_rvals)
-    #
-    # smeared_output = interpolator(q)
+    return xlin, sparse.vstack(blocks, format="csr")
 
-    tck = splrep(xlin, smeared_rvals)
-    smeared_output = splev(q, tck)
 
-    return smeared_output
+def _bspline_design_matrix(x, t, k):
+    """
+    Values of the B-spline basis functions.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Points to evaluate the basis functions at. Points outside the base
+        interval are extrapolated from the first and last polynomial pieces.
+    t : np.ndarray
+        Knots.
+    k : int
+        B-spline degree.
+
+    Returns
+    -------
+    design : scipy.sparse.csr_matrix
+        `design[i, j]` is the value of the j'th basis function at `x[i]`, has
+        shape `(x.size, t.size - k - 1)`.
+    """
+    x = np.ravel(x)
+    n = t.size - k - 1
+
+    # knot interval containing each point, t[ell] <= x < t[ell + 1]
+    ell = np.searchsorted(t, x, side="right") - 1
+    ell = np.clip(ell, k, n - 1)
+
+    # Cox-de Boor recursion for the k + 1 non-zero basis functions
+    basis = np.zeros((x.size, k + 1))
+    basis[:, 0] = 1.0
+    left = np.zeros((x.size, k + 1))
+    right = np.zeros((x.size, k + 1))
+    for j in range(1, k + 1):
+        left[:, j] = x - t[ell + 1 - j]
+        right[:, j] = t[ell + j] - x
+        saved = np.zeros(x.size)
+        for r in range(j):
+            temp = basis[:, r] / (right[:, r + 1] + left[:, j - r])
+            basis[:, r] = saved + right[:, r + 1] * temp
+            saved = left[:, j - r] * temp
+        basis[:, j] = saved
+
+    rows = np.repeat(np.arange(x.size), k + 1)
+    cols = (ell[:, None] - k + np.arange(k + 1)).ravel()
+    return sparse.csr_matrix((basis.ravel(), (rows, cols)), shape=(x.size, n))
 
 
 @lru_cache(maxsize=128)
@@ -864,15 +2634,20 @@ class MixedReflectModel(object):
         module. The option is ignored if using the pure python calculator,
         ``_reflect``. If `threads == -1` then all available processors are
         used.
-    quad_order: int, optional
+    quad_order: int or {'auto', 'ultimate'}, optional
         the order of the Gaussian quadrature polynomial for doing the
         resolution smearing. default = 17. Don't choose less than 13. If
         quad_order == 'ultimate' then adaptive quadrature is used. Adaptive
-        quadrature will always work, but takes a _long_ time (2 or 3 orders
-        of magnitude longer). Fixed quadrature will always take a lot less
+        quadrature will always work, but takes longer (typically an order of
+        magnitude longer). Fixed quadrature will always take a lot less
         time. BUT it won't necessarily work across all samples. For
         example, 13 points may be fine for a thin layer, but will be
-        atrocious at describing a multilayer with bragg peaks.
+        atrocious at describing a multilayer with bragg peaks. If
+        quad_order == 'auto' then the order is chosen for each point from
+        the resolution and the total thickness of the structure, with more
+        points close to critical edges. 'auto' is much more accurate than a
+        fixed order for thick films and multilayers, but 'ultimate' is
+        required for the highest accuracy.
     dq_type: {'pointwise', 'constant'}, optional
         Chooses whether pointwise or constant dQ/Q resolution smearing (see
         `dq` keyword) is used. To use pointwise smearing the `x_err` keyword
@@ -1012,7 +2787,19 @@ class MixedReflectModel(object):
         -------
         reflectivity : np.ndarray
 
+        Notes
+        -----
+        If `p` is a 2D array then the model is calculated for each of its rows
+        with batched reflectivity calculations, see
+        :meth:`MixedReflectModel.model_batch`.
+
+        The unsmeared reflectivities of the structures are calculated on the
+        same set of q points, and their area weighted sum is then resolution
+        smeared once.
         """
+        if p is not None and np.ndim(p) == 2:
+            return self.model_batch(x, p, x_err=x_err)
+
         if p is not None:
             self.parameters.pvals = np.array(p)
         if x_err is None or self.dq_type == "constant":
@@ -1020,20 +2807,132 @@ class MixedReflectModel(object):
             x_err = float(self.dq)
 
         scales = np.array(self.scales)
+        slabs = [structure.slabs()[..., :4] for structure in self.structures]
 
-        y = np.zeros_like(x)
+        # resolution smearing is linear, so the area weighted sum of the
+        # unsmeared reflectivities is only smeared once.
+        return _reflectivity(
+            x,
+            slabs,
+            bkg=self.bkg.value,
+            dq=x_err,
+            threads=self.threads,
+            quad_order=self.quad_order,
+            kernel=partial(_incoherent_abeles, weights=scales),
+        )
 
-        for scale, structure in zip(scales, self.structures):
-            y += reflectivity(
+    def model_batch(self, x, p, x_err=None, setp=None):
+        r"""
+        Calculate the reflectivity of this model for many parameter sets at
+        once.
+
+        Parameters
+        ----------
+        x : float or np.ndarray
+            q values for the calculation.
+        p : array-like
+            2D array of parameter sets, shape (K, N).
+        x_err : np.ndarray
+            dq resolution smearing values for the dataset being considered.
+        setp : callable, optional
+            Called with each row of `p` to set the parameter values, e.g.
+            `Objective.setp`. By default each row is used to set
+            `self.parameters.pvals`.
+
+        Returns
+        -------
+        reflectivity : np.ndarray
+            Calculated reflectivity, has shape `(K,) + x.shape`.
+        """
+        if setp is None:
+
+            def setp(pvals):
+                self.parameters.pvals = np.array(pvals)
+
+        nstructures = len(self.structures)
+        slabs = [[] for i in range(nstructures)]
+        scales = []
+        bkgs = []
+        dqs = []
+        for pvals in p:
+            setp(pvals)
+            for i, structure in enumerate(self.structures):
+                slabs[i].append(structure.slabs()[..., :4])
+            scales.append(np.array(self.scales))
+            bkgs.append(self.bkg.value)
+            dqs.append(float(self.dq))
+
+        scales = np.array(scales)
+        bkgs = np.array(bkgs)
+        dqs = np.array(dqs)
+
+        if x_err is not None and self.dq_type != "constant":
+            groups = [(np.arange(len(dqs)), x_err)]
+        else:
+            groups = [
+                (np.flatnonzero(dqs == dq), float(dq)) for dq in np.unique(dqs)
+            ]
+
+        y = np.zeros((len(dqs),) + np.shape(x), np.float64)
+        for idx, dq in groups:
+            # smear the area weighted sum for each parameter set once
+            batch = [slabs[i][j] for j in idx for i in range(nstructures)]
+            y[idx] = _reflectivity(
                 x,
-                structure.slabs()[..., :4],
-                scale=scale,
-                dq=x_err,
+                batch,
+                dq=dq,
                 threads=self.threads,
                 quad_order=self.quad_order,
+                kernel=partial(_incoherent_abeles, weights=scales[idx]),
+            )
+
+        shape = (-1,) + (1,) * np.ndim(x)
+        return y + np.reshape(bkgs, shape)
+
+    def jacobian(self, x, parameters, x_err=None):
+        r"""
+        Derivatives of the reflectivity with respect to Parameters.
+
+        Parameters
+        ----------
+        x : float or np.ndarray
+            q values for the calculation.
+        parameters : sequence of refnx.analysis.Parameter
+            Parameters to differentiate with respect to. Parameters that don't
+            affect this model have zero derivative.
+        x_err : np.ndarray
+            dq resolution smearing values for the dataset being considered.
+
+        Returns
+        -------
+        jac : np.ndarray or None
+            Derivatives of the reflectivity, has shape
+            `(len(parameters),) + x.shape`. `None` is returned if analytic
+            derivatives aren't available, e.g. if the number of slabs in a
+            structure depends on one of the Parameters, or adaptive
+            quadrature is used for resolution smearing.
+
+        Notes
+        -----
+        The analytic derivatives of the reflectivity with respect to each of
+        the slabs are chained to the Parameters via the slab representation
+        of the structures.
+        """
+
+        def state():
+            return (
+                [structure.slabs()[..., :4] for structure in self.structures],
+                np.array(self.scales),
+                self.bkg.value,
+                float(self.dq),
             )
 
-        return y + self.bkg.value
+        if x_err is None or self.dq_type == "constant":
+            x_err = None
+
+        return _model_jacobian(
+            x, parameters, state, x_err, self.quad_order, self.threads
+        )
 
     def logp(self):
         r"""
@@ -1127,6 +3026,21 @@ class FresnelTransform(Transform):
             repr(self.sld_fronting), repr(self.sld_backing), repr(self.dq)
         )
 
+    def _cache_key(self):
+        # the transform of a given dataset only changes if this does, see
+        # `Objective._transformed_data`
+        dq = self.dq
+        if np.ndim(dq):
+            dq = np.asarray(dq, dtype=np.float64).tobytes()
+        else:
+            dq = float(dq)
+        return (
+            self.form,
+            complex(self.sld_fronting),
+            complex(self.sld_backing),
+            dq,
+        )
+
     def __call__(self, x, y, y_err=None, x_err=0):
         """
         Calculate the transformed data
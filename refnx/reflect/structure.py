@@ -37,11 +37,30 @@ except ImportError:
 
 from refnx._lib import flatten
 from refnx.analysis import Parameters, Parameter, possibly_create_parameter
+from refnx.analysis.parameter import _Watcher, _vectorised, _unchanged
 from refnx.reflect.interface import Interface, Erf, Step
-from refnx.reflect.reflect_model import get_reflect_backend
+from refnx.reflect.reflect_model import get_reflect_backend, reflectivity
 
 # contracting the SLD profile can greatly speed a reflectivity calculation up.
 contract_by_area = refcalc._contract_by_area
+contract_adaptive = refcalc._contract_adaptive
+
+# incremented whenever an attribute of a Structure, Component or Scatterer is
+# reassigned, invalidating all cached slab representations.
+_MODCOUNT = 0
+
+
+def _modified():
+    global _MODCOUNT
+    _MODCOUNT += 1
+
+
+def _layout(components):
+    # identifies the Components in a Structure, including those in Stacks
+    return tuple(
+        (id(c), _layout(c.data)) if isinstance(c, UserList) else id(c)
+        for c in components
+    )
 
 
 class Structure(UserList):
@@ -71,6 +90,14 @@ class Structure(UserList):
         representation is made. Use larger values for coarser
         profiles (and vice versa). A typical starting value to try might
         be 1.0.
+    contract_method : {'area', 'adaptive'}
+        How the slab representation is contracted. 'area' limits the range
+        of SLD in each contracted layer multiplied by its thickness. 'adaptive'
+        places the layer boundaries according to the local variation of the
+        SLD profile, limiting the deviation of each layer from the profile it
+        replaces, which typically creates fewer layers for the same accuracy.
+        See :meth:`Structure.tune_contract` to choose `contract` for a given
+        tolerance on the reflectivity.
 
     Notes
     -----
@@ -94,7 +121,8 @@ class Structure(UserList):
     The profile contraction specified by this property can greatly improve
     calculation time for Structures created with micro-slicing. If you use
     this option it is recommended to check the reflectivity signal with and
-    without contraction to ensure they are comparable.
+    without contraction to ensure they are comparable, e.g. with
+    :meth:`Structure.contraction_error`.
 
     Example
     -------
@@ -139,6 +167,7 @@ class Structure(UserList):
         solvent=None,
         reverse_structure=False,
         contract=0,
+        contract_method="area",
     ):
         super(Structure, self).__init__()
         self._name = name
@@ -149,16 +178,35 @@ class Structure(UserList):
         #: slab representation is made. Use larger values for coarser profiles
         #: (and vice versa). A typical starting value to try might be 1.0.
         self.contract = contract
+        #: **str** {'area', 'adaptive'} the method used to contract the slab
+        #: representation.
+        self.contract_method = contract_method
 
         # if you provide a list of components to start with, then initialise
         # the structure from that
         self.data = [c for c in components if isinstance(c, Component)]
 
+        # repeated blocks in the last slab representation, see `slabs`.
+        self._repeats = []
+
+    # the cached slab representation, see `slabs`.
+    _slab_cache = None
+
     def __copy__(self):
         s = Structure(name=self.name, solvent=self._solvent)
         s.data = self.data.copy()
         return s
 
+    def __setattr__(self, name, value):
+        if name in self.__dict__ and name not in ("_repeats", "_slab_cache"):
+            _modified()
+        super(Structure, self).__setattr__(name, value)
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop("_slab_cache", None)
+        return d
+
     def __setitem__(self, i, v):
         self.data[i] = v
 
@@ -168,7 +216,8 @@ class Structure(UserList):
         s.append("Structure: {0: ^15}".format(str(self.name)))
         s.append("solvent: {0}".format(repr(self._solvent)))
         s.append("reverse structure: {0}".format(str(self.reverse_structure)))
-        s.append("contract: {0}\n".format(str(self.contract)))
+        s.append("contract: {0}".format(str(self.contract)))
+        s.append("contract method: {0}\n".format(str(self.contract_method)))
 
         for component in self:
             s.append(str(component))
@@ -181,7 +230,8 @@ class Structure(UserList):
             " name={_name!r},"
             " solvent={_solvent!r},"
             " reverse_structure={_reverse_structure},"
-            " contract={contract})".format(**self.__dict__)
+            " contract={contract},"
+            " contract_method={contract_method!r})".format(**self.__dict__)
         )
 
     def append(self, item):
@@ -275,6 +325,15 @@ class Structure(UserList):
         is the component in `Structure[0]`, which corresponds to
         `Structure.slab[-1]`.
 
+        The slab representation is cached, it's only recalculated when the
+        value (or constraint) of a Parameter in the Structure changes, when
+        Components are added or removed, or when an attribute of the
+        Structure or one of its Components/Scatterers is reassigned. The
+        slab representation of each Component is also cached if
+        `Component._slabs_cacheable` is True, which isn't the case for
+        Components whose slabs depend on the rest of the Structure (e.g.
+        :class:`refnx.reflect.Spline`).
+
         """
         if not len(self):
             return None
@@ -287,20 +346,62 @@ class Structure(UserList):
                 " need to be Slabs"
             )
 
+        layout = _layout(self.data)
+        cache = self._slab_cache
+        if (
+            cache is None
+            or cache["key"] != (layout, _MODCOUNT)
+            or cache["watcher"].rewatch
+        ):
+            cache = {
+                "key": (layout, _MODCOUNT),
+                # keep the components alive so their ids aren't reused
+                "components": list(flatten(self.data)),
+                "watcher": _Watcher(self.parameters),
+                "component_slabs": {},
+            }
+            self._slab_cache = cache
+
+        watcher = cache["watcher"]
+        if watcher.dirty:
+            cache["slabs"], cache["repeats"] = self._slabs()
+            watcher.dirty = False
+            # objects created during the calculation (e.g. `solvent`) may
+            # have incremented _MODCOUNT
+            cache["key"] = (layout, _MODCOUNT)
+
+        self._repeats = cache["repeats"]
+        return cache["slabs"].copy()
+
+    def _slabs(self):
+        # calculates the slab representation and the repeated blocks in it
         # Each layer can be given a different type of roughness profile
         # that defines transition between successive layers.
         # The default interface is specified by None (= Gaussian roughness)
+        repeats = []
         interfaces = flatten(self.interfaces)
         if all([i is None for i in interfaces]):
             # if all the interfaces are Gaussian, then simply concatenate
             # the default slabs property of each component.
-            sl = [c.slabs(structure=self) for c in self.components]
+            sl = self._component_slabs()
 
             try:
                 slabs = np.concatenate(sl)
             except ValueError:
                 # some of slabs may be None. np can't concatenate arr and None
                 slabs = np.concatenate([s for s in sl if s is not None])
+
+            # note where repeated Stacks are, so that the reflectivity
+            # calculation can make use of them.
+            row = 0
+            for c, s in zip(self.components, sl):
+                if s is None:
+                    continue
+                if isinstance(c, Stack):
+                    n = round(abs(c.repeats.value))
+                    if n > 1:
+                        repeats.append((row, row + len(s), len(s) // n))
+                row += len(s)
         else:
             # there is a non-default interfacial roughness, create a microslab
             # representation
@@ -314,6 +415,14 @@ class Structure(UserList):
             slabs[1:, 3] = roughnesses[::-1]
             slabs[0, 3] = 0.0
 
+            # the first reversed layer of each block gets the roughness of
+            # the layer that followed the block.
+            nslabs = len(slabs)
+            repeats = [
+                (nslabs + 1 - stop, nslabs - start, period)
+                for start, stop, period in repeats
+            ]
+
         if np.any(slabs[:, 4] > 0):
             # overall SLD is a weighted average of the vfs and slds
             # accessing self.solvent leads to overhead from object
@@ -331,9 +440,74 @@ class Structure(UserList):
             slabs[1:-1] = self.overall_sld(slabs[1:-1], solv)
 
         if self.contract > 0:
-            return contract_by_area(slabs, self.contract)
+            if getattr(self, "contract_method", "area") == "adaptive":
+                return contract_adaptive(slabs, self.contract), []
+            return contract_by_area(slabs, self.contract), []
         else:
-            return slabs
+            return slabs, repeats
+
+    def _component_slabs(self):
+        """
+        The slab representation of each Component, reusing the cached slabs
+        of Components whose parameters haven't changed.
+        """
+        if self._slab_cache is None:
+            return [c.slabs(structure=self) for c in self.components]
+
+        cache = self._slab_cache["component_slabs"]
+        sl = []
+        for c in self.components:
+            if not c._slabs_cacheable:
+                sl.append(c.slabs(structure=self))
+                continue
+
+            entry = cache.get(id(c))
+            if entry is None:
+                entry = cache[id(c)] = [_Watcher(c.parameters), None]
+            if entry[0].dirty:
+                entry[1] = c.slabs(structure=self)
+                entry[0].dirty = False
+            sl.append(entry[1])
+        return sl
+
+    def compile(self, parameters):
+        """
+        Compiles the slab representation into a function of a vector of
+        parameter values, which doesn't use the Parameter objects.
+
+        Parameters
+        ----------
+        parameters : sequence of refnx.analysis.Parameter
+            The Parameters corresponding to the entries of the vector, e.g.
+            `Objective.varying_parameters()`.
+
+        Returns
+        -------
+        plan : callable
+            `plan(pvals)` returns the slab representation, shape (N, 5), for
+            a vector of parameter values. If `pvals` has shape
+            `(K, len(parameters))` the slab representation of each row is
+            returned, shape (K, N, 5).
+
+        Raises
+        ------
+        ValueError
+            If the Structure can't be compiled. Only Structures made of
+            :class:`Slab` and :class:`Stack` Components, with :class:`SLD`
+            materials and Gaussian roughness, can be compiled. Contraction
+            isn't possible, and the number of repeats in a Stack can't be one
+            of `parameters` or be constrained.
+
+        Notes
+        -----
+        The plan is a precomputed gather of `pvals` into the slab array,
+        with constraints evaluated as vectorised expressions. The value of
+        each Parameter that isn't in `parameters` is a constant in the plan.
+        `plan.stale` becomes True if any of those values, or any constraint,
+        changes, or if the Structure is modified. The Structure should then
+        be compiled again.
+        """
+        return _SlabPlan(self, parameters)
 
     def _micro_slabs(self, slice_size=0.5):
         """
@@ -351,7 +525,7 @@ class Structure(UserList):
             `Structure.slabs` method for a description of the array.
         """
         # solvate the slabs from each component
-        sl = [c.slabs(structure=self) for c in self.components]
+        sl = self._component_slabs()
         total_slabs = np.concatenate(sl)
         total_slabs[1:-1] = self.overall_sld(total_slabs[1:-1], self.solvent)
 
@@ -396,15 +570,32 @@ class Structure(UserList):
         sigma = total_slabs[1:, 3]
         step = Step()
 
-        # accumulate the SLD of each step.
+        # the change in SLD beyond the extent of each interface
+        steps = np.zeros((2, len(zed) + 1), float)
+
+        # accumulate the SLD of each step. Each interfacial profile only needs
+        # to be evaluated within its extent, beyond that it's a step change.
         for i in range(len(total_slabs) - 1):
             f = _interfaces[i + 1]
             if sigma[i] == 0:
                 f = step
 
-            p = f(zed, scale=sigma[i], loc=dist[i])
-            sld += delta_rho[i] * p
-            isld += delta_irho[i] * p
+            lo, hi = 0, len(zed)
+            if f.extent is not None:
+                width = f.extent * sigma[i]
+                lo = np.searchsorted(zed, dist[i] - width, side="left")
+                hi = np.searchsorted(zed, dist[i] + width, side="right")
+
+            if hi > lo:
+                p = f(zed[lo:hi], scale=sigma[i], loc=dist[i])
+                sld[lo:hi] += delta_rho[i] * p
+                isld[lo:hi] += delta_irho[i] * p
+            steps[0, hi] += delta_rho[i]
+            steps[1, hi] += delta_irho[i]
+
+        steps = np.cumsum(steps, axis=1)
+        sld += steps[0, :-1]
+        isld += steps[1, :-1]
 
         sld[0] = total_slabs[0, 1]
         isld[0] = total_slabs[0, 2]
@@ -484,6 +675,99 @@ class Structure(UserList):
         abeles = get_reflect_backend()
         return abeles(q, self.slabs()[..., :4], threads=threads)
 
+    def contraction_error(self, q, dq=0):
+        """
+        Maximum relative deviation of the reflectivity of the contracted slab
+        representation from that of the uncontracted representation.
+
+        Parameters
+        ----------
+        q : array-like
+            Q values (Angstrom**-1) for evaluation. These should span the Q
+            range of the data being analysed.
+        dq : float or array-like, optional
+            Resolution smearing to apply, see
+            :func:`refnx.reflect.reflectivity`. The contraction error is
+            reduced by smearing.
+
+        Returns
+        -------
+        error : float
+            :math:`max(|R_{contracted} / R_{uncontracted} - 1|)`
+        """
+        contract = self.contract
+        try:
+            self.contract = 0
+            uncontracted = self.slabs()[..., :4]
+        finally:
+            self.contract = contract
+
+        r = reflectivity(q, uncontracted, dq=dq)
+        rc = reflectivity(q, self.slabs()[..., :4], dq=dq)
+        return float(np.max(np.abs(rc / r - 1)))
+
+    def tune_contract(
+        self, q, rtol=1e-3, dq=0, method="adaptive", bounds=(1e-4, 100)
+    ):
+        """
+        Chooses the largest `contract` value (i.e. the fewest layers) for
+        which the reflectivity of the contracted slab representation is within
+        a tolerance of the uncontracted representation.
+
+        Parameters
+        ----------
+        q : array-like
+            Q values (Angstrom**-1) for evaluation. These should span the Q
+            range of the data being analysed.
+        rtol : float, optional
+            The maximum relative deviation of the contracted reflectivity,
+            see :meth:`Structure.contraction_error`.
+        dq : float or array-like, optional
+            Resolution smearing to apply, see
+            :func:`refnx.reflect.reflectivity`.
+        method : {'adaptive', 'area'}, optional
+            The contraction method to use, sets `Structure.contract_method`.
+        bounds : tuple, optional
+            The range of `contract` values to search.
+
+        Returns
+        -------
+        contract : float
+            The `contract` value, which is also set as `Structure.contract`.
+            If no value within `bounds` meets the tolerance then contraction
+            is switched off (0).
+
+        Notes
+        -----
+        The contraction is tuned for the current parameter values. The
+        tolerance should be checked with
+        :meth:`Structure.contraction_error` if the parameters change
+        significantly.
+        """
+        self.contract_method = method
+
+        def error(contract):
+            self.contract = contract
+            return self.contraction_error(q, dq=dq)
+
+        lo, hi = np.log10(bounds)
+        if error(10 ** lo) > rtol:
+            self.contract = 0
+            return 0
+        if error(10 ** hi) <= rtol:
+            return self.contract
+
+        # bisect (in log space) for the largest contract value
+        while hi - lo > 0.01:
+            mid = 0.5 * (lo + hi)
+            if error(10 ** mid) <= rtol:
+                lo = mid
+            else:
+                hi = mid
+
+        self.contract = 10 ** lo
+        return self.contract
+
     def sld_profile(self, z=None, align=0):
         """
         Calculates an SLD profile, as a function of distance through the
@@ -695,6 +979,125 @@ class Structure(UserList):
         return fig, ax
 
 
+def _slab_rows(components, fixed):
+    # the Parameters in each row of the slab representation of a sequence of
+    # Components
+    rows = []
+    for c in components:
+        if type(c) is Slab and type(c.sld) is SLD and c.interfaces is None:
+            rows.append([c.thick, c.sld.real, c.sld.imag, c.rough, c.vfsolv])
+        elif type(c) is Stack and c.repeats.constraint is None:
+            fixed.append((c.repeats, None, c.repeats.value))
+            rows.extend(
+                _slab_rows(c.data, fixed) * round(abs(c.repeats.value))
+            )
+        else:
+            raise ValueError(f"A {type(c).__name__} can't be compiled")
+    return rows
+
+
+class _SlabPlan(object):
+    """
+    Calculates the slab representation of a Structure from a vector of
+    parameter values, see :meth:`Structure.compile`.
+    """
+
+    def __init__(self, structure, parameters):
+        parameters = list(parameters)
+        if not len(structure) or not (
+            type(structure[0]) is Slab and type(structure[-1]) is Slab
+        ):
+            raise ValueError(
+                "The first and last Components in a Structure need to be"
+                " Slabs"
+            )
+        if structure.contract > 0:
+            raise ValueError("A contracted Structure can't be compiled")
+
+        self._structure = structure
+        self._layout = _layout(structure.data)
+        self._modcount = _MODCOUNT
+        self._fixed = []
+        rows = _slab_rows(structure.data, self._fixed)
+
+        if structure.reverse_structure:
+            roughnesses = [row[3] for row in rows[1:]]
+            rows = [list(row) for row in reversed(rows)]
+            for row, rough in zip(rows, [None] + roughnesses[::-1]):
+                row[3] = rough
+
+        # the solvent is an extra row at the end of the array
+        solvent = structure._solvent
+        if solvent is None:
+            solvent = rows[-1]
+        elif type(solvent) is SLD:
+            solvent = [None, solvent.real, solvent.imag, None, None]
+        else:
+            raise ValueError(f"A {type(solvent).__name__} can't be compiled")
+        rows.append(solvent)
+
+        index = {id(p): i for i, p in enumerate(parameters)}
+        self._template = np.zeros((len(rows), 5))
+        slots = []
+        columns = []
+        expressions = {}
+        for i, row in enumerate(rows):
+            for j, param in enumerate(row):
+                if param is None:
+                    continue
+                slot = 5 * i + j
+                if param.constraint is not None:
+                    if id(param) not in expressions:
+                        f, fixed = _vectorised(param, parameters)
+                        self._fixed.extend(fixed)
+                        expressions[id(param)] = (f, [])
+                    expressions[id(param)][1].append(slot)
+                elif id(param) in index:
+                    slots.append(slot)
+                    columns.append(index[id(param)])
+                else:
+                    self._template[i, j] = param.value
+                    self._fixed.append((param, None, param.value))
+
+        self._slots = np.array(slots, dtype=np.intp)
+        self._columns = np.array(columns, dtype=np.intp)
+        self._expressions = list(expressions.values())
+
+    @property
+    def stale(self):
+        """
+        Whether the Structure, or the value of a Parameter that's a constant
+        in this plan, has changed since it was compiled.
+        """
+        return (
+            self._modcount != _MODCOUNT
+            or self._layout != _layout(self._structure.data)
+            or not _unchanged(self._fixed)
+        )
+
+    def __call__(self, pvals):
+        pvals = np.asarray(pvals, dtype=np.float64)
+        p = np.atleast_2d(pvals)
+
+        slabs = np.repeat(self._template[np.newaxis], len(p), axis=0)
+        flat = slabs.reshape(len(p), -1)
+        flat[:, self._slots] = p[:, self._columns]
+        for f, slots in self._expressions:
+            flat[:, slots] = np.reshape(f(p), (-1, 1))
+
+        # solvate the layers, the solvent is in the last row
+        solvent = slabs[:, -1:, 1:3]
+        layers = slabs[:, 1:-2]
+        vfsolv = layers[..., 4:5]
+        layers[..., 1:3] *= 1 - vfsolv
+        layers[..., 1:3] += solvent * vfsolv
+
+        slabs = slabs[:, :-1]
+        if pvals.ndim == 1:
+            return slabs[0]
+        return slabs
+
+
 class Scatterer(object):
     """
     Abstract base class for something that will have a scattering length
@@ -704,6 +1107,11 @@ class Scatterer(object):
     def __init__(self, name=""):
         self.name = name
 
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            _modified()
+        object.__setattr__(self, name, value)
+
     def __str__(self):
         sld = complex(self)
         return "SLD = {0} x10**-6 Å**-2".format(sld)
@@ -781,15 +1189,17 @@ class SLD(Scatterer):
     def __init__(self, value, name=""):
         super(SLD, self).__init__(name=name)
 
-        self.imag = Parameter(0, name="%s - isld" % name)
+        # attributes are only assigned once, reassigning them invalidates
+        # cached slab representations.
+        imag = None
         if isinstance(value, numbers.Real):
             self.real = Parameter(value.real, name="%s - sld" % name)
         elif isinstance(value, numbers.Complex):
             self.real = Parameter(value.real, name="%s - sld" % name)
-            self.imag = Parameter(value.imag, name="%s - isld" % name)
+            imag = Parameter(value.imag, name="%s - isld" % name)
         elif isinstance(value, SLD):
             self.real = value.real
-            self.imag = value.imag
+            imag = value.imag
         elif isinstance(value, Parameter):
             self.real = value
         elif (
@@ -798,7 +1208,11 @@ class SLD(Scatterer):
             and isinstance(value[1], Parameter)
         ):
             self.real = value[0]
-            self.imag = value[1]
+            imag = value[1]
+
+        if imag is None:
+            imag = Parameter(0, name="%s - isld" % name)
+        self.imag = imag
 
         self._parameters = Parameters(name=name)
         self._parameters.extend([self.real, self.imag])
@@ -937,10 +1351,21 @@ class Component(object):
     profile.
     """
 
+    # whether the slab representation only depends on the parameters and
+    # attributes of the Component, allowing a Structure to cache it.
+    _slabs_cacheable = False
+
     def __init__(self, name=""):
         self.name = name
         self._interfaces = None
 
+    def __setattr__(self, name, value):
+        # reassigning an attribute may change the slab representation of a
+        # Structure containing this Component.
+        if name in self.__dict__:
+            _modified()
+        object.__setattr__(self, name, value)
+
     def __or__(self, other):
         """
         OR'ing components can create a :class:`Structure`.
@@ -1114,6 +1539,8 @@ class Slab(Component):
         function (also known as Gaussian roughness).
     """
 
+    _slabs_cacheable = True
+
     def __init__(self, thick, sld, rough, name="", vfsolv=0, interface=None):
         super(Slab, self).__init__(name=name)
         self.thick = possibly_create_parameter(thick, name=f"{name} - thick")
@@ -1214,6 +1641,8 @@ class MixedSlab(Component):
     `vfsolv`.
     """
 
+    _slabs_cacheable = True
+
     def __init__(
         self,
         thick,
@@ -1446,6 +1875,10 @@ class Stack(Component, UserList):
     # override the interfaces property for this subclass
     interfaces = property(_interfaces_get, _interfaces_set)
 
+    @property
+    def _slabs_cacheable(self):
+        return all(c._slabs_cacheable for c in self.data)
+
     @property
     def components(self):
         """
@@ -1,5 +1,6 @@
 import pickle
 
+import pytest
 import numpy as np
 from numpy.testing import (
     assert_almost_equal,
@@ -18,6 +19,8 @@ from refnx.reflect import (
     Erf,
     Linear,
     Exponential,
+    Tanh,
+    Sinusoidal,
     Interface,
     MaterialSLD,
     MixedSlab,
@@ -187,6 +190,23 @@ class TestStructure(object):
         slabs = s.slabs()
         assert_almost_equal(slabs[:, 1], slabs[:, 2])
 
+    def test_micro_slab_extent(self):
+        # each interfacial profile is only evaluated close to the interface,
+        # which should give the same microslabs as evaluating it everywhere.
+        interfaces = [Erf(), Linear(), Exponential(), Tanh(), Sinusoidal()]
+        s = self.air | self.sio2(15, 3)
+        for i in range(20):
+            s |= SLD(6 + 1j)(50, 4)
+            s |= SLD(1 + 0.1j)(30, 0)
+        s |= self.d2o(0, 5)
+        for i, component in enumerate(s[1:]):
+            component.interfaces = interfaces[i % len(interfaces)]
+
+        slabs = s.slabs()
+        for f in interfaces:
+            f.extent = None
+        assert_allclose(s.slabs(), slabs, atol=1e-13)
+
     def test_pickle(self):
         # need to be able to pickle and unpickle structure
         pkl = pickle.dumps(self.s)
@@ -421,6 +441,219 @@ class TestStructure(object):
         except ImportError:
             pass
 
+    def test_adaptive_contraction(self):
+        q = np.linspace(0.005, 0.2, 100)
+        self.s.contract = 0
+        reflectivity = self.s.reflectivity(q)
+        assert_equal(self.s.contraction_error(q), 0)
+
+        z, sld = self.s.sld_profile(z=np.linspace(-150, 250, 1000))
+        slice_structure = _profile_slicer(z, sld, slice_size=0.5)
+        nslabs = len(slice_structure.slabs())
+        slice_structure.contract = 0.02
+        nslabs_area = len(slice_structure.slabs())
+
+        slice_structure.contract_method = "adaptive"
+        slabs = slice_structure.slabs()
+        assert len(slabs) < nslabs_area
+        assert_allclose(
+            slice_structure.reflectivity(q), reflectivity, rtol=5e-3
+        )
+
+        # choose the contraction for a given tolerance
+        contract = slice_structure.tune_contract(q, rtol=1e-3)
+        assert contract > 0
+        assert slice_structure.contract == contract
+        assert slice_structure.contract_method == "adaptive"
+        assert slice_structure.contraction_error(q) <= 1e-3
+        assert len(slice_structure.slabs()) < nslabs / 4
+
+        # an unattainable tolerance switches contraction off
+        assert_equal(slice_structure.tune_contract(q, rtol=0), 0)
+
+        q = eval(repr(slice_structure))
+        assert q.contract_method == "adaptive"
+
+        # test cythonized contract_adaptive code
+        try:
+            from refnx.reflect._creflect import _contract_adaptive as ca2
+            from refnx.reflect._reflect import _contract_adaptive as ca
+
+            slice_structure.contract = 0
+            slabs = slice_structure.slabs()
+            for dA in [0.01, 0.5, 2]:
+                assert_almost_equal(ca2(slabs, dA), ca(slabs, dA))
+        except ImportError:
+            pass
+
+        # the fronting medium mustn't be merged with a film that has no
+        # roughness on top of it.
+        s = SLD(0) | SLD(4)(30, 0) | SLD(6)(40, 0) | SLD(2.07)(0, 3)
+        s.contract = 0.5
+        s.contract_method = "adaptive"
+        slabs = s.slabs()
+        assert_equal(slabs[:, 0], [0, 30, 40, 0])
+        assert_equal(slabs[:, 1], [0, 4, 6, 2.07])
+        q = np.linspace(0.005, 0.3, 201)
+        assert s.contraction_error(q) < 1e-10
+        try:
+            from refnx.reflect._creflect import _contract_adaptive as ca2
+            from refnx.reflect._reflect import _contract_adaptive as ca
+
+            s.contract = 0
+            slabs = s.slabs()
+            assert_equal(ca2(slabs, 0.5), ca(slabs, 0.5))
+            assert_equal(ca(slabs, 0.5)[:, 1], [0, 4, 6, 2.07])
+        except ImportError:
+            pass
+
+    def test_compile(self):
+        stk = Stack([self.sio2(10, 3), self.h2o(20, 4)], repeats=3)
+        s = self.air | self.sio2(15, 3) | stk | SLD(1.0)(100, 5) | self.d2o
+        s[1].thick.setp(vary=True, bounds=(5, 30))
+        s[3].vfsolv.setp(0.2, vary=True, bounds=(0, 0.5))
+        s[3].rough.constraint = s[1].thick / 3 + 1
+        self.d2o.real.setp(vary=True, bounds=(5, 7))
+        varying = [p for p in s.parameters.flattened() if p.vary]
+
+        rng = np.random.default_rng(1)
+        pvals = np.array(
+            [[rng.uniform(*p.bounds.rv.support()) for p in varying]] * 4
+        )
+        pvals *= np.linspace(0.9, 1.0, 4)[:, np.newaxis]
+
+        for reverse in [False, True]:
+            s.reverse_structure = reverse
+            for solvent in [None, self.h2o]:
+                s.solvent = solvent
+                plan = s.compile(varying)
+                slabs = plan(pvals)
+                assert_equal(slabs.shape, (4, 10, 5))
+                assert_equal(plan(pvals[0]), slabs[0])
+                for row, expected in zip(pvals, slabs):
+                    for p, val in zip(varying, row):
+                        p.value = val
+                    assert_allclose(s.slabs(), expected, rtol=1e-14)
+
+        # the plan is stale if the constants change
+        assert not plan.stale
+        self.sio2.real.value = 3.5
+        assert plan.stale
+        plan = s.compile(varying)
+        stk.repeats.value = 2
+        assert plan.stale
+        plan = s.compile(varying)
+        s[3].rough.constraint = s[1].thick / 2
+        assert plan.stale
+        plan = s.compile(varying)
+        s.append(self.d2o(0, 3))
+        assert plan.stale
+
+        # only slabs can be compiled
+        s[2] = MixedSlab(10, [1, 2], [0.5, 0.5], 3)
+        with pytest.raises(ValueError):
+            s.compile(varying)
+        s[2] = self.sio2(10, 3)
+        s[2].interfaces = Tanh()
+        with pytest.raises(ValueError):
+            s.compile(varying)
+        s[2].interfaces = None
+        s.contract = 1
+        with pytest.raises(ValueError):
+            s.compile(varying)
+
+    def test_slab_cache(self):
+        s = self.s
+        slabs = s.slabs()
+        # a copy of the cached slabs is returned
+        slabs[1, 0] = 1000
+        assert_equal(s.slabs()[1, 0], 100)
+
+        # parameter values
+        s[1].thick.value = 50
+        assert_equal(s.slabs()[1, 0], 50)
+        s.parameters.pvals = np.array(s.parameters) + 1
+        assert_equal(s.slabs()[1, 0], 51)
+        s.parameters.pvals = np.array(s.parameters) - 1
+        assert_equal(s.slabs()[1, 0], 50)
+
+        # constraints, including changes to a parameter's constraint
+        p = Parameter(10)
+        s[1].thick.constraint = 2 * p
+        assert_equal(s.slabs()[1, 0], 20)
+        p.value = 20
+        assert_equal(s.slabs()[1, 0], 40)
+        q = Parameter(1)
+        s[1].thick.constraint = p + q
+        assert_equal(s.slabs()[1, 0], 21)
+        p.value = 1
+        q.value = 2
+        assert_equal(s.slabs()[1, 0], 3)
+        s[1].thick.constraint = None
+        s[1].thick.value = 100
+
+        # attributes of the Structure, its Components and Scatterers
+        s.reverse_structure = True
+        assert_equal(s.slabs()[1, 0], 100)
+        assert_equal(s.slabs()[-1, 1], 0)
+        s.reverse_structure = False
+        s[1].sld = SLD(2.0)
+        assert_equal(s.slabs()[1, 1], 2.0)
+        s[1].sld.real = Parameter(3.0)
+        assert_equal(s.slabs()[1, 1], 3.0)
+        s[1].interfaces = Tanh()
+        slabs = s.slabs()
+        assert len(slabs) > 3
+        s[1].interfaces.extent = 0.5
+        assert np.any(np.abs(s.slabs() - slabs) > 1e-3)
+
+        # adding and removing components
+        s[1] = self.sio2(10, 3)
+        assert_equal(s.slabs()[1, 0], 10)
+        s.insert(1, self.h2o(20, 3))
+        assert_equal(s.slabs()[1:3, 0], [20, 10])
+        stk = Stack([self.sio2(5, 3)], repeats=2)
+        s.insert(1, stk)
+        assert_equal(s.slabs()[1:5, 0], [5, 5, 20, 10])
+        stk.append(self.h2o(6, 3))
+        assert_equal(s.slabs()[1:5, 0], [5, 6, 5, 6])
+        stk.repeats.value = 1
+        assert_equal(s.slabs()[1:5, 0], [5, 6, 20, 10])
+        del s[1]
+        assert_equal(s.slabs()[1:3, 0], [20, 10])
+
+        # the cache isn't pickled, the unpickled structure is still watched
+        s2 = pickle.loads(pickle.dumps(s))
+        assert_equal(s2.slabs(), s.slabs())
+        s2[1].thick.value = 35
+        assert_equal(s2.slabs()[1, 0], 35)
+        assert_equal(s.slabs()[1, 0], 20)
+
+        # the unchanged Components aren't recalculated
+        class CountingSlab(Slab):
+            calls = 0
+
+            def slabs(self, structure=None):
+                CountingSlab.calls += 1
+                return super(CountingSlab, self).slabs(structure=structure)
+
+        counting = CountingSlab(10, 2.0, 3)
+        s.insert(1, counting)
+        s.slabs()
+        calls = CountingSlab.calls
+        s[2].thick.value = 25
+        assert_equal(s.slabs()[2, 0], 25)
+        assert_equal(CountingSlab.calls, calls)
+        counting.thick.value = 15
+        assert_equal(s.slabs()[1, 0], 15)
+        assert_equal(CountingSlab.calls, calls + 1)
+
+        # creating an SLD, e.g. the default solvent, doesn't invalidate them
+        SLD(1.0 + 0.1j)
+        SLD(3.0)
+        s.slabs()
+        assert_equal(CountingSlab.calls, calls + 1)
+
     def test_stack(self):
         stk = Stack()
         slabs = stk.slabs(None)
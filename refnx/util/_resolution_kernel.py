@@ -5,7 +5,7 @@ This code compares well to the kernel calculated using MCMC in:
 github.com/refnx/refnx-models/blob/master/platypus-simulate/tof_simulator.py
 """
 import numpy as np
-from scipy import stats, integrate, constants, optimize
+from scipy import stats, integrate, constants, optimize, signal
 
 import refnx.util.general as general
 
@@ -70,12 +70,14 @@ def pq_theta(p_theta, theta0, wavelength0, Q):
     ----------
     p_theta: P_Theta
         PDF of angular resolution
-    theta0: float
+    theta0: float or np.ndarray
         nominal angle of incidence, degrees
-    wavelength0: float
+    wavelength0: float or np.ndarray
         nominal wavelength
-    Q: float
-        Q value to evaluate PDF at
+    Q: np.ndarray
+        Q values to evaluate PDF at. The PDF is normalised along the last
+        axis, `theta0` and `wavelength0` must broadcast against the leading
+        axes.
 
     Returns
     -------
@@ -84,7 +86,7 @@ def pq_theta(p_theta, theta0, wavelength0, Q):
     """
     theta = np.radians(general.angle(Q, wavelength0) - theta0)
     pdf = wavelength0 / 4 / np.pi / np.cos(theta) * p_theta(theta)
-    pdf /= integrate.simps(pdf, x=Q)
+    pdf /= integrate.simps(pdf, x=Q)[..., np.newaxis]
     return pdf
 
 
@@ -226,12 +228,14 @@ def pq_wavelength(p_wavelength, theta0, wavelength0, Q, spectrum=None):
     ----------
     p_wavelength: P_Wavelength
         PDF of wavelength resolution
-    theta0: float
+    theta0: float or np.ndarray
         nominal angle of incidence, degrees
-    wavelength0: float
+    wavelength0: float or np.ndarray
         nominal wavelength
-    Q: float
-        Q value to evaluate PDF at
+    Q: np.ndarray
+        Q values to evaluate PDF at. The PDF is normalised along the last
+        axis, `theta0` and `wavelength0` must broadcast against the leading
+        axes.
     spectrum: callable
         Function, spectrum(wavelength) that specifies the intensity of
         the neutron spectrum at a given wavelength
@@ -248,13 +252,19 @@ def pq_wavelength(p_wavelength, theta0, wavelength0, Q, spectrum=None):
     pdf *= f(wavelength) / Q / Q
 
     # spectrum function may not be normalised.
-    pdf /= integrate.simps(pdf, Q)
+    pdf /= integrate.simps(pdf, Q)[..., np.newaxis]
 
     return pdf
 
 
 def resolution_kernel(
-    p_theta, p_wavelength, theta0, wavelength0, npnts=1001, spectrum=None
+    p_theta,
+    p_wavelength,
+    theta0,
+    wavelength0,
+    npnts=1001,
+    spectrum=None,
+    compact=False,
 ):
     """
     Creates a full resolution kernel based on angular and wavelength components
@@ -273,15 +283,24 @@ def resolution_kernel(
         number of points in the resolution kernel
     spectrum: None or callable
         Function, spectrum(wavelength) that specifies the intensity of
-        the neutron spectrum at a given wavelength
+        the neutron spectrum at a given wavelength. It is called with arrays
+        of wavelengths.
+    compact: bool, optional
+        Return the kernel as a :class:`CompactKernel`, which only stores the
+        points that make a non-negligible contribution to each kernel.
 
     Returns
     -------
-    kernel: np.ndarray
+    kernel: np.ndarray or CompactKernel
         Full resolution kernel. Has shape `(N, 2, npnts)` where `N` is the
         number of points in theta0/wavelength0.
         kernel[:, 0, :] and kernel[:, 1, :] correspond to `Q` and `PDF(Q)` for
         each of the data points in the first dimension.
+
+    Notes
+    -----
+    The kernels are calculated for blocks of points at a time, the
+    convolutions of the resolution components are done with FFTs.
     """
     theta0_arr = np.asfarray(theta0).ravel()
     wavelength0_arr = np.asfarray(wavelength0).ravel()
@@ -299,41 +318,197 @@ def resolution_kernel(
     )
     width = max_q - mean_q
 
-    kernel = np.zeros((qpnts, 2, npnts))
-
-    for i in range(qpnts):
-        Q = np.linspace(mean_q[i] - width[i], mean_q[i] + width[i], npnts)
-        kernel[i, 0, :] = Q
+    kernels = []
+    for i in range(0, qpnts, 256):
+        sl = slice(i, i + 256)
+        Q = np.linspace(
+            mean_q[sl] - width[sl], mean_q[sl] + width[sl], npnts, axis=-1
+        )
+        theta0_i = theta0_arr[sl, np.newaxis]
+        wavelength0_i = wavelength0_arr[sl, np.newaxis]
 
         # angular component
-        pqt = pq_theta(p_theta, theta0_arr[i], wavelength0_arr[i], Q)
+        pqt = pq_theta(p_theta, theta0_i, wavelength0_i, Q)
 
         # burst time component
         pqb = pq_wavelength(
-            p_wavelength.burst, theta0_arr[i], wavelength0_arr[i], Q, spectrum
+            p_wavelength.burst, theta0_i, wavelength0_i, Q, spectrum
         )
 
         # crossing time component
         pqc = pq_wavelength(
-            p_wavelength.crossing,
-            theta0_arr[i],
-            wavelength0_arr[i],
-            Q,
-            spectrum,
+            p_wavelength.crossing, theta0_i, wavelength0_i, Q, spectrum
         )
 
         # rebinning component
         pqda = pq_wavelength(
-            p_wavelength.da, theta0_arr[i], wavelength0_arr[i], Q, spectrum
+            p_wavelength.da, theta0_i, wavelength0_i, Q, spectrum
         )
 
-        spacing = np.diff(Q)[0]
+        spacing = Q[:, 1:2] - Q[:, 0:1]
 
-        p = np.convolve(pqt, pqb, "same")
-        p = np.convolve(p, pqc, "same")
-        p = np.convolve(p, pqda, "same")
+        p = signal.fftconvolve(pqt, pqb, mode="same", axes=-1)
+        p = signal.fftconvolve(p, pqc, mode="same", axes=-1)
+        p = signal.fftconvolve(p, pqda, mode="same", axes=-1)
+        # FFT round off can make zero probabilities slightly negative
+        np.clip(p, 0, None, out=p)
         p *= spacing ** 3.0
 
-        kernel[i, 1, :] = p / integrate.simps(p, Q)
+        kernel = np.stack([Q, p / integrate.simps(p, Q)[:, np.newaxis]], 1)
+        if compact:
+            kernel = CompactKernel.from_kernel(kernel)
+        kernels.append(kernel)
+
+    if compact:
+        return CompactKernel.concatenate(kernels)
+    return np.concatenate(kernels)
+
+
+class CompactKernel(object):
+    """
+    Resolution kernels, stored as the quadrature that smears a reflectivity
+    curve.
+
+    Only the points that make a non-negligible contribution to each kernel
+    are stored. The resolution smeared value of the i'th point is
+    `np.sum((R(q) * weights)[offsets[i]:offsets[i + 1]])`, see
+    :meth:`CompactKernel.smear`.
+
+    Parameters
+    ----------
+    q: np.ndarray
+        Q values of the retained kernel points, concatenated for all the
+        kernels.
+    weights: np.ndarray
+        Quadrature weight of each point, the probability multiplied by the
+        weight for Simpson's rule integration.
+    offsets: np.ndarray
+        Index of the first point of each kernel.
+
+    Notes
+    -----
+    This representation can be supplied as the resolution (`dq`) for a
+    reflectivity calculation.
+    """
+
+    def __init__(self, q, weights, offsets):
+        self.q = np.asfarray(q)
+        self.weights = np.asfarray(weights)
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+
+    def __len__(self):
+        return self.offsets.size
+
+    def __repr__(self):
+        return f"<CompactKernel: {len(self)} kernels, {self.q.size} points>"
+
+    @classmethod
+    def from_kernel(cls, kernel, tol=1e-12):
+        """
+        Compacts a full resolution kernel.
+
+        Parameters
+        ----------
+        kernel: np.ndarray
+            Full resolution kernel, has shape `(..., 2, M)`. `kernel[..., 0,
+            :]` and `kernel[..., 1, :]` correspond to `Q` and `PDF(Q)`.
+        tol: float, optional
+            Points whose quadrature weight is smaller than `tol` times the
+            largest weight in their kernel are discarded.
+
+        Returns
+        -------
+        compact_kernel: CompactKernel
+        """
+        npnts = kernel.shape[-1]
+        x = np.reshape(kernel[..., 0, :], (-1, npnts))
+        weights = _simpson_weights(x) * np.reshape(kernel[..., 1, :], x.shape)
+
+        # a kernel always keeps at least one point (and all its points if
+        # they're not finite)
+        largest = np.max(np.abs(weights), axis=-1, keepdims=True)
+        keep = ~(np.abs(weights) < tol * largest)
+        counts = np.sum(keep, axis=-1)
+        return cls(x[keep], weights[keep], np.cumsum(counts) - counts)
+
+    @classmethod
+    def concatenate(cls, kernels):
+        """
+        Joins several CompactKernel together.
+
+        Parameters
+        ----------
+        kernels: sequence of CompactKernel
+
+        Returns
+        -------
+        compact_kernel: CompactKernel
+        """
+        starts = np.cumsum([0] + [k.q.size for k in kernels[:-1]])
+        return cls(
+            np.concatenate([k.q for k in kernels]),
+            np.concatenate([k.weights for k in kernels]),
+            np.concatenate([k.offsets + s for k, s in zip(kernels, starts)]),
+        )
+
+    def smear(self, r):
+        """
+        Resolution smears values calculated at :attr:`CompactKernel.q`
+
+        Parameters
+        ----------
+        r: np.ndarray
+            Values calculated at each of the kernel points, has shape
+            `(..., q.size)`.
+
+        Returns
+        -------
+        smeared: np.ndarray
+            Has shape `(..., len(self))`
+        """
+        return np.add.reduceat(r * self.weights, self.offsets, axis=-1)
+
+
+def _simpson_weights(x):
+    """
+    Weights for Simpson's rule integration of samples at `x`, such that
+    `np.sum(weights * y, axis=-1) == scipy.integrate.simps(y, x=x)`.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Sample points, has shape `(N, M)`. Each row is integrated separately.
+
+    Returns
+    -------
+    weights : np.ndarray
+        Has shape `(N, M)`
+    """
+    npnts = x.shape[-1]
+    if npnts % 2 == 0 or npnts < 3:
+        # scipy has several ways of dealing with an even number of points,
+        # integrate the identity matrix to get the same weights
+        eye = np.eye(npnts)
+        return np.stack(
+            [
+                integrate.simps(eye, x=np.broadcast_to(row, eye.shape))
+                for row in x
+            ]
+        )
 
-    return kernel
+    h = np.diff(x, axis=-1)
+    h0 = h[:, 0::2]
+    h1 = h[:, 1::2]
+    hsum = h0 + h1
+    hprod = h0 * h1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h0divh1 = np.where(h1 != 0, h0 / h1, 0)
+        c0 = 2.0 - np.where(h0divh1 != 0, 1.0 / h0divh1, 0)
+        c1 = hsum * np.where(hprod != 0, hsum / hprod, 0)
+        c2 = 2.0 - h0divh1
+
+    weights = np.zeros_like(x)
+    weights[:, 0:-1:2] += hsum / 6.0 * c0
+    weights[:, 1::2] += hsum / 6.0 * c1
+    weights[:, 2::2] += hsum / 6.0 * c2
+    return weights
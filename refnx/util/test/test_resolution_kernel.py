@@ -0,0 +1,94 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal
+from scipy import integrate
+
+from refnx.util._resolution_kernel import (
+    P_Theta,
+    P_Wavelength,
+    CompactKernel,
+    pq_theta,
+    pq_wavelength,
+    resolution_kernel,
+    _simpson_weights,
+)
+
+
+class TestResolutionKernel(object):
+    def setup_method(self):
+        self.p_theta = P_Theta(2.0, 0.5)
+        self.p_wavelength = P_Wavelength(350, 7200, 24, 0.35, xsi=60)
+        self.theta0 = np.r_[np.full(5, 0.8), np.full(5, 3.0)]
+        self.wavelength0 = np.tile(np.linspace(6, 18, 5), 2)
+
+    def test_resolution_kernel(self):
+        # the vectorised calculation should agree with calculating the kernel
+        # for each point separately
+        npnts = 201
+        kernel = resolution_kernel(
+            self.p_theta,
+            self.p_wavelength,
+            self.theta0,
+            self.wavelength0,
+            npnts=npnts,
+        )
+        assert_equal(kernel.shape, (10, 2, npnts))
+
+        for i, (theta0, wavelength0) in enumerate(
+            zip(self.theta0, self.wavelength0)
+        ):
+            Q = kernel[i, 0]
+            pqt = pq_theta(self.p_theta, theta0, wavelength0, Q)
+            p = pqt
+            for component in [
+                self.p_wavelength.burst,
+                self.p_wavelength.crossing,
+                self.p_wavelength.da,
+            ]:
+                pq = pq_wavelength(component, theta0, wavelength0, Q)
+                p = np.convolve(p, pq, "same")
+            p /= integrate.simps(p, Q)
+
+            assert_allclose(kernel[i, 1], p, atol=1e-12 * np.max(p))
+            assert_allclose(integrate.simps(kernel[i, 1], Q), 1)
+
+    def test_compact_kernel(self):
+        kernel = resolution_kernel(
+            self.p_theta, self.p_wavelength, self.theta0, self.wavelength0
+        )
+        compact = resolution_kernel(
+            self.p_theta,
+            self.p_wavelength,
+            self.theta0,
+            self.wavelength0,
+            compact=True,
+        )
+        assert_equal(len(compact), 10)
+        assert compact.q.size < kernel[:, 0].size
+
+        # smearing with the compact kernel is the same as integrating the
+        # full kernel
+        def f(q):
+            return np.exp(-q * 30)
+
+        expected = integrate.simps(
+            f(kernel[:, 0]) * kernel[:, 1], kernel[:, 0]
+        )
+        assert_allclose(compact.smear(f(compact.q)), expected, rtol=1e-12)
+
+        # concatenation
+        joined = CompactKernel.concatenate(
+            [
+                CompactKernel.from_kernel(kernel[:3]),
+                CompactKernel.from_kernel(kernel[3:]),
+            ]
+        )
+        assert_allclose(joined.smear(f(joined.q)), expected, rtol=1e-12)
+
+    def test_simpson_weights(self):
+        # for odd and even numbers of points
+        rng = np.random.default_rng(0)
+        for npnts in [10, 11]:
+            x = np.cumsum(rng.uniform(0.5, 1, size=(3, npnts)), axis=1)
+            y = rng.random((3, npnts))
+            weights = _simpson_weights(x)
+            assert_allclose(np.sum(weights * y, axis=1), integrate.simps(y, x))
@@ -0,0 +1,9 @@
+
+# THIS FILE IS GENERATED FROM REFNX SETUP.PY
+short_version = '0.1.17'
+version = '0.1.17'
+full_version = '0.1.17.dev0+c194ce6'
+git_revision = 'c194ce67b313b464cb2f3bfeff926c65fd057122'
+release = False
+if not release:
+    version = full_version
@@ -369,12 +369,29 @@ def setup_package():
                 )
                 f = ['src/refcalc.c']
             refcalc_obj = ccompiler.compile(f, extra_preargs=extra_preargs)
+
+            # the mixed precision calculator relies on vectorisation by the
+            # compiler. It mustn't be compiled with -fassociative-math, which
+            # would reorder the range reduction of its exp/sincos functions.
+            if sys.platform == 'win32':
+                mixed_preargs = ['/O2']
+            else:
+                mixed_preargs = ['-O3',
+                                 '-std=c11',
+                                 '-fno-math-errno',
+                                 '-fno-trapping-math',
+                                 '-fno-signed-zeros',
+                                 '-ffinite-math-only',
+                                 ]
+            refcalc_obj += ccompiler.compile(['src/refcalc_mixed.c'],
+                                             extra_preargs=mixed_preargs)
             print(refcalc_obj)
 
             _creflect = Extension(
                 name='refnx.reflect._creflect',
                 sources=['src/_creflect.pyx',
-                         'src/refcaller.cpp'],
+                         'src/refcaller.cpp',
+                         'src/pnrcalc.cpp'],
                 include_dirs=[numpy_include],
                 language='c++',
                 extra_compile_args=['-std=c++11'],
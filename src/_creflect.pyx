@@ -35,6 +35,14 @@ cdef extern from "refcaller.h" nogil:
                  const double *xP)
     void reflectMT(int numcoefs, const double *coefP, int npoints, double *yP,
                    const double *xP, int threads)
+    void reflect_batch(int nstructures, int numcoefs, const double *coefP,
+                       int npoints, double *yP, const double *xP,
+                       int threads)
+    void reflect_batch_mixed(int nstructures, int numcoefs,
+                             const double *coefP, int npoints, double *yP,
+                             const double *xP, int threads)
+    void pnr_batch(int nstructures, int nlayers, const double *layers,
+                   int npoints, double *yP, const double *xP, int threads)
 
 DTYPE = np.float64
 ctypedef cnp.float64_t DTYPE_t
@@ -47,10 +55,11 @@ cdef int NCPU = cpu_count()
 @cython.boundscheck(False)
 @cython.cdivision(True)
 cpdef cnp.ndarray abeles(cnp.ndarray x,
-                         double[:, :] w,
-                         double scale=1.0,
-                         double bkg=0.,
-                         int threads=-1):
+                         w,
+                         scale=1.0,
+                         bkg=0.,
+                         int threads=-1,
+                         precision="double"):
     """Abeles matrix formalism for calculating reflectivity from a stratified
     medium.
 
@@ -72,20 +81,51 @@ cpdef cnp.ndarray abeles(cnp.ndarray x,
         layers[-1, 1] - SLD of backing (/1e-6 Angstrom**-2)
         layers[-1, 2] - iSLD of backing (/1e-6 Angstrom**-2)
         layers[-1, 3] - roughness between backing and last layer
-    scale: float
-        Multiply all reflectivities by this value.
-    bkg: float
-        Linear background to be added to all reflectivities
+
+        If `layers` has shape (K, 2 + N, 4) then the reflectivity of K
+        structures is calculated in a single call.
+    scale: float or array_like
+        Multiply all reflectivities by this value. For a batch of structures
+        this can be an array of shape (K,).
+    bkg: float or array_like
+        Linear background to be added to all reflectivities. For a batch of
+        structures this can be an array of shape (K,).
     threads: int, optional
         How many threads you would like to use in the reflectivity calculation.
         If `threads == -1` then the calculation is automatically spread over
         `multiprocessing.cpu_count()` threads.
+    precision: {'double', 'mixed'}, optional
+        With 'mixed' precision the calculations for each layer are done in
+        single precision, and the matrix product is accumulated in double
+        precision.
 
     Returns
     -------
     Reflectivity: np.ndarray
-        Calculated reflectivity values for each q value.
+        Calculated reflectivity values for each q value. For a batch of
+        structures the array has shape `(K,) + q.shape`.
     """
+    cdef bint mixed = precision == "mixed"
+    if not mixed and precision != "double":
+        raise ValueError("precision must be one of 'double' or 'mixed'")
+
+    if np.ndim(w) == 3:
+        return _abeles_batch(x, np.asarray(w, dtype=DTYPE), scale, bkg,
+                             threads, mixed)
+    elif mixed:
+        return _abeles_batch(x, np.asarray(w, dtype=DTYPE)[np.newaxis],
+                             scale, bkg, threads, mixed)[0]
+
+    return _abeles(x, w, scale, bkg, threads)
+
+
+@cython.boundscheck(False)
+@cython.cdivision(True)
+cdef cnp.ndarray _abeles(cnp.ndarray x,
+                         double[:, :] w,
+                         double scale=1.0,
+                         double bkg=0.,
+                         int threads=-1):
     if w.shape[1] != 4 or w.shape[0] < 2:
         raise ValueError("Layer parameters for _creflect must be an array of"
                          " shape (>2, 4)")
@@ -131,6 +171,115 @@ cpdef cnp.ndarray abeles(cnp.ndarray x,
     return y
 
 
+cdef cnp.ndarray _abeles_batch(cnp.ndarray x,
+                               cnp.ndarray w,
+                               scale=1.0,
+                               bkg=0.,
+                               int threads=-1,
+                               bint mixed=False):
+    # calculates the reflectivity of a (K, 2 + N, 4) array of structures,
+    # with all K * npoints calculations being spread over the threads.
+    if w.shape[2] != 4 or w.shape[1] < 2:
+        raise ValueError("Layer parameters for _creflect must be an array of"
+                         " shape (K, >2, 4)")
+    if x.dtype != np.float64:
+        raise ValueError("Q values for _creflect must be np.float64")
+
+    cdef:
+        int nstructures = w.shape[0]
+        int nlayers = w.shape[1] - 2
+        int numcoefs = 4 * nlayers + 8
+        int npoints = x.size
+        cnp.ndarray[DTYPE_t, ndim=2] coefs = np.empty((nstructures, numcoefs),
+                                                      DTYPE)
+        cnp.ndarray xc = np.ascontiguousarray(x, dtype=DTYPE)
+        cnp.ndarray y = np.empty((nstructures,) + (<object>x).shape, DTYPE)
+
+    coefs[:, 0] = nlayers
+    coefs[:, 1] = scale
+    coefs[:, 2:4] = w[:, 0, 1:3]
+    coefs[:, 4:6] = w[:, -1, 1:3]
+    coefs[:, 6] = bkg
+    coefs[:, 7] = w[:, -1, 3]
+    if nlayers:
+        coefs[:, 8::4] = w[:, 1:-1, 0]
+        coefs[:, 9::4] = w[:, 1:-1, 1]
+        coefs[:, 10::4] = w[:, 1:-1, 2]
+        coefs[:, 11::4] = w[:, 1:-1, 3]
+
+    with nogil:
+        if threads == -1:
+            threads = NCPU
+        elif threads == 0:
+            threads = 1
+
+        if mixed:
+            reflect_batch_mixed(nstructures, numcoefs,
+                                <const double*>coefs.data, npoints,
+                                <double*>y.data, <const double*>xc.data,
+                                threads)
+        else:
+            reflect_batch(nstructures, numcoefs, <const double*>coefs.data,
+                          npoints, <double*>y.data, <const double*>xc.data,
+                          threads)
+
+    return y
+
+
+cpdef cnp.ndarray pnr(q, layers, int threads=-1):
+    """
+    Calculates Polarised Neutron Reflectivity of a series of slabs.
+
+    No interlayer roughness is taken into account.
+
+    Parameters
+    ----------
+    q: array_like
+        the q values required for the calculation.
+        Q = 4 * Pi / lambda * sin(omega).
+        Units = Angstrom**-1
+    layers: np.ndarray
+        coefficients required for the calculation, has shape (2 + N, 5),
+        where N is the number of layers. See `refnx.reflect._reflect.pnr` for
+        details. If `layers` has shape (K, 2 + N, 5) then the reflectivity of
+        K structures is calculated in a single call.
+    threads: int, optional
+        How many threads you would like to use in the reflectivity calculation.
+        If `threads == -1` then the calculation is automatically spread over
+        `multiprocessing.cpu_count()` threads.
+
+    Returns
+    -------
+    reflectivity: np.ndarray
+        Calculated Polarised Neutron Reflectivity values for each q value,
+        (PP, MM, PM, MP). Has shape `(4,) + q.shape`, or `(4, K) + q.shape`
+        for a batch of structures.
+    """
+    w = np.ascontiguousarray(layers, dtype=DTYPE)
+    if w.ndim not in (2, 3) or w.shape[-1] != 5 or w.shape[-2] < 2:
+        raise ValueError("Layer parameters for _creflect.pnr must be an array"
+                         " of shape (>2, 5) or (K, >2, 5)")
+
+    cdef:
+        cnp.ndarray wc = w
+        cnp.ndarray xc = np.ascontiguousarray(q, dtype=DTYPE)
+        int nlayers = w.shape[-2] - 2
+        int nstructures = w.size // (5 * (nlayers + 2))
+        int npoints = xc.size
+        cnp.ndarray y = np.empty((4,) + w.shape[:-2] + np.shape(q), DTYPE)
+
+    with nogil:
+        if threads == -1:
+            threads = NCPU
+        elif threads == 0:
+            threads = 1
+
+        pnr_batch(nstructures, nlayers, <const double*>wc.data, npoints,
+                  <double*>y.data, <const double*>xc.data, threads)
+
+    return y
+
+
 cpdef _contract_by_area(cnp.ndarray[cnp.float64_t, ndim=2] slabs, dA=0.5):
     newslabs = np.copy(slabs)[::-1]
 
@@ -204,3 +353,80 @@ cpdef _contract_by_area(cnp.ndarray[cnp.float64_t, ndim=2] slabs, dA=0.5):
             newi += 1
 
     return newslabs[:newi][::-1]
+
+
+cpdef _contract_adaptive(cnp.ndarray[cnp.float64_t, ndim=2] slabs, dA=0.5):
+    newslabs = np.copy(slabs)[::-1]
+
+    cdef:
+        double [:, :] newslabs_view = newslabs
+        double [:] d = newslabs_view[:, 0]
+        double [:] rho = newslabs_view[:, 1]
+        double [:] irho = newslabs_view[:, 2]
+        double [:] sigma = newslabs[:, 3]
+        double [:] vfsolv = newslabs[:, 4]
+
+        size_t n = np.size(d, 0)
+        size_t i, newi
+        double dz, rhoarea, irhoarea, vfsolvarea, rho2area, irho2area
+        double ndz, area, area2
+        double da2 = float(dA) ** 2
+
+    with nogil:
+        i = 1
+        newi = 1 # skip the substrate
+
+        while i < n:
+            # Get ready for the next layer
+            # Accumulation of the first row happens in the inner loop
+            dz = rhoarea = irhoarea = vfsolvarea = 0.
+            rho2area = irho2area = 0.
+
+            # Accumulate slices into layer
+            while True:
+                # Accumulate next slice
+                dz += d[i]
+                rhoarea += d[i] * rho[i]
+                irhoarea += d[i] * irho[i]
+                rho2area += d[i] * rho[i] * rho[i]
+                irho2area += d[i] * irho[i] * irho[i]
+                vfsolvarea += d[i] * vfsolv[i]
+
+                i += 1
+                # If no more slices or sigma != 0, break immediately
+                if i == n or sigma[i - 1] != 0.:
+                    break
+
+                # The fronting medium is always a layer of its own
+                if i == n - 1:
+                    break
+
+                # If next slice won't fit, break
+                ndz = dz + d[i]
+                area = rhoarea + d[i] * rho[i]
+                area2 = rho2area + d[i] * rho[i] * rho[i]
+                if ndz * area2 - area * area > da2:
+                    break
+
+                area = irhoarea + d[i] * irho[i]
+                area2 = irho2area + d[i] * irho[i] * irho[i]
+                if ndz * area2 - area * area > da2:
+                    break
+
+            # Save the layer
+            d[newi] = dz
+            if i == n:
+                # Last layer uses surface values
+                rho[newi] = rho[n - 1]
+                irho[newi] = irho[n - 1]
+                vfsolv[newi] = vfsolv[n - 1]
+            else:
+                # Middle layers uses average values
+                rho[newi] = rhoarea / dz
+                irho[newi] = irhoarea / dz
+                sigma[newi] = sigma[i - 1]
+                vfsolv[newi] = vfsolvarea / dz
+            # First layer uses substrate values
+            newi += 1
+
+    return newslabs[:newi][::-1]
@@ -22,8 +22,20 @@ cdef extern from "<math.h>" nogil:
     double fabs(double)
 
 
-cpdef abeles(x, cnp.ndarray[DTYPE_t, ndim=2] w,
-             double scale=1.0, double bkg=0., int threads=-1):
+cpdef abeles(x, w, scale=1.0, bkg=0., int threads=-1):
+    if np.ndim(w) == 3:
+        # a batch of structures is calculated one at a time
+        w = np.asarray(w, dtype=DTYPE)
+        scale = np.broadcast_to(scale, len(w))
+        bkg = np.broadcast_to(bkg, len(w))
+        return np.stack([_abeles_single(x, wk, sk, bk, threads)
+                         for wk, sk, bk in zip(w, scale, bkg)])
+
+    return _abeles_single(x, w, scale, bkg, threads)
+
+
+cdef _abeles_single(x, cnp.ndarray[DTYPE_t, ndim=2] w,
+                    double scale=1.0, double bkg=0., int threads=-1):
 
     # we need the abscissae in a contiguous block of memory
     cdef double[:] xtemp = np.ascontiguousarray(x, dtype=DTYPE).flatten()
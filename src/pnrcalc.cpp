@@ -0,0 +1,187 @@
+/*
+    pnrcalc.cpp
+
+    *Calculates the polarised neutron reflectivity from a stratified series
+    of magnetic layers.
+
+The refnx code is distributed under the following license:
+
+Copyright (c) 2015 A. R. J. Nelson, Australian Nuclear Science and Technology Organisation
+
+Permission to use and redistribute the source code or binary forms of this
+software and its documentation, with or without modification is hereby
+granted provided that the above notice of copyright, these terms of use,
+and the disclaimer of warranty below appear in the source code and
+documentation, and that none of the names of above institutions or
+authors appear in advertising or endorsement of works derived from this
+software without specific prior written permission from all parties.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THIS SOFTWARE.
+
+*/
+
+/*
+This is a port of refnx.reflect._reflect.pnr. The 4x4 matrices of that
+calculation are mostly made of 2x2 blocks:
+
+    D P D^-1 = [[B_u, 0], [0, B_d]]        R = [[cI, sI], [-sI, cI]]
+
+where B_u, B_d are the characteristic matrices of a layer for the up and down
+spin states, c = cos(dtheta / 2), s = sin(dtheta / 2). The running product is
+only updated with the non-zero blocks.
+*/
+
+#include <math.h>
+#include <complex>
+#include <cmath>
+#include <vector>
+
+#define PI 3.14159265358979323846
+
+using namespace std;
+
+typedef complex<double> cplx;
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#include "pnrcalc.h"
+
+
+static inline void
+matmul4(const cplx a[4][4], const cplx b[4][4], cplx c[4][4]){
+    for(int i = 0; i < 4; i++){
+        for(int j = 0; j < 4; j++){
+            c[i][j] = a[i][0] * b[0][j] + a[i][1] * b[1][j]
+                      + a[i][2] * b[2][j] + a[i][3] * b[3][j];
+        }
+    }
+}
+
+
+void PNRCalc_All(int nlayers,
+                 const double *layers,
+                 int npoints,
+                 double *yP,
+                 long stride,
+                 const double *xP){
+    int nrows = nlayers + 2;
+
+    // SLDs (relative to the fronting medium) for up and down spin states
+    vector<cplx> sldu(nrows), sldd(nrows);
+    // rotation of the magnetic moment at each interface
+    vector<double> cos_term(nrows - 1), sin_term(nrows - 1);
+
+    for(int ii = 0; ii < nrows; ii++){
+        const double *row = layers + 5 * ii;
+        cplx sld = cplx(row[1] - layers[1], row[2] - layers[2]);
+        double mag = row[3] - layers[3];
+        sldu[ii] = 4e-6 * PI * (sld + mag);
+        sldd[ii] = 4e-6 * PI * (sld - mag);
+
+        if(ii){
+            double dtheta = (row[4] - layers[5 * (ii - 1) + 4]) * PI / 180.;
+            cos_term[ii - 1] = cos(dtheta / 2.);
+            sin_term[ii - 1] = sin(dtheta / 2.);
+        }
+    }
+
+    for(int j = 0; j < npoints; j++){
+        cplx qq2 = cplx(xP[j] * xP[j] / 4, 0);
+        cplx mm[4][4] = {};
+        cplx temp[4][4];
+
+        for(int ii = 0; ii < 4; ii++){
+            mm[ii][ii] = 1;
+        }
+
+        // iterate over layers
+        for(int ii = 1; ii < nlayers + 1; ii++){
+            double thickness = layers[5 * ii];
+            cplx kn[2] = {std::sqrt(qq2 - sldu[ii]), std::sqrt(qq2 - sldd[ii])};
+            cplx blk[2][2][2];
+
+            for(int s = 0; s < 2; s++){
+                // p = exp(i kn d), p_inv = exp(-i kn d)
+                double phase = kn[s].real() * thickness;
+                double grow = std::exp(kn[s].imag() * thickness);
+                double cos_phase = cos(phase);
+                double sin_phase = sin(phase);
+                cplx p(cos_phase / grow, sin_phase / grow);
+                cplx p_inv(cos_phase * grow, -sin_phase * grow);
+
+                blk[s][0][0] = 0.5 * (p_inv + p);
+                blk[s][0][1] = 0.5 * (p_inv - p) / kn[s];
+                blk[s][1][0] = 0.5 * kn[s] * (p_inv - p);
+                blk[s][1][1] = blk[s][0][0];
+            }
+
+            double c = cos_term[ii];
+            double sn = sin_term[ii];
+
+            // mm = mm @ [[c B_u, s B_u], [-s B_d, c B_d]]
+            for(int r = 0; r < 4; r++){
+                for(int col = 0; col < 2; col++){
+                    cplx au = mm[r][0] * blk[0][0][col]
+                              + mm[r][1] * blk[0][1][col];
+                    cplx bd = mm[r][2] * blk[1][0][col]
+                              + mm[r][3] * blk[1][1][col];
+                    temp[r][col] = c * au - sn * bd;
+                    temp[r][col + 2] = sn * au + c * bd;
+                }
+            }
+            for(int r = 0; r < 4; r++){
+                for(int col = 0; col < 4; col++){
+                    mm[r][col] = temp[r][col];
+                }
+            }
+        }
+
+        // D^-1 for the fronting medium, R for the first interface and D for
+        // the backing medium
+        cplx ku0 = std::sqrt(qq2 - sldu[0]);
+        cplx kd0 = std::sqrt(qq2 - sldd[0]);
+        cplx kun = std::sqrt(qq2 - sldu[nrows - 1]);
+        cplx kdn = std::sqrt(qq2 - sldd[nrows - 1]);
+        double c = cos_term[0];
+        double sn = sin_term[0];
+
+        cplx d_inv_r[4][4] = {
+            {0.5 * c, 0.5 / ku0 * c, 0.5 * sn, 0.5 / ku0 * sn},
+            {0.5 * c, -0.5 / ku0 * c, 0.5 * sn, -0.5 / ku0 * sn},
+            {-0.5 * sn, -0.5 / kd0 * sn, 0.5 * c, 0.5 / kd0 * c},
+            {-0.5 * sn, 0.5 / kd0 * sn, 0.5 * c, -0.5 / kd0 * c}
+        };
+        cplx d[4][4] = {
+            {1., 1., 0., 0.},
+            {kun, -kun, 0., 0.},
+            {0., 0., 1., 1.},
+            {0., 0., kdn, -kdn}
+        };
+        cplx M[4][4];
+
+        matmul4(d_inv_r, mm, temp);
+        matmul4(temp, d, M);
+
+        // equation 16 in Blundell and Bland
+        cplx den = M[0][0] * M[2][2] - M[0][2] * M[2][0];
+        yP[j] = std::norm((M[1][0] * M[2][2] - M[1][2] * M[2][0]) / den);
+        yP[stride + j] = std::norm(
+            (M[3][2] * M[0][0] - M[3][0] * M[0][2]) / den);
+        yP[2 * stride + j] = std::norm(
+            (M[3][0] * M[2][2] - M[3][2] * M[2][0]) / den);
+        yP[3 * stride + j] = std::norm(
+            (M[1][2] * M[0][0] - M[1][0] * M[0][2]) / den);
+    }
+}
+
+#ifdef __cplusplus
+}
+#endif
@@ -0,0 +1,68 @@
+/*
+    pnrcalc.h
+
+    *Calculates the polarised neutron reflectivity from a stratified series
+    of magnetic layers.
+
+The refnx code is distributed under the following license:
+
+Copyright (c) 2015 A. R. J. Nelson, Australian Nuclear Science and Technology Organisation
+
+Permission to use and redistribute the source code or binary forms of this
+software and its documentation, with or without modification is hereby
+granted provided that the above notice of copyright, these terms of use,
+and the disclaimer of warranty below appear in the source code and
+documentation, and that none of the names of above institutions or
+authors appear in advertising or endorsement of works derived from this
+software without specific prior written permission from all parties.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THIS SOFTWARE.
+
+*/
+
+/*
+    PNRCalc_All calculates the four spin channels of the polarised neutron
+    reflectivity with the 4x4 matrix method of Blundell and Bland (Phys. Rev.
+    B, (1992), 46, 3391). No interlayer roughness is taken into account.
+
+    Parameters
+    ----------
+
+    nlayers - the number of layers, N.
+
+    layers - an array of shape (N + 2, 5) holding the layer parameters. Row 0
+    is the fronting medium, row N + 1 the backing medium. The columns are:
+    thickness (Å), SLD real part, SLD imaginary part, magnetic SLD
+    (10**-6 Å**-2), and the angle of the magnetic moment with respect to the
+    applied field (degrees).
+
+    npoints - the number of points in xP
+
+    yP - this user supplied array is filled by the function. The (PP, MM, PM,
+    MP) reflectivities of point j are placed in yP[j], yP[stride + j],
+    yP[2 * stride + j], yP[3 * stride + j].
+
+    stride - separation of the spin channels in yP.
+
+    xP - array containing the Q (momentum transfer) points. It has units Å**-1.
+    The array is npoints long
+*/
+
+
+#ifndef PNRCALC_H
+#define PNRCALC_H
+
+void PNRCalc_All(int nlayers,
+                 const double *layers,
+                 int npoints,
+                 double *yP,
+                 long stride,
+                 const double *xP);
+
+#endif
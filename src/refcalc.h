@@ -91,4 +91,18 @@ void AbelesCalc_ImagAll(int numcoefs,
                         double *yP,
                         const double *xP);
 
+/*
+    AbelesCalc_ImagAll_mixed is a mixed precision version of
+    AbelesCalc_ImagAll, with the same parameters. The calculations for each
+    layer (wavevectors, Fresnel coefficients and phase factors) are done in
+    single precision, the matrix product is accumulated in double precision.
+    It's defined in refcalc_mixed.c, which calculates blocks of Q points at
+    a time so that the compiler can vectorise the calculation.
+*/
+void AbelesCalc_ImagAll_mixed(int numcoefs,
+                              const double *coefP,
+                              int npoints,
+                              double *yP,
+                              const double *xP);
+
 #endif
@@ -0,0 +1,309 @@
+/*
+    refcalc_mixed.c
+
+    *Calculates the specular (Neutron or X-ray) reflectivity from a stratified
+    series of layers, with the calculations for each layer done in single
+    precision.
+
+The refnx code is distributed under the following license:
+
+Copyright (c) 2015 A. R. J. Nelson, Australian Nuclear Science and Technology Organisation
+
+Permission to use and redistribute the source code or binary forms of this
+software and its documentation, with or without modification is hereby
+granted provided that the above notice of copyright, these terms of use,
+and the disclaimer of warranty below appear in the source code and
+documentation, and that none of the names of above institutions or
+authors appear in advertising or endorsement of works derived from this
+software without specific prior written permission from all parties.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL
+THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THIS SOFTWARE.
+
+*/
+
+/*
+The mixed precision calculation is only worthwhile if the compiler can
+vectorise it, a scalar single precision calculation is barely faster than
+the double precision one (AbelesCalc_ImagAll). Therefore:
+
+1) Blocks of Q points are calculated together, with the inner loops running
+   over the points in a block. Complex numbers are stored as separate real
+   and imaginary arrays.
+2) No complex types or libm complex functions are used. Complex square
+   roots are written in terms of sqrtf, exp and sincos are evaluated by
+   polynomials (from the Cephes library), all of which vectorise.
+3) The loops don't contain branches.
+
+This file is compiled separately to refcalc.c, because it can't be compiled
+with -fassociative-math (part of -funsafe-math-optimizations). That would
+undo the extended precision range reduction in mixed_expf/mixed_sincosf. It
+doesn't use VLAs or C99 complex, so it can also be compiled on Windows.
+*/
+
+#include <math.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "refcalc.h"
+
+#define PI 3.14159265358979323846
+// TINY is required to make sure a complex sqrt takes the correct branch
+#define TINY 1e-30
+// the number of Q points calculated together
+#define BLOCK 64
+
+#if defined(__GNUC__) && !defined(__clang__) && defined(__x86_64__) \
+    && defined(__linux__)
+// Also compile a version using the wider AVX2 registers, which is chosen
+// at runtime if the processor supports it.
+#define MIXED_TARGETS __attribute__((target_clones("avx2", "default")))
+#else
+#define MIXED_TARGETS
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+exp(x) for single precision. Arguments are clamped to avoid overflow.
+*/
+static inline float mixed_expf(float x){
+    float n, r, p, s;
+    int32_t e;
+
+    x = fmaxf(fminf(x, 88.f), -87.f);
+    // exp(x) = 2**n * exp(r), |r| <= ln(2) / 2
+    n = (float) (int32_t) (x * 1.44269504088896341f + copysignf(0.5f, x));
+    r = x - n * 0.693359375f;
+    r = r + n * 2.12194440e-4f;
+
+    p = 1.9875691500E-4f;
+    p = p * r + 1.3981999507E-3f;
+    p = p * r + 8.3334519073E-3f;
+    p = p * r + 4.1665795894E-2f;
+    p = p * r + 1.6666665459E-1f;
+    p = p * r + 5.0000001201E-1f;
+    p = p * r * r + r + 1.f;
+
+    e = ((int32_t) n + 127) << 23;
+    memcpy(&s, &e, sizeof(s));
+    return p * s;
+}
+
+/*
+sin(x) and cos(x) for single precision.
+*/
+static inline void mixed_sincosf(float x, float *s, float *c){
+    float fq, n, r, r2, ps, pc, swap;
+    int32_t q;
+
+    // x = q * pi / 2 + r, |r| <= pi / 4
+    fq = fmaxf(fminf(x * 0.636619772367581343f, 1e9f), -1e9f);
+    q = (int32_t) (fq + copysignf(0.5f, fq));
+    n = (float) q;
+    r = x - n * 1.5703125f;
+    r = r - n * 4.83751296997070312e-4f;
+    r = r - n * 7.54978995489188216e-8f;
+    r2 = r * r;
+
+    ps = -1.9515295891E-4f;
+    ps = ps * r2 + 8.3321608736E-3f;
+    ps = ps * r2 - 1.6666654611E-1f;
+    ps = ps * r2 * r + r;
+
+    pc = 2.443315711809948E-005f;
+    pc = pc * r2 - 1.388731625493765E-003f;
+    pc = pc * r2 + 4.166664568298827E-002f;
+    pc = pc * r2 * r2 - 0.5f * r2 + 1.f;
+
+    // select the quadrant without branching
+    swap = (float) (q & 1);
+    *s = (ps + swap * (pc - ps)) * (float) (1 - (q & 2));
+    *c = (pc + swap * (ps - pc)) * (float) (1 - ((q + 1) & 2));
+}
+
+/*
+The wavevector in the next layer, kn_next = sqrt(qq2 - sld), and the
+reflectance of the interface between the layers,
+rj = (kn - kn_next) / (kn + kn_next) * exp(-2 * kn * kn_next * sigma**2).
+*/
+static inline void mixed_interface(float knr, float kni, float qq2,
+                                   float sldr, float sldi, float rough_sqr,
+                                   float *kn_nextr, float *kn_nexti,
+                                   float *rjr, float *rji){
+    float zr, zi, t, u, pos, kr, ki, ar, ai, br, bi, inv, fr, fi, mag, s, c;
+
+    // principal branch of the square root, the smaller component is
+    // obtained by division to avoid cancellation in (|z| -/+ Re(z)).
+    zr = qq2 - sldr;
+    zi = -sldi;
+    t = sqrtf(0.5f * (sqrtf(zr * zr + zi * zi) + fabsf(zr)));
+    u = 0.5f * zi / t;
+    pos = zr >= 0.f ? 1.f : 0.f;
+    kr = pos * t + (1.f - pos) * fabsf(u);
+    ki = pos * u + (1.f - pos) * copysignf(t, zi);
+
+    ar = knr - kr;
+    ai = kni - ki;
+    br = knr + kr;
+    bi = kni + ki;
+    inv = 1.f / (br * br + bi * bi);
+    fr = (ar * br + ai * bi) * inv;
+    fi = (ai * br - ar * bi) * inv;
+
+    mag = mixed_expf((knr * kr - kni * ki) * rough_sqr);
+    mixed_sincosf((knr * ki + kni * kr) * rough_sqr, &s, &c);
+
+    *rjr = mag * (fr * c - fi * s);
+    *rji = mag * (fr * s + fi * c);
+    *kn_nextr = kr;
+    *kn_nexti = ki;
+}
+
+
+MIXED_TARGETS
+void AbelesCalc_ImagAll_mixed(int numcoefs,
+                              const double *coefP,
+                              int npoints,
+                              double *yP,
+                              const double *xP){
+    int j, j0, nb, ii;
+    double scale, bkg;
+    float *sldr = NULL;
+    float *sldi = NULL;
+    float *thickness = NULL;
+    float *rough_sqr = NULL;
+
+    // the state of each Q point in a block
+    float qq2[BLOCK], knr[BLOCK], kni[BLOCK];
+    double m00r[BLOCK], m00i[BLOCK], m01r[BLOCK], m01i[BLOCK];
+    double m10r[BLOCK], m10i[BLOCK], m11r[BLOCK], m11i[BLOCK];
+
+    int nlayers = (int) coefP[0];
+
+    sldr = (float *) malloc((nlayers + 2) * sizeof(float));
+    sldi = (float *) malloc((nlayers + 2) * sizeof(float));
+    thickness = (float *) malloc((nlayers + 2) * sizeof(float));
+    rough_sqr = (float *) malloc((nlayers + 2) * sizeof(float));
+    if (!sldr || !sldi || !thickness || !rough_sqr)
+        goto done;
+
+    scale = coefP[1];
+    bkg = coefP[6];
+
+    // the SLD contrasts are calculated in double precision, then rounded.
+    // sld[k] and rough_sqr[k] refer to the layer below interface k.
+    for(ii = 1; ii < nlayers + 1; ii++){
+        sldr[ii - 1] = (float) (4e-6 * PI * (coefP[4 * ii + 5] - coefP[2]));
+        sldi[ii - 1] = (float) (4e-6 * PI * (fabs(coefP[4 * ii + 6]) + TINY));
+        rough_sqr[ii - 1] = (float) (-2 * coefP[4 * ii + 7] * coefP[4 * ii + 7]);
+        thickness[ii] = (float) fabs(coefP[4 * ii + 4]);
+    }
+    sldr[nlayers] = (float) (4e-6 * PI * (coefP[4] - coefP[2]));
+    sldi[nlayers] = (float) (4e-6 * PI * (fabs(coefP[5]) + TINY));
+    rough_sqr[nlayers] = (float) (-2 * coefP[7] * coefP[7]);
+
+    for (j0 = 0; j0 < npoints; j0 += BLOCK){
+        nb = npoints - j0 < BLOCK ? npoints - j0 : BLOCK;
+
+        // characteristic matrix for the first interface
+        for (j = 0; j < nb; j++){
+            float q = (float) xP[j0 + j];
+            float rjr, rji;
+
+            qq2[j] = q * q / 4;
+            mixed_interface(q / 2, 0.f, qq2[j], sldr[0], sldi[0],
+                            rough_sqr[0], &knr[j], &kni[j], &rjr, &rji);
+
+            m00r[j] = 1.;
+            m00i[j] = 0.;
+            m01r[j] = rjr;
+            m01i[j] = rji;
+            m10r[j] = rjr;
+            m10i[j] = rji;
+            m11r[j] = 1.;
+            m11i[j] = 0.;
+        }
+
+        for(ii = 1; ii < nlayers + 1; ii++){
+            float lsldr = sldr[ii];
+            float lsldi = sldi[ii];
+            float lrough_sqr = rough_sqr[ii];
+            float d = thickness[ii];
+
+            for (j = 0; j < nb; j++){
+                float kn_nextr, kn_nexti, rjr, rji, bmag, bsin, bcos;
+                double br, bi, ibr, ibi, a01r, a01i, a10r, a10i;
+                double p00r, p00i, p01r, p01i, p10r, p10i, p11r, p11i;
+
+                mixed_interface(knr[j], kni[j], qq2[j], lsldr, lsldi,
+                                lrough_sqr, &kn_nextr, &kn_nexti, &rjr, &rji);
+
+                // beta = exp(i * kn * d) for the layer
+                bmag = mixed_expf(-kni[j] * d);
+                mixed_sincosf(knr[j] * d, &bsin, &bcos);
+                br = bmag * bcos;
+                bi = bmag * bsin;
+                ibr = bcos / bmag;
+                ibi = -bsin / bmag;
+
+                // the characteristic matrix of the layer is
+                // [[beta, rj * beta], [rj / beta, 1 / beta]], multiply the
+                // total matrix by it in double precision.
+                a01r = rjr * br - rji * bi;
+                a01i = rjr * bi + rji * br;
+                a10r = rjr * ibr - rji * ibi;
+                a10i = rjr * ibi + rji * ibr;
+
+                p00r = m00r[j] * br - m00i[j] * bi + m01r[j] * a10r - m01i[j] * a10i;
+                p00i = m00r[j] * bi + m00i[j] * br + m01r[j] * a10i + m01i[j] * a10r;
+                p01r = m00r[j] * a01r - m00i[j] * a01i + m01r[j] * ibr - m01i[j] * ibi;
+                p01i = m00r[j] * a01i + m00i[j] * a01r + m01r[j] * ibi + m01i[j] * ibr;
+                p10r = m10r[j] * br - m10i[j] * bi + m11r[j] * a10r - m11i[j] * a10i;
+                p10i = m10r[j] * bi + m10i[j] * br + m11r[j] * a10i + m11i[j] * a10r;
+                p11r = m10r[j] * a01r - m10i[j] * a01i + m11r[j] * ibr - m11i[j] * ibi;
+                p11i = m10r[j] * a01i + m10i[j] * a01r + m11r[j] * ibi + m11i[j] * ibr;
+
+                m00r[j] = p00r;
+                m00i[j] = p00i;
+                m01r[j] = p01r;
+                m01i[j] = p01i;
+                m10r[j] = p10r;
+                m10i[j] = p10i;
+                m11r[j] = p11r;
+                m11i[j] = p11i;
+
+                knr[j] = kn_nextr;
+                kni[j] = kn_nexti;
+            }
+        }
+
+        for (j = 0; j < nb; j++){
+            double num = m10r[j] * m10r[j] + m10i[j] * m10i[j];
+            double den = m00r[j] * m00r[j] + m00i[j] * m00i[j];
+            yP[j0 + j] = (num / den) * scale + bkg;
+        }
+    }
+
+    done:
+        if(sldr)
+            free(sldr);
+        if(sldi)
+            free(sldi);
+        if(thickness)
+            free(thickness);
+        if(rough_sqr)
+            free(rough_sqr);
+    }
+
+#ifdef __cplusplus
+    }
+#endif
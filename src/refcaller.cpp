@@ -29,64 +29,289 @@ DEALINGS IN THIS SOFTWARE.
 
 extern "C" {
     #include "refcalc.h"
+    #include "pnrcalc.h"
 }
 
 #include <math.h>
 #include <cmath>
 #include <stdlib.h>
+#include <algorithm>
+#include <condition_variable>
+#include <functional>
+#include <mutex>
 #include <thread>
 #include <vector>
 
+#ifndef _WIN32
+#include <pthread.h>
+#endif
+
 
 #define NUM_CPUS 4
+
+/*
+The smallest amount of work given to a thread, in units of (point * layer)
+matrix multiplications. Waking a thread costs several microseconds, so it's
+not worth parallelising small calculations, they stay single threaded.
+*/
+#define MIN_WORK_PER_THREAD 8192
+
 using namespace std;
 
 
+/*
+A pool of worker threads that lives for the whole process. Creating and
+joining a fresh set of threads for every reflectivity calculation is a
+significant fraction of the calculation time for typical datasets (a few
+hundred points).
+
+The pool is created lazily, the first time a calculation is large enough to
+be spread over several threads. The thread making the calculation also does
+its share of the work.
+*/
+class WorkerPool {
+public:
+    explicit WorkerPool(int nworkers) : task(nullptr), nchunks(0),
+                                        next_chunk(0), pending(0),
+                                        generation(0){
+        for(int ii = 0; ii < nworkers; ii++){
+            workers.emplace_back(&WorkerPool::loop, this);
+        }
+    }
+
+    int size() const{
+        return (int) workers.size();
+    }
+
+    /*
+    Calls task(chunk) for chunk in [0, n), spreading the calls over the
+    workers. Blocks until all the chunks are done.
+    */
+    void run(int n, const std::function<void(int)> &fn){
+        {
+            std::lock_guard<std::mutex> lk(mtx);
+            task = &fn;
+            nchunks = n;
+            next_chunk = 0;
+            pending = n;
+            generation++;
+        }
+        cv_work.notify_all();
+
+        work();
+
+        std::unique_lock<std::mutex> lk(mtx);
+        cv_done.wait(lk, [this]{return pending == 0;});
+        task = nullptr;
+    }
+
+private:
+    // process chunks of the current task until there are none left
+    void work(){
+        while(true){
+            const std::function<void(int)> *fn;
+            int chunk;
+            {
+                std::lock_guard<std::mutex> lk(mtx);
+                if(next_chunk >= nchunks){
+                    return;
+                }
+                fn = task;
+                chunk = next_chunk++;
+            }
+
+            (*fn)(chunk);
+
+            std::lock_guard<std::mutex> lk(mtx);
+            if(--pending == 0){
+                cv_done.notify_one();
+            }
+        }
+    }
+
+    void loop(){
+        unsigned long seen = 0;
+        while(true){
+            {
+                std::unique_lock<std::mutex> lk(mtx);
+                cv_work.wait(lk, [&]{return generation != seen;});
+                seen = generation;
+            }
+            work();
+        }
+    }
+
+    std::vector<std::thread> workers;
+    std::mutex mtx;
+    std::condition_variable cv_work;
+    std::condition_variable cv_done;
+    const std::function<void(int)> *task;
+    int nchunks;
+    int next_chunk;
+    int pending;
+    unsigned long generation;
+};
+
+
+/*
+The pool is never destroyed, the workers wait for work until the process
+exits. pool_mutex guards creation and use of the pool, only one calculation
+can use the pool at a time.
+*/
+static WorkerPool *pool = nullptr;
+static std::mutex pool_mutex;
+
+
+#ifndef _WIN32
+/*
+Fork safety. Only the forking thread exists in a child process, so the
+workers of the parent's pool are gone. The pool_mutex is held during the
+fork, so the pool isn't in use. The child forgets the (leaked) pool and
+creates its own when it's needed.
+*/
+static void atfork_prepare(){
+    pool_mutex.lock();
+}
+
+static void atfork_parent(){
+    pool_mutex.unlock();
+}
+
+static void atfork_child(){
+    pool = nullptr;
+    pool_mutex.unlock();
+}
+#endif
+
+
+static WorkerPool *get_pool(){
+    // should be called with pool_mutex held
+    if(pool == nullptr){
+#ifndef _WIN32
+        static std::once_flag atfork_flag;
+        std::call_once(atfork_flag, []{
+            pthread_atfork(atfork_prepare, atfork_parent, atfork_child);
+        });
+#endif
+        int ncpus = (int) std::thread::hardware_concurrency();
+        if(ncpus < 1){
+            ncpus = NUM_CPUS;
+        }
+        // the calling thread also does work
+        pool = new WorkerPool(std::max(ncpus - 1, 1));
+    }
+    return pool;
+}
+
+
+/*
+Calls fn(start, end) over contiguous ranges that cover [0, total), using up
+to `workers` threads. `cost` is the amount of work for each of the items.
+*/
+static void parallel_for(long total,
+                         long cost,
+                         int workers,
+                         const std::function<void(long, long)> &fn){
+    long nchunks = std::min((long) workers,
+                            total * cost / MIN_WORK_PER_THREAD);
+    nchunks = std::min(nchunks, total);
+
+    if(nchunks < 2){
+        fn(0, total);
+        return;
+    }
+
+    // if another thread is using the pool then calculate in this thread
+    std::unique_lock<std::mutex> lk(pool_mutex, std::try_to_lock);
+    if(!lk.owns_lock()){
+        fn(0, total);
+        return;
+    }
+
+    long each = total / nchunks;
+    get_pool()->run((int) nchunks, [&](int chunk){
+        long start = chunk * each;
+        long end = (chunk == nchunks - 1) ? total : start + each;
+        fn(start, end);
+    });
+}
+
+
+/*
+The signature of the functions that calculate the reflectivity of a single
+structure, AbelesCalc_ImagAll and AbelesCalc_ImagAll_mixed.
+*/
+typedef void (*abeles_kernel)(int, const double *, int, double *,
+                              const double *);
+
+
 void AbelesCalc_Imag(int numcoefs,
                   const double *coefP,
                    int npoints,
                     double *yP,
                      const double *xP,
                       int workers){
+    long nlayers = (long) coefP[0];
 
-    std::vector<std::thread> threads;
+    parallel_for(npoints, nlayers + 1, workers, [&](long start, long end){
+        AbelesCalc_ImagAll(numcoefs,
+                           coefP,
+                           (int) (end - start),
+                           yP + start,
+                           xP + start);
+    });
+}
 
-    int pointsEachThread, pointsRemaining, pointsConsumed;
 
-    // need to calculated how many points are given to each thread.
-    if(workers > 0){
-        pointsEachThread = floorl(npoints / workers);
-    } else {
-        pointsEachThread = npoints;
-    }
+/*
+Calculates the reflectivity for the flattened (structure, point) indices
+[start, end) of a batch of structures. All structures share the same Q points
+and have the same number of coefficients.
+*/
+void AbelesCalc_BatchRange(int numcoefs,
+                           const double *coefP,
+                           int npoints,
+                           double *yP,
+                           const double *xP,
+                           long start,
+                           long end,
+                           abeles_kernel kernel){
+    long idx = start;
+
+    while(idx < end){
+        long structure = idx / npoints;
+        long point = idx % npoints;
+        long todo = npoints - point;
 
-    pointsRemaining = npoints;
-    pointsConsumed = 0;
-
-    for (int ii = 0; ii < workers; ii++){
-        if(ii < workers - 1){
-            threads.emplace_back(std::thread(AbelesCalc_ImagAll,
-                                             numcoefs,
-                                             coefP,
-                                             pointsEachThread,
-                                             yP + pointsConsumed,
-                                             xP + pointsConsumed));
-            pointsRemaining -= pointsEachThread;
-            pointsConsumed += pointsEachThread;
-        } else {
-            threads.emplace_back(std::thread(AbelesCalc_ImagAll,
-                                             numcoefs,
-                                             coefP,
-                                             pointsRemaining,
-                                             yP + pointsConsumed,
-                                             xP + pointsConsumed));
-            pointsRemaining -= pointsRemaining;
-            pointsConsumed += pointsRemaining;
+        if(idx + todo > end){
+            todo = end - idx;
         }
+
+        kernel(numcoefs,
+               coefP + structure * numcoefs,
+               (int) todo,
+               yP + idx,
+               xP + point);
+        idx += todo;
     }
+}
+
+
+void AbelesCalc_Batch(int nstructures,
+                      int numcoefs,
+                      const double *coefP,
+                      int npoints,
+                      double *yP,
+                      const double *xP,
+                      int workers,
+                      abeles_kernel kernel){
+    long total = (long) nstructures * npoints;
+    long nlayers = (long) coefP[0];
 
-    // synchronise threads
-    for (auto& th : threads) th.join();
+    parallel_for(total, nlayers + 1, workers, [&](long start, long end){
+        AbelesCalc_BatchRange(numcoefs, coefP, npoints, yP, xP, start, end,
+                              kernel);
+    });
 }
 
 
@@ -116,3 +341,107 @@ void reflect(int numcoefs,
             const double *xP){
     AbelesCalc_ImagAll(numcoefs, coefP, npoints, yP, xP);
 }
+
+/*
+Batched version, the work for all the structures is spread over the threads.
+*/
+void reflect_batch(int nstructures,
+                   int numcoefs,
+                   const double *coefP,
+                   int npoints,
+                   double *yP,
+                   const double *xP,
+                   int threads){
+    if(threads > 1){
+        AbelesCalc_Batch(nstructures, numcoefs, coefP, npoints, yP, xP,
+                         threads, AbelesCalc_ImagAll);
+    } else {
+        AbelesCalc_BatchRange(numcoefs, coefP, npoints, yP, xP, 0,
+                              (long) nstructures * npoints,
+                              AbelesCalc_ImagAll);
+    }
+}
+
+/*
+Mixed precision batched version.
+*/
+void reflect_batch_mixed(int nstructures,
+                         int numcoefs,
+                         const double *coefP,
+                         int npoints,
+                         double *yP,
+                         const double *xP,
+                         int threads){
+    if(threads > 1){
+        AbelesCalc_Batch(nstructures, numcoefs, coefP, npoints, yP, xP,
+                         threads, AbelesCalc_ImagAll_mixed);
+    } else {
+        AbelesCalc_BatchRange(numcoefs, coefP, npoints, yP, xP, 0,
+                              (long) nstructures * npoints,
+                              AbelesCalc_ImagAll_mixed);
+    }
+}
+
+
+/*
+Calculates the polarised neutron reflectivity for the flattened (structure,
+point) indices [start, end) of a batch of structures. The output has shape
+(4, nstructures, npoints).
+*/
+void PNRCalc_BatchRange(int nlayers,
+                        const double *layers,
+                        long nstructures,
+                        int npoints,
+                        double *yP,
+                        const double *xP,
+                        long start,
+                        long end){
+    long idx = start;
+    long nrows = nlayers + 2;
+    long stride = nstructures * npoints;
+
+    while(idx < end){
+        long structure = idx / npoints;
+        long point = idx % npoints;
+        long todo = npoints - point;
+
+        if(idx + todo > end){
+            todo = end - idx;
+        }
+
+        PNRCalc_All(nlayers,
+                    layers + structure * nrows * 5,
+                    (int) todo,
+                    yP + idx,
+                    stride,
+                    xP + point);
+        idx += todo;
+    }
+}
+
+
+/*
+Batched polarised neutron reflectivity, the work for all the structures is
+spread over the threads.
+*/
+void pnr_batch(int nstructures,
+               int nlayers,
+               const double *layers,
+               int npoints,
+               double *yP,
+               const double *xP,
+               int threads){
+    long total = (long) nstructures * npoints;
+
+    if(threads > 1){
+        // a 4x4 matrix calculation is ~8 times the work of a 2x2 one
+        parallel_for(total, 8 * (nlayers + 1), threads,
+                     [&](long start, long end){
+            PNRCalc_BatchRange(nlayers, layers, nstructures, npoints, yP, xP,
+                               start, end);
+        });
+    } else {
+        PNRCalc_BatchRange(nlayers, layers, nstructures, npoints, yP, xP, 0,
+                           total);
+    }
+}
@@ -50,7 +50,10 @@ DEALINGS IN THIS SOFTWARE.
     xP - array containing the Q (momentum transfer) points. It has units Å**-1.
     The array is npoints long
 
-    threads - specifies the number of parallel threads to use.
+    threads - specifies the maximum number of parallel threads to use. The
+    threads come from a persistent pool that is created on first use. Small
+    calculations are not worth spreading over threads, they are done in the
+    calling thread.
 
 
     Detailed description of the entries in coefP
@@ -95,3 +98,51 @@ Non parallelised
 */
 void reflect(int numcoefs, const double *coefP, int npoints, double *yP,
              const double *xP);
+
+/*
+Batched calculation for many structures that share the same Q points.
+
+    nstructures - the number of structures held in coefP
+
+    numcoefs - the number of parameters for each of the structures.
+
+    coefP - array of shape (nstructures, numcoefs) holding the parameters for
+    each of the structures. The layout for each row is the same as for
+    `reflect`.
+
+    yP - this user supplied array is filled by the reflect_batch function. It
+    must be nstructures * npoints long, and has shape (nstructures, npoints).
+
+    threads - specifies the number of parallel threads to use.
+*/
+void reflect_batch(int nstructures, int numcoefs, const double *coefP,
+                   int npoints, double *yP, const double *xP, int threads);
+
+/*
+Mixed precision version of reflect_batch, with the same parameters. The
+calculations for each layer are done in single precision, the matrix product
+is accumulated in double precision.
+*/
+void reflect_batch_mixed(int nstructures, int numcoefs, const double *coefP,
+                         int npoints, double *yP, const double *xP,
+                         int threads);
+
+/*
+Polarised neutron reflectivity for a batch of structures that share the same
+Q points.
+
+    nstructures - the number of structures held in layers
+
+    nlayers - the number of layers, N, in each of the structures
+
+    layers - array of shape (nstructures, N + 2, 5) holding the layer
+    parameters for each of the structures. See pnrcalc.h for details.
+
+    yP - this user supplied array is filled by the pnr_batch function. It has
+    shape (4, nstructures, npoints), holding the (PP, MM, PM, MP) spin
+    channels.
+
+    threads - specifies the number of parallel threads to use.
+*/
+void pnr_batch(int nstructures, int nlayers, const double *layers,
+               int npoints, double *yP, const double *xP, int threads);